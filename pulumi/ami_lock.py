@@ -0,0 +1,195 @@
+from pulumi import Output, get_stack
+import pulumi
+import pulumi_aws as aws
+import invokes
+import argparse
+import datetime
+import json
+import os
+
+LOCKFILE = "Pulumi.{stack}.ami.lock.json"
+
+# Catalog of golden AMIs with pre-installed Airflow server, shared by stacks
+CATALOG = "ami_catalog.json"
+# What manifest of a golden AMI must describe
+MANIFEST_KEYS = ("contains", "user", "airflow_home", "dags_repo_dir", "services")
+
+AMAZON_LINUX2 = {
+    "owners": ["amazon"],
+    "filters": [
+        {
+            "name": "owner-alias",
+            "values": ["amazon"],
+        },
+        {
+            "name": "name",
+            "values": ["amzn2-ami-hvm*"],
+        },
+    ],
+    "most_recent": True,
+}
+
+
+def lockfile_path(stack):
+    """This function returns path to the AMI lockfile of the stack,
+       which is stored next to Pulumi.<stack>.yaml"""
+
+    return LOCKFILE.format(stack=stack)
+
+
+def read_lock(stack):
+    if not os.path.exists(lockfile_path(stack)):
+        return {}
+    with open(lockfile_path(stack)) as f:
+        return json.load(f)
+
+
+def write_lock(stack, lock):
+    """This function replaces the lockfile atomically, so a failed
+       write never leaves a partial lockfile"""
+
+    path = lockfile_path(stack)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(lock, f, indent=2, sort_keys=True)
+        f.write("\n")
+    os.replace(tmp_path, path)
+
+
+def _lock_entry(ami):
+    return {
+        "id": ami["id"],
+        "name": ami.get("name"),
+        "resolved_at": datetime.datetime.utcnow().isoformat(timespec="seconds"),
+    }
+
+
+def _pin(stack, region, ami):
+    # Preview is read-only, it uses the looked up AMI without pinning it
+    if not pulumi.runtime.is_dry_run():
+        lock = read_lock(stack)
+        lock[region] = _lock_entry(ami)
+        write_lock(stack, lock)
+    return ami["id"]
+
+
+def resolve_latest(region):
+    """This function looks up the latest Amazon Linux 2 AMI of the
+       region with boto3, without the Pulumi engine"""
+
+    import boto3
+    images = boto3.client("ec2", region_name=region).describe_images(
+        Owners=AMAZON_LINUX2["owners"],
+        Filters=[
+            {"Name": item["name"], "Values": item["values"]}
+            for item in AMAZON_LINUX2["filters"]
+        ],
+    )["Images"]
+    if not images:
+        raise SystemExit(f"Error: no Amazon Linux 2 AMI in {region}")
+    latest = max(images, key=lambda image: image["CreationDate"])
+    return {"id": latest["ImageId"], "name": latest["Name"]}
+
+
+def _lookup_latest():
+    return invokes.account_invoke(
+        "aws:ec2/getAmi:getAmi",
+        aws.ec2.get_ami,
+        AMAZON_LINUX2,
+        ["id", "name"],
+        ttl=0,
+    )
+
+
+def is_pinned(region):
+    return region in read_lock(get_stack())
+
+
+def get_ami_id(region):
+    """This function returns id of Amazon Linux 2 AMI for the region.
+       AMI pinned in the lockfile is used as is, without any lookup,
+       so a new AMI release doesn't replace EC2 instance. The latest
+       AMI is looked up only if there is no pinned AMI for the region,
+       it is pinned by seed_lock after the instance is created"""
+
+    pinned = read_lock(get_stack()).get(region)
+    if pinned:
+        return Output.from_input(pinned["id"])
+    return _lookup_latest().apply(lambda ami: ami["id"])
+
+
+def seed_lock(region, instance_ami):
+    """This function pins AMI which EC2 instance actually runs, when
+       there is no pinned AMI for the region. Instance of a stack
+       deployed before the lockfile keeps its AMI (EC2 ignores changes
+       of `ami` until it is pinned), so that AMI is pinned instead of
+       the latest one. Only `pulumi up` pins it (preview doesn't write)"""
+
+    stack = get_stack()
+    return Output.all(_lookup_latest(), instance_ami).apply(
+        lambda arg: _pin(
+            stack,
+            region,
+            # Name is known only for the looked up AMI
+            arg[0] if arg[0]["id"] == arg[1] else {"id": arg[1]},
+        )
+    )
+
+
+def catalog_entry(name, region):
+    """This function returns entry of the golden AMI catalog for the
+       region: `id` of the image and `manifest` of what it contains"""
+
+    if not os.path.exists(CATALOG):
+        raise SystemExit(f"Error: golden AMI {name} is set, but {CATALOG} doesn't exist")
+    with open(CATALOG) as f:
+        catalog = json.load(f)
+    if name not in catalog:
+        raise SystemExit(f"Error: golden AMI {name} is not in {CATALOG}")
+    entry = catalog[name]
+    if region not in entry["images"]:
+        raise SystemExit(f"Error: golden AMI {name} is not built for {region}")
+    missing = [key for key in MANIFEST_KEYS if key not in entry["manifest"]]
+    if missing:
+        raise SystemExit(f"Error: manifest of golden AMI {name} "
+                         f"doesn't have {', '.join(missing)}")
+    return {
+        "id": entry["images"][region],
+        "manifest": {"name": name, **entry["manifest"]},
+    }
+
+
+def main():
+    """Refresh AMIs command. It looks up the latest AMIs of the regions
+       and pins them in the lockfile in one write"""
+
+    parser = argparse.ArgumentParser(description="Manage AMI lockfile of a stack")
+    parser.add_argument("command", choices=["show", "refresh"])
+    parser.add_argument("--stack", required=True)
+    parser.add_argument(
+        "--region",
+        action="append",
+        help="region to refresh, all regions are refreshed if not set")
+    options = parser.parse_args()
+
+    lock = read_lock(options.stack)
+    if options.command == "refresh":
+        regions = options.region or list(lock)
+        if not regions:
+            parser.error("the lockfile is empty, set --region")
+        # All regions are resolved before the lockfile is written
+        refreshed = {region: resolve_latest(region) for region in regions}
+        for region, ami in refreshed.items():
+            old = lock.get(region)
+            lock[region] = _lock_entry(ami)
+            print(f"{region}: {old['id'] if old else 'not pinned'} -> "
+                  f"{ami['id']} ({ami['name']})")
+        write_lock(options.stack, lock)
+    else:
+        for region, ami in sorted(lock.items()):
+            print(f"{region}: {ami['id']} ({ami['name'] or 'name unknown'}), "
+                  f"resolved at {ami['resolved_at']}")
+
+
+if __name__ == "__main__":
+    main()
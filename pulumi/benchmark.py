@@ -0,0 +1,614 @@
+import argparse
+import functools
+import json
+import logging
+import os
+import runpy
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import yaml
+import pulumi
+from pulumi import Output
+
+ACCOUNT_ID = "123456789012"
+NAME_SUFFIX = "abcd1234"
+PROJECT_NAME = "benchmark-project"
+
+# Regression thresholds, relative increase of the metric over the baseline
+THRESHOLDS = {
+    "wall_time": 0.25,
+    "peak_memory": 0.25,
+    "resources": 0,
+    "applies": 0,
+}
+
+CALL_RESULTS = {
+    "aws:index/getCallerIdentity:getCallerIdentity": {
+        "accountId": ACCOUNT_ID,
+        "arn": f"arn:aws:iam::{ACCOUNT_ID}:user/benchmark",
+        "userId": "AIDABENCHMARK",
+    },
+    "aws:ec2/getAmi:getAmi": {
+        "id": "ami-0123456789abcdef0",
+        "name": "amzn2-ami-hvm-2.0.20210326.0-x86_64-gp2",
+    },
+    "aws:iam/getPolicyDocument:getPolicyDocument": {
+        "json": json.dumps({"Version": "2012-10-17", "Statement": []}),
+    },
+}
+
+# Files which cases are built from, but which are not in this tree,
+# cases without them are skipped
+CASE_FILES = {
+    "Vpc": ("vpc.py",),
+    "SecurityGroups": ("security_groups.py",),
+    "ApiGateway": ("api_gateway.py",),
+    "Ec2": ("bootstrap.tpl",),
+    "program": ("vpc.py", "security_groups.py", "api_gateway.py", "bootstrap.tpl"),
+}
+
+GOLDEN_AMI = {
+    "id": "ami-0fedcba9876543210",
+    "manifest": {
+        "name": "airflow-benchmark",
+        "contains": ["python3", "airflow", "postgresql-client"],
+        "user": "ec2-user",
+        "airflow_home": "/home/ec2-user/airflow",
+        "dags_repo_dir": "/home/ec2-user/airflow/dags",
+        "services": ["airflow-webserver", "airflow-scheduler"],
+    },
+}
+
+
+class BenchmarkMocks(pulumi.runtime.Mocks):
+    """Create class BenchmarkMocks, which replaces Pulumi engine and
+       providers, so that components are built fully offline.
+       It counts registered resources and provider invokes"""
+
+    def __init__(self):
+        self.resources = 0
+        self.invokes = 0
+
+    def call(self, token, args, provider):
+        self.invokes += 1
+        return CALL_RESULTS.get(token, {})
+
+    def new_resource(self, type_, name, inputs, provider, id_):
+        self.resources += 1
+        outputs = dict(inputs)
+        outputs.setdefault("arn", f"arn:aws:mock::{ACCOUNT_ID}:{name}")
+        outputs.setdefault("name", name)
+        outputs.setdefault("address", f"{name}.mock.rds.amazonaws.com")
+        outputs.setdefault("invokeArn", f"arn:aws:apigateway:mock:lambda:{name}")
+        outputs.setdefault("result", "mock-random-result")
+        outputs.setdefault("privateKeyPem", "mock-private-key")
+        outputs.setdefault("publicKeyOpenssh", "ssh-rsa mock")
+        if type_ == "aws:elasticache/cluster:Cluster":
+            outputs.setdefault("cacheNodes", [{"address": f"{name}.mock.cache.amazonaws.com"}])
+        if type_ == "aws:rds/instance:Instance":
+            outputs.setdefault("resourceId", f"db-{name.upper()}")
+        if type_ == "aws:lambda/function:Function":
+            outputs.setdefault("version", "1")
+        if type_ == "aws:ecr/repository:Repository":
+            outputs.setdefault("repositoryUrl", f"{ACCOUNT_ID}.dkr.ecr.mock.amazonaws.com/{name}")
+        if type_ == "aws:ec2/launchTemplate:LaunchTemplate":
+            outputs.setdefault("latestVersion", 1)
+        return f"{name}-id", outputs
+
+
+def _out(value):
+    return Output.from_input(value)
+
+
+def _vpc(data):
+    import vpc
+    return vpc.Vpc(
+        "vpc",
+        vpc.VpcArgs(
+            region=data["region"],
+            flow_log_cloudwatch_log_group_name_prefix=data[
+                "flow_log_cloudwatch_log_group_name_prefix"
+            ],
+            flow_log_destination_type=data["flow_log_destination_type"],
+            flow_log_max_aggregation_interval=data[
+                "flow_log_max_aggregation_interval"
+            ],
+            flow_log_traffic_type=data["flow_log_traffic_type"],
+            flow_log_log_format=data["flow_log_log_format"],
+            flow_log_cloudwatch_log_group_retention_in_days=data[
+                "flow_log_cloudwatch_log_group_retention_in_days"
+            ],
+            flow_log_cloudwatch_log_group_kms_key_id=data[
+                "flow_log_cloudwatch_log_group_kms_key_id"
+            ],
+            create_db_subnets=data["create_db_subnets"],
+            enable_dns_support=data["enable_dns_support"],
+            enable_dns_hostnames=data["enable_dns_hostnames"],
+            vpc_cidr_block=data["vpc_cidr_block"],
+            public_subnets_cidr=data["public_subnets_cidr"],
+            db_subnets_cidr=data["db_subnets_cidr"],
+            name_suffix=_out(NAME_SUFFIX),
+        ),
+    )
+
+
+def _security_groups(data):
+    import security_groups
+    return security_groups.SecurityGroups(
+        "security_groups",
+        security_groups.SecurityGroupsArgs(
+            region=data["region"],
+            billing_code=data["billing_code"],
+            project_name_underscores=data["project_name_underscores"],
+            vpc_id=_out("vpc-mock"),
+            ingress_ec2_rule_ports=data["ingress_ec2_rule_ports"],
+            egress_ec2_rule_ports=data["egress_ec2_rule_ports"],
+            rule_cidr_blocks=data["rule_cidr_blocks"],
+        ),
+    )
+
+
+def _iam(data):
+    import iam
+    return iam.Iam(
+        "iam",
+        iam.IamArgs(
+            region=data["region"],
+            aws_account_id=_out(ACCOUNT_ID),
+            project_name_underscores=data["project_name_underscores"],
+            name_suffix=_out(NAME_SUFFIX),
+        ),
+    )
+
+
+def _rds(data, **overrides):
+    import rds
+    return rds.Rds(
+        "rds",
+        rds.RdsArgs(
+            region=data["region"],
+            billing_code=data["billing_code"],
+            project_name=data["project_name"],
+            project_name_underscores=data["project_name_underscores"],
+            db_instance_type=overrides.pop("db_instance_type", data["db_instance_type"]),
+            db_subnet_group_name=_out("db-subnet-group-mock"),
+            db_security_group_id=_out("sg-db-mock"),
+            db_username=data["db_username"],
+            name_suffix=_out(NAME_SUFFIX),
+            **overrides,
+        ),
+    )
+
+
+def _rds_proxy(data):
+    import rds_proxy
+    return rds_proxy.RdsProxy(
+        "rds_proxy",
+        rds_proxy.RdsProxyArgs(
+            billing_code=data["billing_code"],
+            project_name=data["project_name"],
+            project_name_underscores=data["project_name_underscores"],
+            name_suffix=_out(NAME_SUFFIX),
+            db_instance_identifier=_out(f"{PROJECT_NAME}-{NAME_SUFFIX}"),
+            db_subnet_ids=_out(["subnet-db-a-mock", "subnet-db-b-mock"]),
+            db_security_group_id=_out("sg-db-mock"),
+            db_credentials_secret_arn=_out("arn:aws:secretsmanager:mock:credentials"),
+        ),
+    )
+
+
+def _cache(data):
+    import cache
+    return cache.Cache(
+        "cache",
+        cache.CacheArgs(
+            billing_code=data["billing_code"],
+            project_name_underscores=data["project_name_underscores"],
+            name_suffix=_out(NAME_SUFFIX),
+            vpc_id=_out("vpc-mock"),
+            db_subnet_ids=_out(["subnet-db-a-mock", "subnet-db-b-mock"]),
+            ec2_security_group_id=_out("sg-ec2-mock"),
+            replica_count=1,
+        ),
+    )
+
+
+def _db_secrets_manager(data):
+    import secrets_manager
+    return secrets_manager.DBSecretsManager(
+        "db_secrets_manager",
+        secrets_manager.DBSecretsManagerArgs(
+            billing_code=data["billing_code"],
+            project_name=data["project_name"],
+            db_username=data["db_username"],
+            db_password_result=_out("mock-db-password"),
+            address=_out("db.mock.rds.amazonaws.com"),
+            credentials=True,
+        ),
+    )
+
+
+def _secrets_manager(data):
+    import secrets_manager
+    return secrets_manager.SecretsManager(
+        "secrets_manager",
+        secrets_manager.SecretsManagerArgs(
+            billing_code=data["billing_code"],
+            project_name=data["project_name"],
+            project_name_underscores=data["project_name_underscores"],
+            airflow_pass_result=_out("mock-airflow-password"),
+            airflow_bucket_name=_out("airflow-logs-mock"),
+            datalake_bucket_name=_out("datalake-mock"),
+        ),
+    )
+
+
+def _lambda(data, **overrides):
+    import lambda_functions
+    return lambda_functions.Lambda(
+        "lambda",
+        lambda_functions.LambdaArgs(
+            billing_code=data["billing_code"],
+            ec2_security_group_id=_out("sg-ec2-mock"),
+            project_name_underscores=data["project_name_underscores"],
+            db_username_secret_arn=_out("arn:aws:secretsmanager:mock:username"),
+            db_password_secret_arn=_out("arn:aws:secretsmanager:mock:password"),
+            db_address_secret_arn=_out("arn:aws:secretsmanager:mock:address"),
+            lambda_exec_arn=_out("arn:aws:iam::mock:role/lambda"),
+            ec2_subnet_id=_out("subnet-mock"),
+            **overrides,
+        ),
+    )
+
+
+def _api_gateway(data):
+    import api_gateway
+    return api_gateway.ApiGateway(
+        "api_gateway",
+        api_gateway.ApiGatewayArgs(
+            project_name_underscores=data["project_name_underscores"],
+            lambda_get_function_name=_out("getMethodFunction"),
+            lambda_post_function_name=_out("postMethodFunction"),
+            lambda_get_function_invoke_arn=_out("arn:aws:apigateway:mock:get"),
+            lambda_post_function_invoke_arn=_out("arn:aws:apigateway:mock:post"),
+        ),
+    )
+
+
+def _ec2(data, **overrides):
+    import ec2
+    return ec2.Ec2(
+        "ec2",
+        ec2.Ec2Args(
+            region=data["region"],
+            billing_code=data["billing_code"],
+            project_name_underscores=data["project_name_underscores"],
+            vpc_id=_out("vpc-mock"),
+            aws_account_id=_out(ACCOUNT_ID),
+            repo_deploy_key=data["repo_deploy_key"],
+            ec2_instance_type=data["ec2_instance_type"],
+            ec2_security_group_id=_out("sg-ec2-mock"),
+            ec2_role_name=_out("ec2-role-mock"),
+            ec2_subnet_id=_out("subnet-mock"),
+            iam_instance_profile_name=_out("instance-profile-mock"),
+            default_rest_api_id=_out("restapimock"),
+            **overrides,
+        ),
+    )
+
+
+def _workers(data):
+    import workers
+    return workers.Workers(
+        "workers",
+        workers.WorkersArgs(
+            region=data["region"],
+            billing_code=data["billing_code"],
+            project_name_underscores=data["project_name_underscores"],
+            name_suffix=_out(NAME_SUFFIX),
+            vpc_id=_out("vpc-mock"),
+            ec2_subnet_id=_out("subnet-mock"),
+            broker_subnet_ids=_out(["subnet-db-a-mock", "subnet-db-b-mock"]),
+            ec2_security_group_id=_out("sg-ec2-mock"),
+            db_address=_out("db.mock.rds.amazonaws.com"),
+            db_username=data["db_username"],
+            db_password_secret_arn=_out("arn:aws:secretsmanager:mock:password"),
+            worker_count=2,
+            worker_max_count=6,
+            worker_instance_type=data["ec2_instance_type"],
+            repo_deploy_key=data["repo_deploy_key"],
+            golden_ami=GOLDEN_AMI,
+        ),
+    )
+
+
+def _ecs(data):
+    import ecs
+    return ecs.Ecs(
+        "ecs",
+        ecs.EcsArgs(
+            region=data["region"],
+            billing_code=data["billing_code"],
+            project_name_underscores=data["project_name_underscores"],
+            ec2_subnet_id=_out("subnet-mock"),
+            ec2_security_group_id=_out("sg-ec2-mock"),
+            ec2_role_name=_out("ec2-role-mock"),
+            tasks={
+                "extract": {"cpu": 512, "memory": 1024},
+                "transform": {"cpu": 2048, "memory": 8192,
+                              "environment": {"CHUNK_SIZE": 10000}},
+            },
+        ),
+    )
+
+
+def _vpc_endpoints(data):
+    import vpc_endpoints
+    return vpc_endpoints.VpcEndpoints(
+        "vpc_endpoints",
+        vpc_endpoints.VpcEndpointsArgs(
+            region=data["region"],
+            project_name=data["project_name"],
+            vpc_id=_out("vpc-mock"),
+            ec2_security_group_id=_out("sg-ec2-mock"),
+            ec2_instance_subnet_id=_out("subnet-mock"),
+            aws_public_route_table_id=_out("rtb-mock"),
+            logs_endpoint=True,
+        ),
+    )
+
+
+def _s3(data):
+    import s3
+    return s3.S3(
+        "airflow_logs_bucket",
+        s3.S3Args(
+            billing_code=data["billing_code"],
+            project_name=data["project_name_underscores"],
+            admin_list=["pulumi-github"],
+            vpc_endpoint_id=_out("vpce-mock"),
+            ec2_role_arn=_out("arn:aws:iam::mock:role/ec2"),
+            bucket_name="airflow-logs",
+            name_suffix=_out(NAME_SUFFIX),
+        ),
+    )
+
+
+def _program(data):
+    runpy.run_path("__main__.py", run_name="__main__")
+
+
+# Variants of cases: the case builds the component with these
+# arguments instead of its defaults
+VARIANTS = {
+    "RdsMonitoring": ("Rds", {
+        "db_instance_type": "db.m5.large",
+        "performance_insights": True,
+        "monitoring_interval": 60,
+        "monitoring_role_arn": f"arn:aws:iam::{ACCOUNT_ID}:role/rds-monitoring",
+    }),
+    "RdsAurora": ("Rds", {
+        "read_replica_count": 1,
+        "engine_mode": "aurora-serverless-v2",
+        "serverless_capacity": {"min_capacity": 0.5, "max_capacity": 16},
+    }),
+    "LambdaProvisioned": ("Lambda", {
+        "provisioned_concurrency": {"get": 5, "post": 1},
+        "provisioned_concurrency_schedule": {"get": [
+            {"name": "day", "schedule": "cron(0 7 * * ? *)",
+             "min_capacity": 20, "max_capacity": 20},
+            {"name": "night", "schedule": "cron(0 19 * * ? *)",
+             "min_capacity": 5, "max_capacity": 5},
+        ]},
+    }),
+    "Ec2Golden": ("Ec2", {
+        "golden_ami": GOLDEN_AMI,
+    }),
+}
+
+CASES = {
+    "Vpc": _vpc,
+    "SecurityGroups": _security_groups,
+    "Iam": _iam,
+    "Rds": _rds,
+    "RdsProxy": _rds_proxy,
+    "Cache": _cache,
+    "DBSecretsManager": _db_secrets_manager,
+    "SecretsManager": _secrets_manager,
+    "Lambda": _lambda,
+    "ApiGateway": _api_gateway,
+    "Ec2": _ec2,
+    "Workers": _workers,
+    "Ecs": _ecs,
+    "VpcEndpoints": _vpc_endpoints,
+    "S3": _s3,
+    "program": _program,
+}
+for variant, (case, overrides) in VARIANTS.items():
+    CASES[variant] = functools.partial(CASES[case], **overrides)
+
+
+def load_data(stack):
+    """This function returns `project:data` config of the stack,
+       with values the program expects but stack config may omit"""
+
+    with open(f"Pulumi.{stack}.yaml") as f:
+        data = dict(yaml.safe_load(f)["config"]["project:data"])
+    data.setdefault("project_name", PROJECT_NAME)
+    data["project_name_underscores"] = data["project_name"].replace("-", "_")
+    return data
+
+
+class _ApplyCounter:
+    """Create class _ApplyCounter, which counts Output.apply callbacks
+       of the program (callbacks from Pulumi SDK itself are skipped)"""
+
+    def __init__(self):
+        self.count = 0
+        self.original = Output.apply
+
+    def __enter__(self):
+        counter = self
+
+        def apply(output, func, run_with_unknowns=False):
+            # Builtins, e.g. str.join of Output.concat, have no module
+            module = getattr(func, "__module__", None) or "pulumi"
+            if not module.startswith("pulumi"):
+                wrapped = func
+
+                def func(value):
+                    counter.count += 1
+                    return wrapped(value)
+            return counter.original(output, func, run_with_unknowns)
+
+        Output.apply = apply
+        return self
+
+    def __exit__(self, *exc):
+        Output.apply = self.original
+
+
+def _build_case(name, data, workdir):
+    """This function builds one component (or the whole program) with
+       mocks and returns its metrics. It runs in a process of its own,
+       so the state of Pulumi runtime is never shared by cases"""
+
+    import invokes
+    import ami_lock
+
+    mocks = BenchmarkMocks()
+    pulumi.runtime.set_mocks(mocks, project="project", stack="benchmark", preview=True)
+    pulumi.runtime.config.set_config("project:data", json.dumps(data))
+    pulumi.runtime.config.set_config("aws:region", data["region"])
+    invokes.CACHE_DIR = os.path.join(workdir, name, "invoke_cache")
+    ami_lock.LOCKFILE = os.path.join(workdir, name, "Pulumi.{stack}.ami.lock.json")
+    os.makedirs(os.path.join(workdir, name), exist_ok=True)
+
+    result = {"error": None, "skipped": None}
+    tracemalloc.start()
+    started = time.perf_counter()
+    with _ApplyCounter() as applies:
+        try:
+            pulumi.runtime.test(lambda: CASES[name](data))()
+        except Exception as exn:  # pylint: disable=broad-except
+            result["error"] = f"{type(exn).__name__}: {exn}"
+    result["wall_time"] = time.perf_counter() - started
+    result["peak_memory"] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    result["resources"] = mocks.resources
+    result["invokes"] = mocks.invokes
+    result["applies"] = applies.count
+    return result
+
+
+def run_case(name, stack, workdir):
+    """This function runs one case in a new process and returns its
+       metrics. Invoke cache and AMI lockfile are kept in a fresh
+       temporary folder, so every run is cold. Cases whose files are
+       not in the tree are skipped"""
+
+    missing = [path for path in CASE_FILES.get(name, ()) if not os.path.exists(path)]
+    if missing:
+        return {"error": None, "skipped": f"{', '.join(missing)} not in the tree",
+                "wall_time": 0, "peak_memory": 0, "resources": 0,
+                "invokes": 0, "applies": 0}
+    process = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), name, "--stack", stack,
+         "--case-workdir", workdir],
+        capture_output=True, text=True)
+    if process.returncode:
+        lines = process.stderr.strip().splitlines() or ["no output"]
+        return {"error": f"case process failed: {lines[-1]}", "skipped": None,
+                "wall_time": 0, "peak_memory": 0, "resources": 0,
+                "invokes": 0, "applies": 0}
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def compare(results, baseline):
+    """This function returns list of regressions of results over
+       the baseline, according to THRESHOLDS"""
+
+    regressions = []
+    for name, result in results["cases"].items():
+        base = baseline["cases"].get(name)
+        if (not base or base["error"] or result["error"]
+                or base.get("skipped") or result.get("skipped")):
+            continue
+        for metric, threshold in THRESHOLDS.items():
+            if result[metric] > base[metric] * (1 + threshold):
+                regressions.append(
+                    f"{name}: {metric} {base[metric]:g} -> {result[metric]:g}")
+    return regressions
+
+
+def _commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark program evaluation of the components with mocks")
+    parser.add_argument("cases", nargs="*",
+                        help="cases to run, all cases are run if not set")
+    parser.add_argument("--stack", default="dev", help="stack to take config from")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="runs per case, the fastest run is reported")
+    parser.add_argument("--output", help="save results to JSON file")
+    parser.add_argument("--baseline", help="compare results with JSON file")
+    # Internal, builds one case in the process, see run_case
+    parser.add_argument("--case-workdir", help=argparse.SUPPRESS)
+    options = parser.parse_args()
+    for name in options.cases:
+        if name not in CASES:
+            parser.error(f"unknown case {name}, choose from: {', '.join(CASES)}")
+
+    # Errors of failed cases are reported in the results table
+    logging.getLogger("asyncio").setLevel(logging.CRITICAL)
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, os.getcwd())
+    data = load_data(options.stack)
+    if options.case_workdir:
+        print(json.dumps(_build_case(options.cases[0], data, options.case_workdir)))
+        return
+    results = {"commit": _commit(), "stack": options.stack, "cases": {}}
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # presets.py writes SSH keys into the home folder
+        os.environ["HOME"] = workdir
+        for name in options.cases or CASES:
+            runs = [
+                run_case(name, options.stack, os.path.join(workdir, str(i)))
+                for i in range(options.repeat)
+            ]
+            result = min(runs, key=lambda run: run["wall_time"])
+            results["cases"][name] = result
+            status = (result["error"]
+                      or (result["skipped"] and f"skipped: {result['skipped']}")
+                      or "ok")
+            print(f"{name:18} {result['wall_time'] * 1000:9.1f} ms "
+                  f"{result['resources']:4} resources "
+                  f"{result['applies']:4} applies "
+                  f"{result['invokes']:3} invokes "
+                  f"{result['peak_memory'] / 1024:9.1f} KiB  {status}")
+
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if options.baseline:
+        with open(options.baseline) as f:
+            regressions = compare(results, json.load(f))
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
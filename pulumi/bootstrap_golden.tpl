@@ -0,0 +1,54 @@
+#!/bin/bash
+# Bootstrap of Airflow server from golden AMI {{ manifest.name }}.
+# The AMI already contains: {{ manifest.contains | join(", ") }},
+# only configuration of this deployment is done here
+set -euo pipefail
+
+AIRFLOW_USER={{ manifest.user }}
+AIRFLOW_HOME={{ manifest.airflow_home }}
+REPO_DIR={{ manifest.dags_repo_dir }}
+
+{% if data_volume -%}
+# Data volume is attached after the instance starts
+while [ ! -e {{ data_volume.device_name }} ]; do sleep 5; done
+if ! blkid {{ data_volume.device_name }}; then
+    mkfs -t xfs {{ data_volume.device_name }}
+fi
+mkdir -p {{ data_volume.mount_point }}
+echo "{{ data_volume.device_name }} {{ data_volume.mount_point }} xfs defaults,nofail 0 2" >> /etc/fstab
+mount {{ data_volume.mount_point }}
+chown $AIRFLOW_USER {{ data_volume.mount_point }}
+
+{% endif -%}
+# Deploy key of the DAGs repository
+install -d -m 700 -o $AIRFLOW_USER /home/$AIRFLOW_USER/.ssh
+cat > /home/$AIRFLOW_USER/.ssh/id_rsa <<'EOF'
+{{ deploy_key }}
+EOF
+chmod 600 /home/$AIRFLOW_USER/.ssh/id_rsa
+ssh-keyscan github.com >> /home/$AIRFLOW_USER/.ssh/known_hosts
+chown -R $AIRFLOW_USER /home/$AIRFLOW_USER/.ssh
+
+# Checkout of the DAGs repository
+if [ -d $REPO_DIR/.git ]; then
+    sudo -u $AIRFLOW_USER git -C $REPO_DIR pull --ff-only
+else
+    sudo -u $AIRFLOW_USER git clone git@github.com:project/{{ repo_name }}.git $REPO_DIR
+fi
+
+# Settings of this deployment
+cat > $AIRFLOW_HOME/deployment.env <<'EOF'
+AWS_DEFAULT_REGION={{ region }}
+AWS_ACCOUNT_ID={{ aws_account_id }}
+PROJECT_NAME={{ project_name_underscores }}
+API_ENDPOINT={{ api_endpoint }}
+{% if celery_broker_url -%}
+AIRFLOW__CORE__EXECUTOR=CeleryExecutor
+AIRFLOW__CELERY__BROKER_URL={{ celery_broker_url }}
+{% endif -%}
+EOF
+chown $AIRFLOW_USER $AIRFLOW_HOME/deployment.env
+
+{% for service in manifest.services -%}
+systemctl restart {{ service }}
+{% endfor -%}
@@ -0,0 +1,99 @@
+#!/bin/bash
+# Bootstrap of Airflow Celery worker from golden AMI {{ manifest.name }},
+# the worker takes tasks from the broker and uses RDS database of the
+# project as metadata backend. The AMI already contains: {{ manifest.contains | join(", ") }}
+set -euo pipefail
+
+AIRFLOW_USER={{ manifest.user }}
+AIRFLOW_HOME={{ manifest.airflow_home }}
+REPO_DIR={{ manifest.dags_repo_dir }}
+
+install -d -o $AIRFLOW_USER $AIRFLOW_HOME
+{% if "dags" not in manifest.contains -%}
+# Tasks are run from DAG files, the worker checks out the same
+# DAGs repository as the Airflow server
+install -d -m 700 -o $AIRFLOW_USER /home/$AIRFLOW_USER/.ssh
+cat > /home/$AIRFLOW_USER/.ssh/id_rsa <<'EOF'
+{{ deploy_key }}
+EOF
+chmod 600 /home/$AIRFLOW_USER/.ssh/id_rsa
+ssh-keyscan github.com >> /home/$AIRFLOW_USER/.ssh/known_hosts
+chown -R $AIRFLOW_USER /home/$AIRFLOW_USER/.ssh
+
+if [ -d $REPO_DIR/.git ]; then
+    sudo -u $AIRFLOW_USER git -C $REPO_DIR pull --ff-only
+else
+    sudo -u $AIRFLOW_USER git clone git@github.com:project/{{ repo_name }}.git $REPO_DIR
+fi
+
+{% endif -%}
+DB_PASSWORD=$(aws secretsmanager get-secret-value --region {{ region }} \
+    --secret-id {{ db_password_secret_arn }} --query SecretString --output text)
+
+cat > $AIRFLOW_HOME/worker.env <<EOF
+AIRFLOW_HOME=$AIRFLOW_HOME
+AWS_DEFAULT_REGION={{ region }}
+PROJECT_NAME={{ project_name_underscores }}
+AIRFLOW__CORE__EXECUTOR=CeleryExecutor
+AIRFLOW__CORE__DAGS_FOLDER=$REPO_DIR
+AIRFLOW__CORE__SQL_ALCHEMY_CONN=postgresql+psycopg2://{{ db_username }}:$DB_PASSWORD@{{ db_address }}:5432/{{ db_name }}
+AIRFLOW__CELERY__BROKER_URL={{ broker_url }}
+AIRFLOW__CELERY__RESULT_BACKEND=db+postgresql://{{ db_username }}:$DB_PASSWORD@{{ db_address }}:5432/{{ db_name }}
+AIRFLOW__CELERY__WORKER_CONCURRENCY={{ worker_concurrency }}
+AIRFLOW__CELERY__DEFAULT_QUEUE={{ celery_queue }}
+EOF
+chmod 600 $AIRFLOW_HOME/worker.env
+chown $AIRFLOW_USER $AIRFLOW_HOME/worker.env
+
+cat > /etc/systemd/system/airflow-worker.service <<EOF
+[Unit]
+Description=Airflow Celery worker
+After=network-online.target
+
+[Service]
+User=$AIRFLOW_USER
+EnvironmentFile=$AIRFLOW_HOME/worker.env
+ExecStart=/usr/bin/env airflow celery worker
+Restart=always
+RestartSec=10
+
+[Install]
+WantedBy=multi-user.target
+EOF
+
+# Length of the broker queue is published to CloudWatch every minute,
+# Auto Scaling group of workers scales on it. Python of Airflow
+# has redis client
+AIRFLOW_PYTHON=$(head -1 $(command -v airflow) | sed 's/^#!//')
+cat > /usr/local/bin/airflow-queue-metric <<EOF
+#!/bin/bash
+set -euo pipefail
+QUEUED=\$($AIRFLOW_PYTHON -c 'import redis; print(redis.Redis.from_url("{{ broker_url }}").llen("{{ celery_queue }}"))')
+aws cloudwatch put-metric-data --region {{ region }} \\
+    --namespace {{ queue_metric_namespace }} --metric-name {{ queue_metric_name }} \\
+    --dimensions Project={{ project_name_underscores }} --value \$QUEUED
+EOF
+chmod 755 /usr/local/bin/airflow-queue-metric
+
+cat > /etc/systemd/system/airflow-queue-metric.service <<EOF
+[Unit]
+Description=Publish length of Celery queue to CloudWatch
+
+[Service]
+Type=oneshot
+ExecStart=/usr/local/bin/airflow-queue-metric
+EOF
+
+cat > /etc/systemd/system/airflow-queue-metric.timer <<EOF
+[Unit]
+Description=Publish length of Celery queue every minute
+
+[Timer]
+OnBootSec=1min
+OnUnitActiveSec=1min
+
+[Install]
+WantedBy=timers.target
+EOF
+systemctl daemon-reload
+systemctl enable --now airflow-worker airflow-queue-metric.timer
@@ -0,0 +1,139 @@
+from pulumi import ComponentResource, ResourceOptions, Output
+import pulumi_aws as aws
+
+REDIS_PORT = 6379
+# Limit of ids of ElastiCache replication groups and clusters, names
+# of the cache and the Celery broker of workers.py are built with it
+NAME_LENGTH = 40
+
+
+def resource_name(project_name_underscores, name_suffix, kind):
+    """This function returns name of ElastiCache resources of the stack,
+       e.g. project-1a2b3c4d-cache. Project name is truncated, so that
+       random suffix and kind fit in NAME_LENGTH, as names must end
+       with a letter or digit, hyphen left by truncation is stripped"""
+
+    tail = f"-{name_suffix}-{kind}"
+    project_name = project_name_underscores.replace("_", "-")
+    return f"{project_name[:NAME_LENGTH - len(tail)].rstrip('-')}{tail}"
+
+
+class CacheArgs:
+    """Create class CacheArgs for conveniently passing arguments to the class Cache
+       These arguments are used to create ElastiCache Redis cache
+       of API GET requests:
+       - billing_code - billing code
+       - project_name_underscores - modified project name
+       - name_suffix - random suffix that is added to all unique resources
+       - vpc_id - id of VPC in which you want to allocate cache
+       - db_subnet_ids - ids of DB subnets, cache is placed in them
+       - ec2_security_group_id - id of EC2 security group, lambda
+         functions are in it
+       - node_type - node type of ElastiCache Redis
+       - replica_count - number of replicas, primary fails over
+         to a replica, when there are any"""
+
+    def __init__(
+        self,
+        billing_code,
+        project_name_underscores,
+        name_suffix,
+        vpc_id,
+        db_subnet_ids,
+        ec2_security_group_id,
+        node_type="cache.t3.micro",
+        replica_count=0,
+    ):
+
+        self.billing_code = billing_code
+        self.project_name_underscores = project_name_underscores
+        self.name_suffix = name_suffix
+        self.vpc_id = vpc_id
+        self.db_subnet_ids = db_subnet_ids
+        self.ec2_security_group_id = ec2_security_group_id
+        self.node_type = node_type
+        self.replica_count = replica_count
+
+
+class Cache(ComponentResource):
+    """Create class Cache which extends class ComponentResource"""
+
+    def __init__(self, name: str, args: CacheArgs, opts: ResourceOptions = None):
+        """Create constructor of class Cache
+           This constructor creates ElastiCache Redis replication group
+           in DB subnets with its own security group. GET lambda
+           function reads results of queries from it and puts them
+           there on miss, so repeated reads don't go to the database"""
+        super().__init__("custom:resource:Cache", name, {}, opts)
+        """Override ComponentResource class constructor"""
+
+        tags = {
+            "BillingCode": args.billing_code,
+            "Project": args.project_name_underscores,
+        }
+        cache_name = Output.all(
+            args.project_name_underscores,
+            args.name_suffix
+            ).apply(
+            lambda arg: resource_name(arg[0], arg[1], "cache"))
+
+        self.security_group = aws.ec2.SecurityGroup(
+            "cacheSecurityGroup",
+            description="Access to API cache from lambda functions",
+            vpc_id=args.vpc_id,
+            ingress=[{
+                "protocol": "tcp",
+                "from_port": REDIS_PORT,
+                "to_port": REDIS_PORT,
+                "security_groups": [args.ec2_security_group_id],
+            }],
+            tags={
+                **tags,
+                "Name": f"{args.project_name_underscores}_cache",
+            },
+            opts=ResourceOptions(parent=self),
+        )
+
+        subnet_group = aws.elasticache.SubnetGroup(
+            "cacheSubnetGroup",
+            name=cache_name,
+            subnet_ids=args.db_subnet_ids,
+            opts=ResourceOptions(parent=self),
+        )
+
+        # Every key has TTL, when memory is full the least recently
+        # used keys are evicted, not the ones closest to expiration
+        parameter_group = aws.elasticache.ParameterGroup(
+            "cacheParameterGroup",
+            name=cache_name,
+            family="redis6.x",
+            parameters=[{"name": "maxmemory-policy", "value": "allkeys-lru"}],
+            opts=ResourceOptions(parent=self),
+        )
+
+        self.replication_group = aws.elasticache.ReplicationGroup(
+            "cache",
+            replication_group_id=cache_name,
+            replication_group_description="Cache of API GET requests",
+            engine="redis",
+            engine_version="6.x",
+            parameter_group_name=parameter_group.name,
+            node_type=args.node_type,
+            number_cache_clusters=1 + args.replica_count,
+            automatic_failover_enabled=bool(args.replica_count),
+            multi_az_enabled=bool(args.replica_count),
+            port=REDIS_PORT,
+            subnet_group_name=subnet_group.name,
+            security_group_ids=[self.security_group.id],
+            at_rest_encryption_enabled=True,
+            tags={
+                **tags,
+                "Name": f"{args.project_name_underscores}_cache",
+            },
+            opts=ResourceOptions(parent=self),
+        )
+        self.address = self.replication_group.primary_endpoint_address
+
+        self.register_outputs({
+            "address": self.address,
+        })
@@ -0,0 +1,120 @@
+import argparse
+import json
+import os
+import subprocess
+import yaml
+
+WORK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Output of the stack with identifier of its database,
+# snapshots of the golden stack are looked up by it
+IDENTIFIER_OUTPUT = "db_identifier"
+# rds.AURORA_SERVERLESS_V2, rds is not imported by the command,
+# as it loads pulumi_aws
+AURORA_SERVERLESS_V2 = "aurora-serverless-v2"
+
+
+def snapshot_identifier(snapshot):
+    """This function returns snapshot pinned in `db_snapshot` config,
+       which the database of a new stack is restored from, or None
+       if the database is created empty. Snapshot is never looked up
+       by the program itself, it is pinned by `db_snapshot.py pin`"""
+
+    if not snapshot:
+        return None
+    if not snapshot.get("identifier"):
+        raise SystemExit(
+            "Error: snapshot of db_snapshot config is not pinned, run "
+            "`python db_snapshot.py pin --stack <StackName>`")
+    return snapshot["identifier"]
+
+
+def _load_data(stack):
+    with open(os.path.join(WORK_DIR, f"Pulumi.{stack}.yaml")) as f:
+        return (yaml.safe_load(f).get("config") or {}).get("project:data") or {}
+
+
+def _pulumi(*args):
+    return subprocess.run(
+        ["pulumi", *args], cwd=WORK_DIR, capture_output=True,
+        text=True, check=True).stdout.strip()
+
+
+def find_snapshot(region, cluster, source_stack=None, name=None):
+    """This function returns ARN and creation time of the snapshot:
+       the named one, or the latest automated snapshot of database
+       of the source stack. Snapshots of Aurora clusters are looked up,
+       when cluster is True"""
+
+    import boto3
+    client = boto3.client("rds", region_name=region)
+    kind = "DBClusterSnapshot" if cluster else "DBSnapshot"
+    describe = (client.describe_db_cluster_snapshots if cluster
+                else client.describe_db_snapshots)
+    if name:
+        snapshots = describe(**{f"{kind}Identifier": name})[f"{kind}s"]
+    else:
+        identifier = _pulumi("stack", "output", IDENTIFIER_OUTPUT,
+                             "--stack", source_stack)
+        snapshots = describe(**{
+            "DBClusterIdentifier" if cluster else "DBInstanceIdentifier": identifier,
+            "SnapshotType": "automated",
+        })[f"{kind}s"]
+    snapshots = [
+        snapshot for snapshot in snapshots if snapshot["Status"] == "available"
+    ]
+    if not snapshots:
+        raise SystemExit(
+            f"Error: no available snapshot {name or f'of stack {source_stack}'}")
+    latest = max(snapshots, key=lambda snapshot: snapshot["SnapshotCreateTime"])
+    return {
+        "identifier": latest[f"{kind}Arn"],
+        "created_at": latest["SnapshotCreateTime"].isoformat(timespec="seconds"),
+    }
+
+
+def main():
+    """Pin snapshot command. It looks up the snapshot set in `db_snapshot`
+       config of the stack once and pins it in the same config, so that
+       the database of the stack is restored from it on `pulumi up`"""
+
+    parser = argparse.ArgumentParser(
+        description="Pin snapshot which database of a new stack is restored from")
+    parser.add_argument("command", choices=["show", "pin", "unpin"])
+    parser.add_argument("--stack", required=True)
+    options = parser.parse_args()
+
+    data = _load_data(options.stack)
+    snapshot = data.get("db_snapshot") or {}
+    if options.command == "show":
+        print(json.dumps(snapshot, indent=2, sort_keys=True))
+        return
+    if options.command == "unpin":
+        for key in ("identifier", "created_at"):
+            if key in snapshot:
+                _pulumi("config", "rm", "--path", f"data.db_snapshot.{key}",
+                        "--stack", options.stack)
+        print(f"{options.stack}: unpinned {snapshot.get('identifier')}")
+        return
+
+    if not snapshot.get("stack") and not snapshot.get("name"):
+        raise SystemExit("Error: set `stack` (golden stack) or `name` "
+                         "(named snapshot) in db_snapshot config")
+    if snapshot.get("identifier"):
+        print(f"{options.stack}: {snapshot['identifier']} is already pinned")
+        return
+    found = find_snapshot(
+        data["region"],
+        data.get("db_engine_mode") == AURORA_SERVERLESS_V2,
+        snapshot.get("stack"),
+        snapshot.get("name"),
+    )
+    for key, value in found.items():
+        _pulumi("config", "set", "--path", f"data.db_snapshot.{key}", value,
+                "--stack", options.stack)
+    print(f"{options.stack}: pinned {found['identifier']} "
+          f"(created at {found['created_at']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+import argparse
+import ast
+import json
+
+# Rough time (in minutes) that `pulumi up` spends creating each component,
+# it is used to find the critical path of the program
+ESTIMATED_MINUTES = {
+    "RandomString": 0.1,
+    "Vpc": 1.5,
+    "SecurityGroups": 0.5,
+    "Iam": 0.5,
+    "RdsMonitoringIam": 0.2,
+    "Rds": 10,
+    "RdsProxy": 5,
+    "Cache": 8,
+    "DBSecretsManager": 0.3,
+    "Lambda": 1.5,
+    "ApiGateway": 0.5,
+    "Ec2": 1.5,
+    "Workers": 8,
+    "Ecs": 0.5,
+    "VpcEndpoints": 2,
+    "S3": 0.3,
+    "SecretsManager": 0.3,
+}
+DEFAULT_MINUTES = 0.1
+
+# Explicit edges that are needed even though there is no data flow
+# between components (or the data flow resolves too early)
+REQUIRED_EDGES = {
+    ("lambdas", "iam"): "Lambda in VPC can be created only after "
+                        "AWSLambdaVPCAccessExecutionRole is attached "
+                        "to its role, role ARN is known before that",
+    ("rds", "rds_monitoring_iam"): "RDS checks permissions of Enhanced "
+                                   "Monitoring role, when the instance is "
+                                   "created, role ARN is known before "
+                                   "AmazonRDSEnhancedMonitoringRole "
+                                   "is attached",
+}
+
+
+# Component attributes that resolve without waiting for the component
+# inputs, e.g. Secret ARN is known before its SecretVersion is created
+EARLY_OUTPUTS = {
+    ("DBSecretsManager", "db_username_secret"),
+    ("DBSecretsManager", "db_password_secret"),
+    ("DBSecretsManager", "db_address_secret"),
+    ("DBSecretsManager", "db_reader_address_secret"),
+    ("DBSecretsManager", "db_credentials_secret"),
+    ("DBSecretsManager", "db_cache_address_secret"),
+    ("RdsProxy", "db_proxy_address_secret"),
+}
+
+
+class Node:
+    """Create class Node, which describes one component of the program:
+       - name - name of variable the component is assigned to
+       - kind - class name of the component
+       - resource_name - name of the component resource
+       - data - names of components whose outputs are passed to Args
+       - explicit - names of components from depends_on"""
+
+    def __init__(self, name, kind, resource_name=None):
+        self.name = name
+        self.kind = kind
+        self.resource_name = resource_name
+        self.data = set()
+        self.explicit = set()
+
+
+def _names(node, graph, outputs=None, aliases=None):
+    """This function returns names of all components referenced in
+       the AST node. Reference to an attribute from EARLY_OUTPUTS is
+       returned as `component.attribute` node, which is added to
+       the graph without any dependencies. Reference to an output of
+       a layer, e.g. network["vpc_id"], or to a local variable is
+       resolved to the components its value is taken from"""
+
+    outputs = outputs or {}
+    aliases = aliases or {}
+    if (isinstance(node, ast.Attribute)
+            and isinstance(node.value, ast.Name)
+            and node.value.id in graph
+            and (graph[node.value.id].kind, node.attr) in EARLY_OUTPUTS):
+        name = f"{node.value.id}.{node.attr}"
+        graph.setdefault(name, Node(name, node.attr))
+        return {name}
+    if (isinstance(node, ast.Subscript)
+            and isinstance(node.value, ast.Name)
+            and node.value.id in outputs
+            and isinstance(node.slice, ast.Constant)):
+        return set(outputs[node.value.id].get(node.slice.value, ()))
+    if isinstance(node, ast.Name):
+        if node.id in graph:
+            return {node.id}
+        return set(aliases.get(node.id, ()))
+    names = set()
+    for child in ast.iter_child_nodes(node):
+        names |= _names(child, graph, outputs, aliases)
+    return names
+
+
+def _is_component_call(call):
+    return (
+        isinstance(call, ast.Call)
+        and isinstance(call.func, ast.Attribute)
+        and call.func.attr[:1].isupper()
+        and call.args
+        and isinstance(call.args[0], ast.Constant)
+        and isinstance(call.args[0].value, str)
+    )
+
+
+def _statements(tree):
+    """This function yields (function name, statement) for every
+       assignment and every `return {...}` of the program"""
+
+    functions = [
+        node for node in tree.body if isinstance(node, ast.FunctionDef)]
+    for function in functions:
+        for stmt in ast.walk(function):
+            if isinstance(stmt, ast.Return) and isinstance(stmt.value, ast.Dict):
+                yield function.name, stmt
+    for stmt in ast.walk(tree):
+        if isinstance(stmt, ast.Assign) and isinstance(stmt.targets[0], ast.Name):
+            yield None, stmt
+
+
+def build_graph(source):
+    """This function parses the program and returns dict of Nodes.
+       Every `name = module.Class("name", ...)` assignment is a node,
+       its data edges are component names used in the arguments and
+       its explicit edges are component names from depends_on.
+       A function that returns a dict is a layer, its outputs can be
+       used by other layers as parameter named after the function"""
+
+    tree = ast.parse(source)
+    graph = {}
+    outputs = {}
+    aliases = {}
+    for function, stmt in sorted(
+            _statements(tree), key=lambda item: item[1].lineno):
+        if isinstance(stmt, ast.Return):
+            layer = outputs.setdefault(function, {})
+            for key, value in zip(stmt.value.keys, stmt.value.values):
+                if isinstance(key, ast.Constant):
+                    layer[key.value] = _names(value, graph, outputs, aliases)
+            continue
+        if not _is_component_call(stmt.value):
+            aliases.setdefault(stmt.targets[0].id, set()).update(
+                _names(stmt.value, graph, outputs, aliases))
+            continue
+        call = stmt.value
+        name = stmt.targets[0].id
+        node = Node(name, call.func.attr, call.args[0].value)
+        for arg in call.args[1:]:
+            node.data |= _names(arg, graph, outputs, aliases)
+        for keyword in call.keywords:
+            if keyword.arg != "opts":
+                node.data |= _names(keyword.value, graph, outputs, aliases)
+                continue
+            for opt in ast.walk(keyword.value):
+                if isinstance(opt, ast.keyword) and opt.arg == "depends_on":
+                    node.explicit |= {
+                        dep.split(".")[0]
+                        for dep in _names(opt.value, graph, outputs, aliases)}
+                elif isinstance(opt, ast.keyword):
+                    node.data |= _names(opt.value, graph, outputs, aliases)
+        node.data.discard(name)
+        graph[name] = node
+    return graph
+
+
+def _reachable(graph, start, edges):
+    seen = set()
+    stack = list(edges(graph[start]))
+    while stack:
+        name = stack.pop()
+        if name not in seen:
+            seen.add(name)
+            stack.extend(edges(graph[name]))
+    return seen
+
+
+def analyze(graph):
+    """This function classifies explicit edges of every node:
+       - redundant - already implied by the data flow
+       - unneeded - there is no data flow between components
+       - required - listed in REQUIRED_EDGES, they are kept
+       and returns minimal depends_on for every node"""
+
+    report = {"redundant": [], "unneeded": [], "required": [], "minimal": {}}
+    for node in graph.values():
+        implied = _reachable(graph, node.name, lambda n: n.data)
+        minimal = []
+        for dep in sorted(node.explicit | {
+                d for (n, d) in REQUIRED_EDGES if n == node.name and d in graph}):
+            if (node.name, dep) in REQUIRED_EDGES:
+                report["required"].append(
+                    (node.name, dep, REQUIRED_EDGES[(node.name, dep)]))
+                minimal.append(dep)
+            elif dep in implied:
+                report["redundant"].append((node.name, dep))
+            else:
+                report["unneeded"].append((node.name, dep))
+        report["minimal"][node.name] = minimal
+    return report
+
+
+def critical_path(graph, edges):
+    """This function returns critical path of the graph (list of
+       component names) and its estimated duration in minutes"""
+
+    memo = {}
+
+    def longest(name):
+        if name not in memo:
+            node = graph[name]
+            best = max(
+                (longest(dep) for dep in edges(node)),
+                key=lambda path: path[0],
+                default=(0, []),
+            )
+            memo[name] = (
+                best[0] + ESTIMATED_MINUTES.get(node.kind, DEFAULT_MINUTES),
+                best[1] + [name],
+            )
+        return memo[name]
+
+    duration, path = max(
+        (longest(name) for name in graph), key=lambda path: path[0])
+    return path, duration
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Find over-serialized depends_on chains in the program")
+    parser.add_argument("program", nargs="?", default="layers.py")
+    parser.add_argument("--json", action="store_true", help="print JSON report")
+    options = parser.parse_args()
+
+    with open(options.program) as f:
+        graph = build_graph(f.read())
+    report = analyze(graph)
+    current_path, current = critical_path(
+        graph, lambda node: node.data | node.explicit)
+    minimal_path, minimal = critical_path(
+        graph, lambda node: node.data | set(report["minimal"][node.name]))
+    report["critical_path"] = {
+        "current": {"path": current_path, "minutes": current},
+        "minimal": {"path": minimal_path, "minutes": minimal},
+    }
+
+    if options.json:
+        report["data"] = {n.name: sorted(n.data) for n in graph.values()}
+        print(json.dumps(report, indent=2))
+        return
+
+    print("Data flow:")
+    for node in graph.values():
+        print(f"  {node.name} ({node.kind}) <- {', '.join(sorted(node.data)) or '-'}")
+    print("Redundant depends_on (implied by data flow):")
+    for name, dep in report["redundant"]:
+        print(f"  {name} -> {dep}")
+    print("Unneeded depends_on (no data flow):")
+    for name, dep in report["unneeded"]:
+        print(f"  {name} -> {dep}")
+    print("Required depends_on:")
+    for name, dep, reason in report["required"]:
+        print(f"  {name} -> {dep}: {reason}")
+    for label in ("current", "minimal"):
+        path = report["critical_path"][label]
+        print(f"Critical path ({label}, ~{path['minutes']:g} min): "
+              + " -> ".join(path["path"]))
+
+
+if __name__ == "__main__":
+    main()
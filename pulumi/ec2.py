@@ -1,7 +1,8 @@
-from pulumi import ComponentResource, ResourceOptions
+from pulumi import ComponentResource, ResourceOptions, Output, Alias, ROOT_STACK_RESOURCE
 import pulumi_aws as aws
-from jinja2 import Template
 import pulumi_random as random
+import ami_lock
+import templates
 
 
 class Ec2Args:
@@ -18,7 +19,20 @@ class Ec2Args:
        - ec2_role_name - name of EC2 IAM role for EC2 instance
        - ec2_subnet_id - id of subnet in which you want to allocate EC2
        - iam_instance_profile_name - IAM instance profile for EC2
-       - default_rest_api_id - id of REST API to fill template"""
+       - default_rest_api_id - id of REST API to fill template
+       - compress_user_data - send user data as gzip-compressed
+         cloud-init multipart message, changing it replaces EC2 instance
+       - golden_ami - entry of golden AMI catalog (`id` and `manifest`),
+         the instance is created from this image and bootstrap only
+         configures the deployment, stock AMI is used if not set
+       - celery_broker_url - URL of broker of Celery workers, Airflow
+         server runs LocalExecutor if not set
+       - performance_profile - profile from policypack/ec2_profiles.json:
+         root and data volumes, EBS optimization and CPU credits,
+         instance defaults are used if not set, profile with data volume
+         needs golden_ami
+       - user_data_updates - apply changes of user data, which replaces
+         EC2 instance, they are ignored if not set"""
 
     def __init__(
         self,
@@ -34,6 +48,11 @@ class Ec2Args:
         ec2_subnet_id,
         iam_instance_profile_name,
         default_rest_api_id,
+        compress_user_data=False,
+        golden_ami=None,
+        celery_broker_url=None,
+        performance_profile=None,
+        user_data_updates=False,
     ):
 
         self.region = region
@@ -48,6 +67,11 @@ class Ec2Args:
         self.ec2_subnet_id = ec2_subnet_id
         self.iam_instance_profile_name = iam_instance_profile_name
         self.default_rest_api_id = default_rest_api_id
+        self.compress_user_data = compress_user_data
+        self.golden_ami = golden_ami
+        self.celery_broker_url = celery_broker_url
+        self.performance_profile = performance_profile
+        self.user_data_updates = user_data_updates
 
 
 class Ec2(ComponentResource):
@@ -55,36 +79,59 @@ class Ec2(ComponentResource):
 
     def __init__(self, name: str, args: Ec2Args, opts: ResourceOptions = None):
         """Create constructor of class Ec2
-           This constructor render the template with variables, than chooses
-           latest AMI for EC2 instance and then creates EC2 instance"""
+           This constructor render the template with variables, than takes
+           golden AMI or AMI pinned in the AMI lockfile and then creates
+           EC2 instance with volumes of its performance profile"""
         super().__init__("custom:resource:Ec2", name, {}, opts)
         """Override ComponentResource class constructor"""
 
-        user_data_rendered = Template(open("bootstrap.tpl").read()).render(
-            region=args.region,
-            repo_name=f"{args.project_name_underscores}_airflow_pipeline",
-            deploy_key=args.repo_deploy_key,
-            project_name_underscores=args.project_name_underscores,
-            aws_account_id=args.aws_account_id,
-            api_endpoint=f"https://{args.default_rest_api_id}.execute-api.{args.region}. \
-            amazonaws.com/prod/{args.project_name_underscores}"
-        )
+        profile = args.performance_profile or {}
+        # Data volume is formatted and mounted by bootstrap_golden.tpl,
+        # so it is created only with golden AMI
+        data_volume = profile.get("data_volume")
+        if data_volume and not args.golden_ami:
+            raise SystemExit(
+                f"Error: EC2 profile '{profile['name']}' has a data volume, "
+                f"it is mounted only by bootstrap of golden AMI, set golden_ami "
+                f"or choose a profile without data volume")
 
-        amazon_linux2 = aws.ec2.get_ami(
-            owners=["amazon"],
-            filters=[
-                {
-                    "name": "owner-alias",
-                    "values": ["amazon"],
-                },
-                {
-                    "name": "name",
-                    "values": ["amzn2-ami-hvm*"],
-                },
-            ],
-            most_recent=True,
+        # Golden AMI already has Airflow server installed,
+        # only the steps which depend on the deployment are rendered
+        template, manifest = "bootstrap.tpl", None
+        if args.golden_ami:
+            template = "bootstrap_golden.tpl"
+            manifest = args.golden_ami["manifest"]
+
+        user_data = Output.all(
+            args.aws_account_id,
+            args.default_rest_api_id,
+            args.celery_broker_url,
+            ).apply(
+            lambda arg: templates.user_data(
+                templates.render(
+                    template,
+                    manifest=manifest,
+                    region=args.region,
+                    repo_name=f"{args.project_name_underscores}_airflow_pipeline",
+                    deploy_key=args.repo_deploy_key,
+                    project_name_underscores=args.project_name_underscores,
+                    aws_account_id=arg[0],
+                    api_endpoint=f"https://{arg[1]}.execute-api.{args.region}."
+                    f"amazonaws.com/prod/{args.project_name_underscores}",
+                    celery_broker_url=arg[2],
+                    data_volume=data_volume,
+                ),
+                compress=args.compress_user_data,
+                resource_name=f"{name} user data",
+            )
         )
 
+        if args.golden_ami:
+            ami_id, ami_pinned = args.golden_ami["id"], True
+        else:
+            ami_id = ami_lock.get_ami_id(args.region)
+            ami_pinned = ami_lock.is_pinned(args.region)
+
         self.airflow_pass = random.RandomPassword(
             "airflowPass",
             length=12,
@@ -92,9 +139,15 @@ class Ec2(ComponentResource):
             opts=ResourceOptions(parent=self),
         )
 
+        ignore_changes = [] if ami_pinned else ["ami"]
+        # Changed user data replaces the instance, so it is applied
+        # only when operators opt in with user_data_updates
+        if not args.user_data_updates:
+            ignore_changes += ["user_data", "user_data_base64"]
+
         self.default = aws.ec2.Instance(
             "default",
-            ami=amazon_linux2.id,
+            ami=ami_id,
             associate_public_ip_address=True,
             instance_type=args.ec2_instance_type,
             # key_name=f"monitoring_deployments_{data['region']}"
@@ -103,12 +156,65 @@ class Ec2(ComponentResource):
             vpc_security_group_ids=[args.ec2_security_group_id],
             subnet_id=args.ec2_subnet_id,
             iam_instance_profile=args.iam_instance_profile_name,
-            user_data=user_data_rendered,
+            user_data=user_data.apply(lambda data: data[0]),
+            user_data_base64=user_data.apply(lambda data: data[1]),
+            ebs_optimized=profile.get("ebs_optimized"),
+            root_block_device={
+                **profile["root_volume"],
+                "encrypted": True,
+            } if profile.get("root_volume") else None,
+            credit_specification={
+                "cpu_credits": profile["cpu_credits"],
+            } if profile.get("cpu_credits") else None,
             tags={
                 "BillingCode": args.billing_code,
                 "Name": f"{args.project_name_underscores}_airflow_server",
                 "Project": args.project_name_underscores,
             },
+            # The instance was created without parent before,
+            # alias keeps it from being replaced. Until AMI is pinned,
+            # instance deployed before the lockfile keeps its AMI
+            opts=ResourceOptions(
+                parent=self,
+                aliases=[Alias(parent=ROOT_STACK_RESOURCE)],
+                ignore_changes=ignore_changes,
+            ),
         )
+        ami = self.default.ami
+        if not ami_pinned:
+            ami = ami_lock.seed_lock(args.region, ami)
+
+        if data_volume:
+            # Separate volume keeps Airflow data when the instance is replaced
+            self.data_volume = aws.ebs.Volume(
+                "data",
+                availability_zone=self.default.availability_zone,
+                type=data_volume["volume_type"],
+                size=data_volume["volume_size"],
+                iops=data_volume.get("iops"),
+                throughput=data_volume.get("throughput"),
+                encrypted=True,
+                tags={
+                    "BillingCode": args.billing_code,
+                    "Name": f"{args.project_name_underscores}_airflow_data",
+                    "Project": args.project_name_underscores,
+                },
+                opts=ResourceOptions(parent=self),
+            )
+
+            aws.ec2.VolumeAttachment(
+                "data",
+                device_name=data_volume["device_name"],
+                instance_id=self.default.id,
+                volume_id=self.data_volume.id,
+                opts=ResourceOptions(parent=self),
+            )
+
+        # AMI of the instance, it resolves after the AMI is pinned
+        self.ami = ami
 
-        self.register_outputs({})
+        self.register_outputs({
+            "instance_id": self.default.id,
+            "public_ip": self.default.public_ip,
+            "ami": self.ami,
+        })
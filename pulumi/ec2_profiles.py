@@ -0,0 +1,44 @@
+import json
+import os
+
+# Table of EC2 performance profiles, it is kept in the policy pack,
+# which is published on its own and takes allowed instance types from it
+PROFILES = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "policypack", "ec2_profiles.json")
+DEFAULT_PROFILE = "legacy"
+
+# Instance families with CPU credits
+BURSTABLE_FAMILIES = ("t2", "t3", "t3a", "t4g")
+
+
+def load():
+    with open(PROFILES) as f:
+        return json.load(f)
+
+
+def resolve(name, instance_type, volumes=None):
+    """This function returns the profile for the instance type.
+       Settings of root and data volumes (e.g. iops, throughput)
+       can be overridden with volumes: {"root": {...}, "data": {...}}.
+       Instance type must be one of the types of the profile"""
+
+    profiles = load()
+    if name not in profiles:
+        raise SystemExit(f"Error: unknown EC2 profile '{name}', "
+                         f"expected one of: {', '.join(profiles)}")
+    profile = dict(profiles[name], name=name)
+    if instance_type not in profile["instance_types"]:
+        raise SystemExit(
+            f"Error: instance type {instance_type} is not allowed by EC2 "
+            f"profile '{name}', expected one of: "
+            f"{', '.join(profile['instance_types'])}")
+
+    for volume, overrides in (volumes or {}).items():
+        key = f"{volume}_volume"
+        if not profile.get(key):
+            raise SystemExit(f"Error: EC2 profile '{name}' has no {volume} volume")
+        profile[key] = {**profile[key], **overrides}
+
+    if instance_type.split(".")[0] not in BURSTABLE_FAMILIES:
+        profile["cpu_credits"] = None
+    return profile
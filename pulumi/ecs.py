@@ -0,0 +1,246 @@
+from pulumi import ComponentResource, ResourceOptions, Output
+import pulumi_aws as aws
+import json
+
+# Default size of a pipeline task, Fargate CPU units and MiB
+DEFAULT_CPU = 1024
+DEFAULT_MEMORY = 2048
+LOG_RETENTION_DAYS = 30
+
+
+class EcsArgs:
+    """Create class EcsArgs for conveniently passing arguments to the class Ecs
+       These arguments are used to create ECS cluster and task
+       definitions of pipeline tasks:
+       - region - specify region in which you want create
+       - billing_code - billing code
+       - project_name_underscores - modified project name
+       - ec2_subnet_id - id of subnet with ECR VPC endpoints, tasks
+         are run in it
+       - ec2_security_group_id - id of EC2 security group, it allows
+         access to VPC endpoints
+       - ec2_role_name - name of EC2 IAM role, Airflow server runs
+         tasks with it
+       - tasks - dict of pipeline task name to its settings: `cpu`,
+         `memory`, `image_tag` (tag in the pipeline ECR repository,
+         default is the task name), `image` (full image URI instead
+         of the repository), `environment` (dict of variables)
+       - use_spot - run tasks on FARGATE_SPOT by default"""
+
+    def __init__(
+        self,
+        region,
+        billing_code,
+        project_name_underscores,
+        ec2_subnet_id,
+        ec2_security_group_id,
+        ec2_role_name,
+        tasks,
+        use_spot=False,
+    ):
+
+        self.region = region
+        self.billing_code = billing_code
+        self.project_name_underscores = project_name_underscores
+        self.ec2_subnet_id = ec2_subnet_id
+        self.ec2_security_group_id = ec2_security_group_id
+        self.ec2_role_name = ec2_role_name
+        self.tasks = tasks
+        self.use_spot = use_spot
+
+
+class Ecs(ComponentResource):
+    """Create class Ecs which extends class ComponentResource"""
+
+    def __init__(self, name: str, args: EcsArgs, opts: ResourceOptions = None):
+        """Create constructor of class Ecs
+           This constructor creates ECR repository for pipeline images,
+           ECS cluster with Fargate capacity providers, roles of tasks
+           and task definition for every pipeline task. Tasks run without
+           public IP, so images are pulled through ECR VPC endpoints"""
+        super().__init__("custom:resource:Ecs", name, {}, opts)
+        """Override ComponentResource class constructor"""
+
+        tags = {
+            "BillingCode": args.billing_code,
+            "Project": args.project_name_underscores,
+        }
+
+        self.repository = aws.ecr.Repository(
+            "pipelineRepository",
+            name=f"{args.project_name_underscores}_pipeline",
+            image_scanning_configuration={"scan_on_push": True},
+            tags=tags,
+            opts=ResourceOptions(parent=self),
+        )
+
+        default_provider = "FARGATE_SPOT" if args.use_spot else "FARGATE"
+        self.cluster = aws.ecs.Cluster(
+            "cluster",
+            name=f"{args.project_name_underscores}_pipeline",
+            capacity_providers=["FARGATE", "FARGATE_SPOT"],
+            default_capacity_provider_strategies=[{
+                "capacity_provider": default_provider,
+                "weight": 1,
+            }],
+            settings=[{"name": "containerInsights", "value": "enabled"}],
+            tags=tags,
+            opts=ResourceOptions(parent=self),
+        )
+
+        log_group = aws.cloudwatch.LogGroup(
+            "pipelineLogGroup",
+            name=f"/ecs/{args.project_name_underscores}_pipeline",
+            retention_in_days=LOG_RETENTION_DAYS,
+            tags=tags,
+            opts=ResourceOptions(parent=self),
+        )
+
+        assume_role_policy = json.dumps({
+            "Version": "2012-10-17",
+            "Statement": [{
+                "Action": "sts:AssumeRole",
+                "Principal": {"Service": "ecs-tasks.amazonaws.com"},
+                "Effect": "Allow",
+            }],
+        })
+
+        # Role of ECS agent, it pulls images and writes logs
+        self.execution_role = aws.iam.Role(
+            "taskExecutionRole",
+            assume_role_policy=assume_role_policy,
+            tags=tags,
+            opts=ResourceOptions(parent=self),
+        )
+
+        aws.iam.RolePolicyAttachment(
+            "taskExecutionPolicy",
+            role=self.execution_role.name,
+            policy_arn="arn:aws:iam::aws:policy/"
+            + "service-role/AmazonECSTaskExecutionRolePolicy",
+            opts=ResourceOptions(parent=self),
+        )
+
+        # Role of pipeline code, it has the same data access as Airflow server
+        self.task_role = aws.iam.Role(
+            "taskRole",
+            assume_role_policy=assume_role_policy,
+            tags=tags,
+            opts=ResourceOptions(parent=self),
+        )
+
+        aws.iam.RolePolicy(
+            "taskRolePolicy",
+            role=self.task_role.id,
+            policy=json.dumps({
+                "Version": "2012-10-17",
+                "Statement": [{
+                    "Sid": "s3Access",
+                    "Effect": "Allow",
+                    "Action": [
+                        "s3:DeleteObject",
+                        "s3:GetObject",
+                        "s3:ListBucket",
+                        "s3:PutObject"
+                    ],
+                    "Resource": [
+                        f"arn:aws:s3:::datalake-{args.project_name_underscores}",
+                        f"arn:aws:s3:::datalake-{args.project_name_underscores}/*",
+                    ],
+                }],
+            }),
+            opts=ResourceOptions(parent=self),
+        )
+
+        self.task_definitions = {}
+        for task_name, task in sorted(args.tasks.items()):
+            if "image" in task:
+                image = Output.from_input(task["image"])
+            else:
+                image = self.repository.repository_url.apply(
+                    lambda url, tag=task.get("image_tag", task_name): f"{url}:{tag}")
+            self.task_definitions[task_name] = aws.ecs.TaskDefinition(
+                f"{task_name}TaskDefinition",
+                family=f"{args.project_name_underscores}_{task_name}",
+                requires_compatibilities=["FARGATE"],
+                network_mode="awsvpc",
+                cpu=str(task.get("cpu", DEFAULT_CPU)),
+                memory=str(task.get("memory", DEFAULT_MEMORY)),
+                execution_role_arn=self.execution_role.arn,
+                task_role_arn=self.task_role.arn,
+                container_definitions=Output.all(image, log_group.name).apply(
+                    lambda arg, task_name=task_name, task=task: json.dumps([{
+                        "name": task_name,
+                        "image": arg[0],
+                        "essential": True,
+                        "environment": [
+                            {"name": key, "value": str(value)}
+                            for key, value in sorted(
+                                task.get("environment", {}).items())
+                        ],
+                        "logConfiguration": {
+                            "logDriver": "awslogs",
+                            "options": {
+                                "awslogs-group": arg[1],
+                                "awslogs-region": args.region,
+                                "awslogs-stream-prefix": task_name,
+                            },
+                        },
+                    }])),
+                tags=tags,
+                opts=ResourceOptions(parent=self),
+            )
+
+        # Airflow server starts tasks with ECSOperator
+        aws.iam.RolePolicy(
+            "runTasksPolicy",
+            role=args.ec2_role_name,
+            policy=Output.all(
+                self.cluster.arn,
+                self.execution_role.arn,
+                self.task_role.arn,
+                ).apply(
+                lambda arg: json.dumps({
+                    "Version": "2012-10-17",
+                    "Statement": [
+                        {
+                            "Effect": "Allow",
+                            "Action": [
+                                "ecs:RunTask",
+                                "ecs:StopTask",
+                                "ecs:DescribeTasks",
+                            ],
+                            "Resource": "*",
+                            "Condition": {"ArnEquals": {"ecs:cluster": arg[0]}},
+                        },
+                        {
+                            "Effect": "Allow",
+                            "Action": ["iam:PassRole"],
+                            "Resource": [arg[1], arg[2]],
+                        },
+                        {
+                            "Effect": "Allow",
+                            "Action": ["logs:GetLogEvents"],
+                            "Resource": "*",
+                        },
+                    ],
+                })),
+            opts=ResourceOptions(parent=self),
+        )
+
+        # Settings of awsvpc network for ECSOperator
+        self.network_configuration = Output.all(
+            args.ec2_subnet_id, args.ec2_security_group_id).apply(
+            lambda arg: {
+                "awsvpcConfiguration": {
+                    "subnets": [arg[0]],
+                    "securityGroups": [arg[1]],
+                    "assignPublicIp": "DISABLED",
+                },
+            })
+
+        self.register_outputs({
+            "cluster_name": self.cluster.name,
+            "repository_url": self.repository.repository_url,
+            "network_configuration": self.network_configuration,
+        })
@@ -0,0 +1,129 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import yaml
+
+WORK_DIR = os.path.dirname(os.path.abspath(__file__))
+OUTPUT = "inputs_fingerprint"
+# ami_lock.LOCKFILE, ami_lock is not imported to keep the check fast,
+# as it loads pulumi_aws
+AMI_LOCKFILE = "Pulumi.{stack}.ami.lock.json"
+
+# Files the program reads besides the modules. Versions of Pulumi
+# SDK and providers are taken from requirements.txt, not from the
+# environment, so the check gives the same result outside the venv
+FILES = (
+    "bootstrap.tpl",
+    "bootstrap_golden.tpl",
+    "bootstrap_worker.tpl",
+    "ami_catalog.json",
+    "policypack/ec2_profiles.json",
+    "rds_instance_classes.json",
+    "policy.json",
+    "lambda_dummy.zip",
+    "lambda_layer/python/secrets_cache.py",
+    "requirements.txt",
+    "Pulumi.yaml",
+)
+
+# Scripts of the project, which are not part of the program
+TOOLS = (
+    "benchmark.py",
+    "depgraph.py",
+    "fingerprint.py",
+    "orchestrator.py",
+    "planner.py",
+    "power_tuning.py",
+)
+
+
+def _files(stack):
+    names = set(FILES) | {AMI_LOCKFILE.format(stack=stack)}
+    names |= {
+        os.path.basename(path)
+        for path in glob.glob(os.path.join(WORK_DIR, "*.py"))
+    } - set(TOOLS)
+    return sorted(names)
+
+
+def stack_config(stack):
+    """This function returns `config` of Pulumi.<stack>.yaml as it is
+       stored: all namespaces, `secure:` values are ciphertext. The
+       program and the command hash this same representation"""
+
+    with open(os.path.join(WORK_DIR, f"Pulumi.{stack}.yaml")) as f:
+        return yaml.safe_load(f).get("config") or {}
+
+
+def compute(stack):
+    """This function returns SHA-256 of everything the program of the
+       stack is built from: stack config, bootstrap.tpl, policy.json,
+       lambda_dummy.zip, requirements.txt, AMI lockfile and source files
+       of components. The same inputs always give the same fingerprint.
+       The program computes it after the AMI is pinned, so it covers
+       the lockfile `pulumi up` writes"""
+
+    digest = hashlib.sha256()
+    digest.update(json.dumps(stack_config(stack), sort_keys=True).encode())
+    for name in _files(stack):
+        path = os.path.join(WORK_DIR, name)
+        digest.update(f"\0{name}\0".encode())
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+        else:
+            digest.update(b"missing")
+    return digest.hexdigest()
+
+
+def deployed(stack):
+    """This function returns fingerprint of the last deployment of
+       the stack, it reads only stack outputs and doesn't run the engine"""
+
+    try:
+        result = subprocess.run(
+            ["pulumi", "stack", "output", OUTPUT, "--stack", stack],
+            cwd=WORK_DIR, capture_output=True, text=True)
+    except FileNotFoundError:
+        return None
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def main():
+    """Pre-check command for CI. It exits with 0 when inputs of the
+       stack are the same as in the last deployment and `pulumi up`
+       can be skipped, and with 1 otherwise"""
+
+    parser = argparse.ArgumentParser(
+        description="Check whether inputs of the stack changed since last deployment")
+    parser.add_argument("command", choices=["show", "check"])
+    parser.add_argument("--stack", required=True)
+    options = parser.parse_args()
+
+    current = compute(options.stack)
+    if options.command == "show":
+        print(current)
+        return
+
+    # Outputs of upstream layer stacks are inputs of a layer stack,
+    # they are not in the fingerprint, so layer stacks are always updated
+    if stack_config(options.stack).get("project:data", {}).get("layer"):
+        print(f"{options.stack}: layer stack, inputs from upstream stacks "
+              f"are not fingerprinted, update is needed")
+        sys.exit(1)
+
+    last = deployed(options.stack)
+    if current == last:
+        print(f"{options.stack}: inputs are not changed ({current[:12]}), skip update")
+        return
+    print(f"{options.stack}: inputs changed "
+          f"({(last or 'not deployed')[:12]} -> {current[:12]}), update is needed")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from pulumi import ComponentResource, ResourceOptions, Output
+from pulumi import ComponentResource, ResourceOptions, Output, Alias, ROOT_STACK_RESOURCE
 import pulumi_aws as aws
 import json
 
@@ -129,6 +129,7 @@ class Iam(ComponentResource):
                         "Action": [
                             "secretsmanager:GetResourcePolicy",
                             "secretsmanager:GetSecretValue",
+                            "secretsmanager:BatchGetSecretValue",
                             "secretsmanager:DescribeSecret",
                             "secretsmanager:ListSecretVersionIds"
                         ],
@@ -250,8 +251,13 @@ class Iam(ComponentResource):
                         }
                     ]
                 }),
-            )
-            # opts=ResourceOptions(parent=self),
+            ),
+            # The policy was created without parent before,
+            # alias keeps it from being replaced
+            opts=ResourceOptions(
+                parent=self,
+                aliases=[Alias(parent=ROOT_STACK_RESOURCE)],
+            ),
         )
 
         self.lambda_logs = aws.iam.RolePolicyAttachment(
@@ -276,4 +282,72 @@ class Iam(ComponentResource):
             opts=ResourceOptions(parent=self),
         )
 
-        self.register_outputs({})
+        self.register_outputs({
+            "ec2_role_arn": self.ec2_role.arn,
+            "ec2_role_name": self.ec2_role.name,
+            "instance_profile_name": self.default.name,
+            "lambda_exec_arn": self.lambda_exec.arn,
+        })
+
+
+class RdsMonitoringIamArgs:
+    """Create class RdsMonitoringIamArgs for conveniently passing arguments
+       to the class RdsMonitoringIam:
+       - project_name_underscores - modified project name
+       - name_suffix - random suffix that is added to all unique resources"""
+
+    def __init__(
+        self,
+        project_name_underscores,
+        name_suffix,
+    ):
+
+        self.project_name_underscores = project_name_underscores
+        self.name_suffix = name_suffix
+
+
+class RdsMonitoringIam(ComponentResource):
+    """Create class RdsMonitoringIam which extends class ComponentResource"""
+
+    def __init__(
+        self, name: str, args: RdsMonitoringIamArgs, opts: ResourceOptions = None
+    ):
+        """Create constructor of class RdsMonitoringIam
+           This constructor creates IAM role, with which RDS sends
+           Enhanced Monitoring metrics to CloudWatch Logs. It is
+           separated from Iam, because RDS instance is created in
+           data layer, before Iam of compute layer"""
+
+        super().__init__("custom:resource:RdsMonitoringIam", name, {}, opts)
+        """Override ComponentResource class constructor"""
+
+        self.rds_monitoring_role = aws.iam.Role(
+            "rdsMonitoringRole",
+            name=Output.all(
+                args.project_name_underscores,
+                args.name_suffix
+                ).apply(
+                lambda arg: f"{arg[0]}-{arg[1]}-rds-monitoring-role"),
+            assume_role_policy=json.dumps({
+                "Version": "2012-10-17",
+                "Statement": [{
+                    "Action": "sts:AssumeRole",
+                    "Principal": {"Service": "monitoring.rds.amazonaws.com"},
+                    "Effect": "Allow",
+                    "Sid": "",
+                }],
+            }),
+            opts=ResourceOptions(parent=self),
+        )
+
+        self.rds_monitoring = aws.iam.RolePolicyAttachment(
+            "rdsMonitoring",
+            role=self.rds_monitoring_role.name,
+            policy_arn="arn:aws:iam::aws:policy/"
+            + "service-role/AmazonRDSEnhancedMonitoringRole",
+            opts=ResourceOptions(parent=self),
+        )
+
+        self.register_outputs({
+            "rds_monitoring_role_arn": self.rds_monitoring_role.arn,
+        })
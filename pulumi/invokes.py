@@ -0,0 +1,160 @@
+from pulumi import Output, Config, get_stack
+import pulumi_aws as aws
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+CACHE_DIR = ".invoke_cache"
+DEFAULT_TTL = int(os.environ.get("INVOKE_CACHE_TTL", 24 * 60 * 60))
+
+_outputs = {}
+
+
+def _region():
+    """This function returns the AWS region the program is deployed to,
+       which is part of every cache key"""
+
+    return (
+        Config("aws").get("region")
+        or os.environ.get("AWS_REGION")
+        or os.environ.get("AWS_DEFAULT_REGION", "")
+    )
+
+
+def _credentials_scope():
+    """This function returns a fingerprint of the credentials named
+       explicitly (profile, access key or role), or None if they come
+       from SSO cache, web identity, instance or container role only.
+       It scopes the caller identity lookup, because the account id is
+       not known before that lookup resolves"""
+
+    aws_config = Config("aws")
+    credentials = [
+        os.environ.get(name, "")
+        for name in ("AWS_PROFILE", "AWS_ACCESS_KEY_ID", "AWS_ROLE_ARN")
+    ] + [
+        aws_config.get(name) or ""
+        for name in ("profile", "accessKey", "assumeRole")
+    ]
+    if not any(credentials):
+        return None
+    return hashlib.sha256("|".join(credentials).encode()).hexdigest()[:16]
+
+
+def _cache_path(key):
+    digest = hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+    return os.path.join(CACHE_DIR, get_stack(), f"{digest}.json")
+
+
+def _read_cache(key, ttl):
+    """This function returns cached invoke result for the key,
+       or None if there is no entry or it is older than ttl"""
+
+    try:
+        with open(_cache_path(key)) as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if entry.get("key") != key or time.time() - entry["created"] > ttl:
+        return None
+    return entry["value"]
+
+
+def _write_cache(key, value):
+    path = _cache_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"key": key, "created": time.time(), "value": value}, f)
+    os.replace(tmp_path, path)
+
+
+def _run_invoke(key, fn, args, fields, ttl):
+    """This function runs the invoke in a worker thread. Pulumi's
+       synchronous invoke drives the event loop of the current thread,
+       so every worker gets its own loop"""
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        result = fn(**args)
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+    value = {field: getattr(result, field) for field in fields}
+    if ttl > 0:
+        _write_cache(key, value)
+    return value
+
+
+def cached_invoke(token, fn, args, fields, scope="", ttl=None):
+    """This function returns an Output with result of a data-source
+       lookup, so lookups run concurrently with resource registration:
+       - token - name of the invoke, e.g. aws:ec2/getAmi:getAmi
+       - fn - function which performs the invoke
+       - args - keyword arguments for fn, they are a part of cache key
+       - fields - attributes of the invoke result that are kept
+       - scope - account (or credentials) the result belongs to
+       - ttl - how long the result is kept on disk, 0 disables the cache
+       Identical lookups share one Output within the process, results
+       are stored on disk per stack, region and scope"""
+
+    ttl = DEFAULT_TTL if ttl is None else ttl
+    key = {
+        "token": token,
+        "args": args,
+        "fields": list(fields),
+        "region": _region(),
+        "scope": scope,
+    }
+    key_id = json.dumps(key, sort_keys=True)
+    if key_id in _outputs:
+        return _outputs[key_id]
+
+    value = _read_cache(key, ttl) if ttl > 0 else None
+    if value is not None:
+        output = Output.from_input(value)
+    else:
+        output = Output.from_input(
+            asyncio.get_event_loop().run_in_executor(
+                None, _run_invoke, key, fn, args, fields, ttl
+            )
+        )
+    _outputs[key_id] = output
+    return output
+
+
+def get_caller_identity():
+    """This function returns an Output with account_id, arn
+       and user_id of the current AWS credentials"""
+
+    scope = _credentials_scope()
+    # Without explicitly named credentials the account can't be told
+    # before the lookup, so its result is not stored on disk
+    return cached_invoke(
+        "aws:index/getCallerIdentity:getCallerIdentity",
+        aws.get_caller_identity,
+        {},
+        ["account_id", "arn", "user_id"],
+        scope=scope or "",
+        ttl=None if scope else 0,
+    )
+
+
+def get_account_id():
+    """This function returns an Output with id of current aws account"""
+
+    return get_caller_identity().apply(lambda identity: identity["account_id"])
+
+
+def account_invoke(token, fn, args, fields, ttl=None):
+    """This function works as cached_invoke, but the result
+       is scoped to the current aws account"""
+
+    return get_account_id().apply(
+        lambda account_id: cached_invoke(
+            token, fn, args, fields, scope=account_id, ttl=ttl
+        )
+    )
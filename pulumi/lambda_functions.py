@@ -1,5 +1,12 @@
-from pulumi import ComponentResource, ResourceOptions, FileArchive
+from pulumi import ComponentResource, ResourceOptions, FileArchive, AssetArchive, FileAsset, Output
 import pulumi_aws as aws
+import cache
+
+# Alias of the published version, API Gateway invokes it
+LIVE_ALIAS = "live"
+SCHEDULED_ACTION_KEYS = ("name", "schedule", "min_capacity", "max_capacity")
+# python3.7 runtime and pulumi-aws 3.x support only x86_64
+ARCHITECTURES = ("x86_64",)
 
 
 class LambdaArgs:
@@ -10,9 +17,24 @@ class LambdaArgs:
        - project_name_underscores - modified project name
        - db_username_secret_arn - ARN of secret with db username
        - db_password_secret_arn - ARN of secret with db password
-       - db_address_secret_arn - ARN of secret with db address
+       - db_address_secret_arn - ARN of secret with db address,
+         it is address of RDS Proxy, when the proxy is created
        - lambda_exec_arn - ARN of IAM role for lambda execution
-       - ec2_subnet_id - subnet id in which EC2 is created"""
+       - ec2_subnet_id - subnet id in which EC2 is created
+       - db_reader_address_secret_arn - ARN of secret with address of
+         database endpoint for reads, GET function uses it
+       - cache_address_secret_arn - ARN of secret with address of
+         ElastiCache Redis, GET function caches results of queries in it
+       - cache_ttl - seconds for which results of queries are cached
+       - publish - publish versions of functions and create `live`
+         alias of them, it is implied by provisioned concurrency
+       - provisioned_concurrency - provisioned concurrency of `live`
+         alias of functions: {"get": count, "post": count}
+       - provisioned_concurrency_schedule - scheduled scaling of
+         provisioned concurrency: {"get": [{"name", "schedule",
+         "min_capacity", "max_capacity", "timezone"}]}
+       - tuning - memory size of functions recommended by power_tuning.py:
+         {"get": {"memory_size"}}, `architecture` can be only x86_64"""
 
     def __init__(
         self,
@@ -24,6 +46,13 @@ class LambdaArgs:
         db_address_secret_arn,
         lambda_exec_arn,
         ec2_subnet_id,
+        db_reader_address_secret_arn=None,
+        cache_address_secret_arn=None,
+        cache_ttl=60,
+        publish=False,
+        provisioned_concurrency=None,
+        provisioned_concurrency_schedule=None,
+        tuning=None,
     ):
 
         self.billing_code = billing_code
@@ -34,6 +63,13 @@ class LambdaArgs:
         self.db_address_secret_arn = db_address_secret_arn
         self.lambda_exec_arn = lambda_exec_arn
         self.ec2_subnet_id = ec2_subnet_id
+        self.db_reader_address_secret_arn = db_reader_address_secret_arn
+        self.cache_address_secret_arn = cache_address_secret_arn
+        self.cache_ttl = cache_ttl
+        self.publish = publish
+        self.provisioned_concurrency = provisioned_concurrency or {}
+        self.provisioned_concurrency_schedule = provisioned_concurrency_schedule or {}
+        self.tuning = tuning or {}
 
 
 class Lambda(ComponentResource):
@@ -42,18 +78,84 @@ class Lambda(ComponentResource):
     def __init__(self, name: str, args: LambdaArgs, opts: ResourceOptions = None):
         """Create constructor of class Lambda
            This constructor creates two lambda functions:
-           one for GET method and another for POST method"""
+           one for GET method and another for POST method,
+           and layer with caching client of Secrets Manager.
+           When versions are published, functions get `live` alias
+           with provisioned concurrency, so they don't cold start"""
         super().__init__("custom:resource:Lambda", name, {}, opts)
         """Override ComponentResource class constructor"""
 
+        unknown = (set(args.provisioned_concurrency)
+                   | set(args.provisioned_concurrency_schedule)
+                   | set(args.tuning)) - {"get", "post"}
+        if unknown:
+            raise SystemExit(f"Error: unknown lambda functions of provisioned "
+                             f"concurrency or tuning: {', '.join(sorted(unknown))}")
+        memory_sizes = {}
+        for method, settings in args.tuning.items():
+            architecture = settings.get("architecture", ARCHITECTURES[0])
+            if architecture not in ARCHITECTURES:
+                raise SystemExit(f"Error: architecture {architecture} of {method} "
+                                 f"function is not supported by its runtime, "
+                                 f"choose from: {', '.join(ARCHITECTURES)}")
+            if settings.get("memory_size"):
+                # `pulumi config set --path` writes numbers as strings
+                memory_sizes[method] = int(settings["memory_size"])
+        for method, schedule in args.provisioned_concurrency_schedule.items():
+            if schedule and not args.provisioned_concurrency.get(method):
+                raise SystemExit(f"Error: scheduled scaling of {method} function "
+                                 f"needs its provisioned_concurrency")
+            for action in schedule or []:
+                missing = set(SCHEDULED_ACTION_KEYS) - set(action)
+                if missing:
+                    raise SystemExit(f"Error: scheduled scaling of {method} function "
+                                     f"misses {', '.join(sorted(missing))}")
+        publish = args.publish or any(args.provisioned_concurrency.values())
+
         file_archive = FileArchive("./lambda_dummy.zip")
 
+        # Handlers resolve secrets of environment variables with
+        # secrets_cache module of the layer, which caches them between
+        # invocations of the execution environment
+        self.secrets_cache_layer = aws.lambda_.LayerVersion(
+            "secretsCacheLayer",
+            layer_name=f"{args.project_name_underscores}_secrets_cache",
+            # Only the module, __pycache__ next to it is left out
+            code=AssetArchive({
+                "python/secrets_cache.py": FileAsset(
+                    "./lambda_layer/python/secrets_cache.py"),
+            }),
+            compatible_runtimes=["python3.7"],
+            opts=ResourceOptions(parent=self),
+        )
+
+        get_variables = {
+            # GET function only reads, it goes to read replicas
+            "db_host": args.db_reader_address_secret_arn
+            or args.db_address_secret_arn,
+            "db_username": args.db_username_secret_arn,
+            "db_password": args.db_password_secret_arn,
+            "db_name": "production",
+            "db_port": "5432",
+        }
+        if args.cache_address_secret_arn:
+            # Read-through cache, results of queries are read from Redis
+            # and put there with TTL on miss
+            get_variables.update({
+                "cache_host": args.cache_address_secret_arn,
+                "cache_port": str(cache.REDIS_PORT),
+                "cache_ttl": str(args.cache_ttl),
+            })
+
         self.get_function = aws.lambda_.Function(
             "getMethodFunction",
             # name=f"{args.project_name_underscores}_get_method",
             code=file_archive,
             handler="get_method.main_handler",
             runtime="python3.7",
+            memory_size=memory_sizes.get("get"),
+            layers=[self.secrets_cache_layer.arn],
+            publish=publish,
             timeout=20,
             role=args.lambda_exec_arn,
             tags={
@@ -64,13 +166,7 @@ class Lambda(ComponentResource):
                 "security_group_ids": [args.ec2_security_group_id],
             },
             environment={
-                "variables": {
-                    "db_host": args.db_address_secret_arn,
-                    "db_username": args.db_username_secret_arn,
-                    "db_password": args.db_password_secret_arn,
-                    "db_name": "production",
-                    "db_port": "5432",
-                },
+                "variables": get_variables,
             },
             opts=ResourceOptions(parent=self),
         )
@@ -81,6 +177,9 @@ class Lambda(ComponentResource):
             code=file_archive,
             handler="post_method.main_handler",
             runtime="python3.7",
+            memory_size=memory_sizes.get("post"),
+            layers=[self.secrets_cache_layer.arn],
+            publish=publish,
             timeout=20,
             role=args.lambda_exec_arn,
             tags={
@@ -102,4 +201,95 @@ class Lambda(ComponentResource):
             opts=ResourceOptions(parent=self),
         )
 
-        self.register_outputs({})
+        # API Gateway invokes targets: `live` alias, when versions are
+        # published, permission to invoke it is given by its qualified ARN
+        self.get_target = self.get_function
+        self.post_target = self.post_function
+        self.get_target_name = self.get_function.name
+        self.post_target_name = self.post_function.name
+        self.get_alias = None
+        self.post_alias = None
+        outputs = {}
+        if publish:
+            self.get_alias = self._create_alias("get", self.get_function, args)
+            self.post_alias = self._create_alias("post", self.post_function, args)
+            self.get_target = self.get_alias
+            self.post_target = self.post_alias
+            self.get_target_name = self.get_alias.arn
+            self.post_target_name = self.post_alias.arn
+            outputs = {
+                "get_alias_arn": self.get_alias.arn,
+                "post_alias_arn": self.post_alias.arn,
+            }
+
+        self.register_outputs({
+            **outputs,
+            "get_function_arn": self.get_function.arn,
+            "post_function_arn": self.post_function.arn,
+            "secrets_cache_layer_arn": self.secrets_cache_layer.arn,
+        })
+
+    def _create_alias(self, method, function, args):
+        """This method creates `live` alias of the published version
+           of the function, provisioned concurrency of the alias and
+           scheduled scaling of the concurrency, and returns the alias"""
+
+        alias = aws.lambda_.Alias(
+            f"{method}MethodAlias",
+            name=LIVE_ALIAS,
+            function_name=function.name,
+            function_version=function.version,
+            opts=ResourceOptions(parent=self),
+        )
+
+        concurrency = args.provisioned_concurrency.get(method, 0)
+        schedule = args.provisioned_concurrency_schedule.get(method) or []
+        if not concurrency:
+            return alias
+
+        # Scheduled actions change concurrency in between deployments,
+        # the program sets only the initial one
+        concurrency_config = aws.lambda_.ProvisionedConcurrencyConfig(
+            f"{method}MethodConcurrency",
+            function_name=function.name,
+            qualifier=alias.name,
+            provisioned_concurrent_executions=concurrency,
+            opts=ResourceOptions(
+                parent=self,
+                ignore_changes=["provisioned_concurrent_executions"]
+                if schedule else None,
+            ),
+        )
+        if not schedule:
+            return alias
+
+        target = aws.appautoscaling.Target(
+            f"{method}MethodConcurrencyTarget",
+            service_namespace="lambda",
+            scalable_dimension="lambda:function:ProvisionedConcurrency",
+            resource_id=Output.concat("function:", function.name, ":", alias.name),
+            min_capacity=concurrency,
+            max_capacity=max(
+                [concurrency] + [action["max_capacity"] for action in schedule]),
+            opts=ResourceOptions(
+                parent=self,
+                depends_on=[concurrency_config],
+                ignore_changes=["min_capacity", "max_capacity"],
+            ),
+        )
+        for action in schedule:
+            aws.appautoscaling.ScheduledAction(
+                f"{method}MethodConcurrency-{action['name']}",
+                name=f"{args.project_name_underscores}_{method}_{action['name']}",
+                service_namespace=target.service_namespace,
+                resource_id=target.resource_id,
+                scalable_dimension=target.scalable_dimension,
+                schedule=action["schedule"],
+                timezone=action.get("timezone"),
+                scalable_target_action={
+                    "min_capacity": action["min_capacity"],
+                    "max_capacity": action["max_capacity"],
+                },
+                opts=ResourceOptions(parent=self),
+            )
+        return alias
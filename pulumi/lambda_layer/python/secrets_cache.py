@@ -0,0 +1,152 @@
+"""Caching client of Secrets Manager for lambda functions.
+
+Lambda component passes ARNs of secrets in environment variables,
+handlers resolve them with resolve_env:
+
+    import secrets_cache
+
+    def main_handler(event, context):
+        db = secrets_cache.resolve_env(("db_host", "db_username", "db_password"))
+
+Values are kept in memory of the execution environment, so warm
+invocations don't call Secrets Manager until TTL of the values is over.
+Secrets which are not cached are resolved together: with one
+BatchGetSecretValue call, or with concurrent GetSecretValue calls,
+when boto3 of the runtime doesn't have it."""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+
+logger = logging.getLogger(__name__)
+
+# Seconds for which values are cached, they are refreshed in the
+# background after REFRESH_AHEAD share of TTL is over
+DEFAULT_TTL = int(os.environ.get("secrets_cache_ttl", 300))
+REFRESH_AHEAD = 0.8
+# Limit of SecretIdList of BatchGetSecretValue
+BATCH_SIZE = 20
+MAX_WORKERS = 8
+
+
+class SecretCache:
+    """Create class SecretCache, which keeps values of secrets
+       for ttl seconds:
+       - ttl - seconds for which values are cached
+       - refresh_ahead - share of TTL, after which cached value is
+         returned and refreshed in the background
+       - client - boto3 client of Secrets Manager"""
+
+    def __init__(self, ttl=DEFAULT_TTL, refresh_ahead=REFRESH_AHEAD, client=None):
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        self._client = client
+        self._values = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = boto3.client("secretsmanager")
+        return self._client
+
+    def get(self, secret_id):
+        """This method returns value of one secret"""
+
+        return self.get_many([secret_id])[secret_id]
+
+    def get_many(self, secret_ids):
+        """This method returns {secret_id: value} of the secrets, it
+           resolves the ones which are not cached or expired at once"""
+
+        now = time.monotonic()
+        values, missing, stale = {}, [], []
+        with self._lock:
+            for secret_id in dict.fromkeys(secret_ids):
+                cached = self._values.get(secret_id)
+                if cached is None or now - cached[1] >= self.ttl:
+                    missing.append(secret_id)
+                    continue
+                values[secret_id] = cached[0]
+                if (now - cached[1] >= self.ttl * self.refresh_ahead
+                        and secret_id not in self._refreshing):
+                    self._refreshing.add(secret_id)
+                    stale.append(secret_id)
+
+        if stale:
+            # Thread is frozen with the execution environment after
+            # the invocation and finishes in the next one, cached
+            # values are valid until TTL is over anyway
+            threading.Thread(
+                target=self._refresh, args=(stale,), daemon=True).start()
+        if missing:
+            values.update(self._fetch(missing))
+        return values
+
+    def _refresh(self, secret_ids):
+        try:
+            self._fetch(secret_ids)
+        except Exception:
+            logger.warning("Refresh of secrets failed, cached values are kept",
+                           exc_info=True)
+        finally:
+            with self._lock:
+                self._refreshing.difference_update(secret_ids)
+
+    def _fetch(self, secret_ids):
+        client = self.client
+        if hasattr(client, "batch_get_secret_value"):
+            values = {}
+            for i in range(0, len(secret_ids), BATCH_SIZE):
+                values.update(self._fetch_batch(client, secret_ids[i:i + BATCH_SIZE]))
+        else:
+            with ThreadPoolExecutor(min(MAX_WORKERS, len(secret_ids))) as executor:
+                values = dict(zip(secret_ids, executor.map(
+                    lambda secret_id: client.get_secret_value(
+                        SecretId=secret_id)["SecretString"],
+                    secret_ids)))
+
+        fetched_at = time.monotonic()
+        with self._lock:
+            for secret_id, value in values.items():
+                self._values[secret_id] = (value, fetched_at)
+        return values
+
+    @staticmethod
+    def _fetch_batch(client, secret_ids):
+        response = client.batch_get_secret_value(SecretIdList=secret_ids)
+        if response.get("Errors"):
+            error = response["Errors"][0]
+            raise RuntimeError(
+                f"Secret {error['SecretId']} is not resolved: "
+                f"{error['ErrorCode']} {error.get('Message', '')}")
+        values = {}
+        for secret in response["SecretValues"]:
+            # Secret is requested by ARN or by name
+            secret_id = secret["ARN"] if secret["ARN"] in secret_ids else secret["Name"]
+            values[secret_id] = secret["SecretString"]
+        return values
+
+
+_default = SecretCache()
+
+
+def get_many(secret_ids):
+    """This function returns {secret_id: value} from the cache shared
+       by invocations of the execution environment"""
+
+    return _default.get_many(secret_ids)
+
+
+def resolve_env(names):
+    """This function returns {name: value} of secrets, whose ARNs
+       are in environment variables with the names"""
+
+    secret_ids = {name: os.environ[name] for name in names}
+    values = get_many(list(secret_ids.values()))
+    return {name: values[secret_id] for name, secret_id in secret_ids.items()}
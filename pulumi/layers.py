@@ -0,0 +1,495 @@
+from pulumi import ResourceOptions, StackReference, export
+import pulumi_random as random
+import vpc as vpc_module
+import iam as iam_module
+import security_groups as security_groups_module
+import ec2 as ec2_module
+import vpc_endpoints as vpc_endpoints_module
+import rds as rds_module
+import rds_proxy as rds_proxy_module
+import secrets_manager as secrets_manager_module
+import cache as cache_module
+import lambda_functions
+import api_gateway as api_gateway_module
+import s3 as s3_module
+import workers as workers_module
+import ecs as ecs_module
+import presets
+import invokes
+import ami_lock
+import ec2_profiles
+import rds_parameters
+import db_snapshot
+
+# Layers in the order of deployment and layers each of them references
+LAYERS = {
+    "network": [],
+    "data": ["network"],
+    "compute": ["network", "data"],
+    "storage": ["network", "compute"],
+}
+
+
+def network(data):
+    """This function creates network layer: VPC, security groups
+       and VPC endpoints, and returns its outputs"""
+
+    project_name_underscores = data["project_name"].replace("-", "_")
+
+    random_suffix = random.RandomString(
+        "random",
+        length=8,
+        upper=False,
+        special=False
+    )
+
+    vpc = vpc_module.Vpc(
+        "vpc",
+        vpc_module.VpcArgs(
+            region=data["region"],
+            flow_log_cloudwatch_log_group_name_prefix=data[
+                "flow_log_cloudwatch_log_group_name_prefix"
+            ],
+            flow_log_destination_type=data["flow_log_destination_type"],
+            flow_log_max_aggregation_interval=data[
+                "flow_log_max_aggregation_interval"
+            ],
+            flow_log_traffic_type=data["flow_log_traffic_type"],
+            flow_log_log_format=data["flow_log_log_format"],
+            flow_log_cloudwatch_log_group_retention_in_days=data[
+                "flow_log_cloudwatch_log_group_retention_in_days"
+            ],
+            flow_log_cloudwatch_log_group_kms_key_id=data[
+                "flow_log_cloudwatch_log_group_kms_key_id"
+            ],
+            create_db_subnets=data["create_db_subnets"],
+            enable_dns_support=data["enable_dns_support"],
+            enable_dns_hostnames=data["enable_dns_hostnames"],
+            vpc_cidr_block=data["vpc_cidr_block"],
+            public_subnets_cidr=data["public_subnets_cidr"],
+            db_subnets_cidr=data["db_subnets_cidr"],
+            name_suffix=random_suffix.result
+        ),
+    )
+
+    security_groups = security_groups_module.SecurityGroups(
+        "security_groups",
+        security_groups_module.SecurityGroupsArgs(
+            region=data["region"],
+            billing_code=data["billing_code"],
+            project_name_underscores=project_name_underscores,
+            vpc_id=vpc.monitoring_deployment_vpc.id,
+            ingress_ec2_rule_ports=data["ingress_ec2_rule_ports"],
+            egress_ec2_rule_ports=data["egress_ec2_rule_ports"],
+            rule_cidr_blocks=data["rule_cidr_blocks"]
+        ),
+    )
+
+    vpc_endpoints = vpc_endpoints_module.VpcEndpoints(
+        "vpc_endpoints",
+        vpc_endpoints_module.VpcEndpointsArgs(
+            region=data["region"],
+            project_name=data["project_name"],
+            vpc_id=vpc.monitoring_deployment_vpc.id,
+            ec2_security_group_id=security_groups.ec2_security_group.id,
+            ec2_instance_subnet_id=vpc.ec2_subnet_id.results[0],
+            aws_public_route_table_id=vpc.public_route_table.id,
+            # ECS cluster is created by compute layer with the same key
+            logs_endpoint=bool(data.get("fargate_tasks")),
+        ),
+    )
+
+    return {
+        "name_suffix": random_suffix.result,
+        "vpc_id": vpc.monitoring_deployment_vpc.id,
+        "ec2_subnet_id": vpc.ec2_subnet_id.results[0],
+        "db_subnet_group_name": vpc.default_subnet_group.name,
+        "db_subnet_ids": vpc.default_subnet_group.subnet_ids,
+        "ec2_security_group_id": security_groups.ec2_security_group.id,
+        "db_security_group_id": security_groups.db_security_group.id,
+        "s3_endpoint_id": vpc_endpoints.s3_endpoint.id,
+    }
+
+
+def database(data, network):
+    """This function creates data layer: RDS instance and secrets
+       with its credentials, and returns its outputs"""
+
+    project_name_underscores = data["project_name"].replace("-", "_")
+
+    monitoring_role_arn = None
+    rds_opts = None
+    if data.get("db_monitoring_interval"):
+        rds_monitoring_iam = iam_module.RdsMonitoringIam(
+            "rds_monitoring_iam",
+            iam_module.RdsMonitoringIamArgs(
+                project_name_underscores=project_name_underscores,
+                name_suffix=network["name_suffix"],
+            ),
+        )
+        monitoring_role_arn = rds_monitoring_iam.rds_monitoring_role.arn
+        rds_opts = ResourceOptions(
+            depends_on=[rds_monitoring_iam.rds_monitoring])
+
+    rds = rds_module.Rds(
+        "rds",
+        rds_module.RdsArgs(
+            region=data["region"],
+            billing_code=data["billing_code"],
+            project_name=data["project_name"],
+            project_name_underscores=project_name_underscores,
+            db_instance_type=data["db_instance_type"],
+            db_subnet_group_name=network["db_subnet_group_name"],
+            db_security_group_id=network["db_security_group_id"],
+            db_username=data["db_username"],
+            name_suffix=network["name_suffix"],
+            storage_profile=rds_module.storage_profile(
+                data["db_instance_type"], data.get("db_storage")),
+            read_replica_count=data.get("db_read_replicas", 0),
+            vpc_id=network["vpc_id"],
+            db_subnet_ids=network["db_subnet_ids"],
+            parameters=rds_parameters.compute(
+                data["db_instance_type"], data.get("db_parameters")),
+            performance_insights=data.get("db_performance_insights", False),
+            performance_insights_retention=data.get(
+                "db_performance_insights_retention", 7),
+            performance_insights_kms_key_id=data.get(
+                "db_performance_insights_kms_key_id"),
+            monitoring_interval=data.get("db_monitoring_interval", 0),
+            monitoring_role_arn=monitoring_role_arn,
+            engine_mode=data.get("db_engine_mode", rds_module.INSTANCE),
+            serverless_capacity=rds_module.serverless_capacity(
+                data.get("db_serverless_min_capacity",
+                         rds_module.DEFAULT_SERVERLESS_CAPACITY["min_capacity"]),
+                data.get("db_serverless_max_capacity",
+                         rds_module.DEFAULT_SERVERLESS_CAPACITY["max_capacity"])),
+            snapshot_identifier=db_snapshot.snapshot_identifier(
+                data.get("db_snapshot")),
+        ),
+        opts=rds_opts,
+    )
+
+    cache_address = None
+    if data.get("api_cache"):
+        cache = cache_module.Cache(
+            "cache",
+            cache_module.CacheArgs(
+                billing_code=data["billing_code"],
+                project_name_underscores=project_name_underscores,
+                name_suffix=network["name_suffix"],
+                vpc_id=network["vpc_id"],
+                db_subnet_ids=network["db_subnet_ids"],
+                ec2_security_group_id=network["ec2_security_group_id"],
+                node_type=data.get("api_cache_node_type", "cache.t3.micro"),
+                replica_count=data.get("api_cache_replicas", 0),
+            ),
+        )
+        cache_address = cache.address
+
+    db_secrets_manager = secrets_manager_module.DBSecretsManager(
+        "db_secrets_manager",
+        secrets_manager_module.DBSecretsManagerArgs(
+            billing_code=data["billing_code"],
+            project_name=data["project_name"],
+            db_username=data["db_username"],
+            db_password_result=rds.db_password.result,
+            address=rds.default.address,
+            reader_address=rds.reader_address,
+            cache_address=cache_address,
+            credentials=data.get("db_proxy", False),
+        ),
+    )
+
+    outputs = {}
+    if data.get("db_proxy"):
+        rds_proxy = rds_proxy_module.RdsProxy(
+            "rds_proxy",
+            rds_proxy_module.RdsProxyArgs(
+                billing_code=data["billing_code"],
+                project_name=data["project_name"],
+                project_name_underscores=project_name_underscores,
+                name_suffix=network["name_suffix"],
+                db_instance_identifier=rds.default.identifier,
+                db_cluster_identifier=rds.cluster.cluster_identifier
+                if rds.cluster else None,
+                db_subnet_ids=network["db_subnet_ids"],
+                db_security_group_id=network["db_security_group_id"],
+                db_credentials_secret_arn=db_secrets_manager.db_credentials_secret.arn,
+                pool=data.get("db_proxy_pool"),
+            ),
+        )
+        outputs["db_proxy_endpoint"] = rds_proxy.proxy.endpoint
+        outputs["db_proxy_address_secret_arn"] = \
+            rds_proxy.db_proxy_address_secret.arn
+    if db_secrets_manager.db_cache_address_secret:
+        outputs["db_cache_address_secret_arn"] = \
+            db_secrets_manager.db_cache_address_secret.arn
+    if rds.performance_insights_arn:
+        outputs["db_performance_insights_arn"] = rds.performance_insights_arn
+    if rds.enhanced_monitoring_arn:
+        outputs["db_enhanced_monitoring_arn"] = rds.enhanced_monitoring_arn
+
+    return {
+        **outputs,
+        "db_identifier": rds.default.identifier,
+        "db_address": rds.default.address,
+        "db_username": rds.default.username,
+        "db_name": rds_module.AIRFLOW_DB_NAME,
+        "db_password": rds.db_password.result,
+        "db_username_secret_arn": db_secrets_manager.db_username_secret.arn,
+        "db_password_secret_arn": db_secrets_manager.db_password_secret.arn,
+        "db_address_secret_arn": db_secrets_manager.db_address_secret.arn,
+        "db_reader_address": rds.reader_address,
+        "db_reader_address_secret_arn":
+            db_secrets_manager.db_reader_address_secret.arn,
+    }
+
+
+def compute(data, network, database):
+    """This function creates compute layer: IAM roles, lambda functions
+       with API Gateway and Airflow EC2 instance, and returns its outputs"""
+
+    project_name_underscores = data["project_name"].replace("-", "_")
+
+    presets.create_repo_and_add_deploy_key(
+        data["region"],
+        data["project_name"],
+        data["path_for_keypair"])
+
+    iam = iam_module.Iam(
+        "iam",
+        iam_module.IamArgs(
+            region=data["region"],
+            aws_account_id=invokes.get_account_id(),
+            project_name_underscores=project_name_underscores,
+            name_suffix=network["name_suffix"]
+        ),
+    )
+
+    outputs = {}
+    default_rest_api_id = ""
+    if data["create_lambda_and_apigateway"] is True:
+        db_address_secret_arn = database["db_address_secret_arn"]
+        db_reader_address_secret_arn = database["db_reader_address_secret_arn"]
+        if data.get("db_proxy"):
+            # Lambdas connect through RDS Proxy, which pools connections,
+            # reads go to the proxy too, unless there are read replicas
+            db_address_secret_arn = database["db_proxy_address_secret_arn"]
+            if not data.get("db_read_replicas"):
+                db_reader_address_secret_arn = db_address_secret_arn
+        cache_address_secret_arn = None
+        if data.get("api_cache"):
+            cache_address_secret_arn = database["db_cache_address_secret_arn"]
+
+        lambdas = lambda_functions.Lambda(
+            "lambda",
+            lambda_functions.LambdaArgs(
+                billing_code=data["billing_code"],
+                ec2_security_group_id=network["ec2_security_group_id"],
+                project_name_underscores=project_name_underscores,
+                db_username_secret_arn=database["db_username_secret_arn"],
+                db_password_secret_arn=database["db_password_secret_arn"],
+                db_address_secret_arn=db_address_secret_arn,
+                lambda_exec_arn=iam.lambda_exec.arn,
+                ec2_subnet_id=network["ec2_subnet_id"],
+                db_reader_address_secret_arn=db_reader_address_secret_arn,
+                cache_address_secret_arn=cache_address_secret_arn,
+                cache_ttl=data.get("api_cache_ttl", 60),
+                publish=data.get("lambda_publish", False),
+                provisioned_concurrency=data.get("lambda_provisioned_concurrency"),
+                provisioned_concurrency_schedule=data.get(
+                    "lambda_provisioned_concurrency_schedule"),
+                tuning=data.get("lambda_tuning"),
+            ),
+            opts=ResourceOptions(depends_on=[iam.lambda_vpc_access]),
+        )
+
+        api_gateway = api_gateway_module.ApiGateway(
+            "api_gateway",
+            api_gateway_module.ApiGatewayArgs(
+                project_name_underscores=project_name_underscores,
+                lambda_get_function_name=lambdas.get_target_name,
+                lambda_post_function_name=lambdas.post_target_name,
+                lambda_get_function_invoke_arn=lambdas.get_target.invoke_arn,
+                lambda_post_function_invoke_arn=lambdas.post_target.invoke_arn
+            ),
+        )
+        default_rest_api_id = api_gateway.default_rest_api.id
+        outputs["api_gateway_url"] = api_gateway.default_deployment.invoke_url
+
+    golden_ami = None
+    if data.get("golden_ami"):
+        golden_ami = ami_lock.catalog_entry(data["golden_ami"], data["region"])
+
+    celery_broker_url = None
+    if data.get("airflow_worker_count"):
+        workers = workers_module.Workers(
+            "workers",
+            workers_module.WorkersArgs(
+                region=data["region"],
+                billing_code=data["billing_code"],
+                project_name_underscores=project_name_underscores,
+                name_suffix=network["name_suffix"],
+                vpc_id=network["vpc_id"],
+                ec2_subnet_id=network["ec2_subnet_id"],
+                broker_subnet_ids=network["db_subnet_ids"],
+                ec2_security_group_id=network["ec2_security_group_id"],
+                db_address=database["db_address"],
+                db_username=database["db_username"],
+                db_password_secret_arn=database["db_password_secret_arn"],
+                db_name=database["db_name"],
+                worker_count=data["airflow_worker_count"],
+                worker_max_count=data.get(
+                    "airflow_worker_max_count", data["airflow_worker_count"]),
+                worker_instance_type=data.get(
+                    "airflow_worker_instance_type", data["ec2_instance_type"]),
+                repo_deploy_key=data["repo_deploy_key"],
+                golden_ami=golden_ami,
+                broker_node_type=data.get(
+                    "airflow_broker_node_type", "cache.t3.micro"),
+            ),
+        )
+        celery_broker_url = workers.broker_url
+        outputs["worker_group_name"] = workers.group.name
+
+    if data.get("fargate_tasks"):
+        ecs = ecs_module.Ecs(
+            "ecs",
+            ecs_module.EcsArgs(
+                region=data["region"],
+                billing_code=data["billing_code"],
+                project_name_underscores=project_name_underscores,
+                ec2_subnet_id=network["ec2_subnet_id"],
+                ec2_security_group_id=network["ec2_security_group_id"],
+                ec2_role_name=iam.ec2_role.name,
+                tasks=data["fargate_tasks"],
+                use_spot=data.get("fargate_spot", False),
+            ),
+        )
+        outputs["ecs_cluster_name"] = ecs.cluster.name
+        outputs["pipeline_repository_url"] = ecs.repository.repository_url
+        outputs["ecs_network_configuration"] = ecs.network_configuration
+
+    ec2 = ec2_module.Ec2(
+        "ec2",
+        ec2_module.Ec2Args(
+            region=data["region"],
+            billing_code=data["billing_code"],
+            project_name_underscores=project_name_underscores,
+            vpc_id=network["vpc_id"],
+            aws_account_id=invokes.get_account_id(),
+            repo_deploy_key=data["repo_deploy_key"],
+            ec2_instance_type=data["ec2_instance_type"],
+            ec2_security_group_id=network["ec2_security_group_id"],
+            ec2_role_name=iam.ec2_role.name,
+            ec2_subnet_id=network["ec2_subnet_id"],
+            iam_instance_profile_name=iam.default.name,
+            default_rest_api_id=default_rest_api_id,
+            compress_user_data=data.get("compress_user_data", False),
+            golden_ami=golden_ami,
+            celery_broker_url=celery_broker_url,
+            performance_profile=ec2_profiles.resolve(
+                data.get("ec2_profile", ec2_profiles.DEFAULT_PROFILE),
+                data["ec2_instance_type"],
+                data.get("ec2_volumes"),
+            ),
+            user_data_updates=data.get("ec2_user_data_updates", False),
+        ),
+    )
+
+    return {
+        **outputs,
+        "ec2_public_ip": ec2.default.public_ip,
+        "ec2_ami": ec2.ami,
+        "ec2_role_arn": iam.ec2_role.arn,
+        "airflow_password": ec2.airflow_pass.result,
+    }
+
+
+def storage(data, network, compute):
+    """This function creates storage layer: S3 buckets and secrets
+       for Airflow, and returns its outputs"""
+
+    project_name_underscores = data["project_name"].replace("-", "_")
+
+    s3_airflow_logs_bucket = s3_module.S3(
+        "airflow_logs_bucket",
+        s3_module.S3Args(
+            billing_code=data["billing_code"],
+            project_name=project_name_underscores,
+            admin_list=["pulumi-github"],
+            vpc_endpoint_id=network["s3_endpoint_id"],
+            ec2_role_arn=compute["ec2_role_arn"],
+            bucket_name="airflow-logs",
+            name_suffix=network["name_suffix"],
+        ),
+    )
+
+    s3_datalake_bucket = s3_module.S3(
+        "datalake_bucket",
+        s3_module.S3Args(
+            billing_code=data["billing_code"],
+            project_name=project_name_underscores,
+            admin_list=["pulumi-github"],
+            vpc_endpoint_id=network["s3_endpoint_id"],
+            ec2_role_arn=compute["ec2_role_arn"],
+            bucket_name="datalake",
+            name_suffix=network["name_suffix"],
+        ),
+    )
+
+    secrets_manager = secrets_manager_module.SecretsManager(
+        "secrets_manager",
+        secrets_manager_module.SecretsManagerArgs(
+            billing_code=data["billing_code"],
+            project_name=data["project_name"],
+            project_name_underscores=project_name_underscores,
+            airflow_pass_result=compute["airflow_password"],
+            airflow_bucket_name=s3_airflow_logs_bucket.bucket.id,
+            datalake_bucket_name=s3_datalake_bucket.bucket.id,
+        ),
+    )
+
+    return {
+        "airflow_logs_bucket": s3_airflow_logs_bucket.bucket.id,
+        "datalake_bucket": s3_datalake_bucket.bucket.id,
+        "airflow_logs_bucket_secret_arn": secrets_manager.airflow_logs_bucket_secret.arn,
+        "datalake_bucket_secret_arn": secrets_manager.data_lake_bucket_secret.arn,
+        "airflow_user_secret_arn": secrets_manager.airflow_user_secret.arn,
+    }
+
+
+class _References:
+    """Create class _References, which gives access to outputs
+       of another layer stack in the same way as to a dict"""
+
+    def __init__(self, stack_name):
+        self.stack = StackReference(stack_name)
+
+    def __getitem__(self, key):
+        return self.stack.get_output(key)
+
+
+def run(layer, data):
+    """This function creates only one layer of the program, outputs
+       of the layers it depends on are taken with StackReferences.
+       Stacks of the layers are set in `layer_stacks` config, e.g.
+       {"network": "network-dev", "data": "data-dev"}"""
+
+    if layer not in LAYERS:
+        raise SystemExit(f"Error: unknown layer '{layer}', "
+                         f"expected one of: {', '.join(LAYERS)}")
+
+    references = [
+        _References(data["layer_stacks"][name]) for name in LAYERS[layer]
+    ]
+    builders = {
+        "network": network,
+        "data": database,
+        "compute": compute,
+        "storage": storage,
+    }
+    outputs = builders[layer](data, *references)
+    for key, value in outputs.items():
+        export(key, value)
+    return outputs
@@ -0,0 +1,173 @@
+from pulumi.x import automation as auto
+import argparse
+import concurrent.futures
+import fnmatch
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+WORK_DIR = os.path.dirname(os.path.abspath(__file__))
+OPERATIONS = ("preview", "up", "destroy")
+
+# Entries of PULUMI_HOME shared by all workers: plugin cache and
+# backend credentials. Everything else (e.g. the selected stack)
+# is kept per worker, so workers don't select stacks for each other
+SHARED_HOME_ENTRIES = ("plugins", "credentials.json")
+# Hash of requirements.txt the virtualenv was installed from
+VENV_STAMP = ".requirements.sha256"
+
+
+def shared_pulumi_home():
+    return os.environ.get("PULUMI_HOME", os.path.expanduser("~/.pulumi"))
+
+
+def discover_stacks(patterns):
+    """This function returns names of stacks of the project,
+       that match any of the glob patterns (e.g. dev-*)"""
+
+    workspace = auto.LocalWorkspace(work_dir=WORK_DIR)
+    return sorted(
+        summary.name for summary in workspace.list_stacks()
+        if any(fnmatch.fnmatch(summary.name, pattern) for pattern in patterns)
+    )
+
+
+def prepare():
+    """This function creates the virtualenv from Pulumi.yaml and installs
+       plugins of the project once, before workers start, so workers
+       don't race to create them. The virtualenv is recreated, when
+       requirements.txt is changed since it was installed"""
+
+    venv = os.path.join(WORK_DIR, "venv")
+    requirements = os.path.join(WORK_DIR, "requirements.txt")
+    with open(requirements, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    stamp = os.path.join(venv, VENV_STAMP)
+    installed = None
+    if os.path.exists(stamp):
+        with open(stamp) as f:
+            installed = f.read().strip()
+    if installed != digest:
+        # --clear drops packages of the previous requirements
+        subprocess.run([sys.executable, "-m", "venv", "--clear", venv], check=True)
+        subprocess.run(
+            [os.path.join(venv, "bin", "pip"), "install", "-r", requirements],
+            check=True)
+        with open(stamp, "w") as f:
+            f.write(digest)
+    subprocess.run(["pulumi", "plugin", "install"], cwd=WORK_DIR, check=True)
+
+
+def _worker_home(stack_name):
+    home = tempfile.mkdtemp(prefix=f"pulumi-home-{stack_name}-")
+    shared = shared_pulumi_home()
+    for entry in SHARED_HOME_ENTRIES:
+        if os.path.exists(os.path.join(shared, entry)):
+            os.symlink(os.path.join(shared, entry), os.path.join(home, entry))
+    return home
+
+
+def run_stack(stack_name, operation, log_dir):
+    """This function runs the operation on one stack in a worker process
+       and returns its summary. Output of the operation is written
+       to <log_dir>/<stack>.<operation>.log"""
+
+    started = time.time()
+    log_path = os.path.join(log_dir, f"{stack_name}.{operation}.log")
+    result = {
+        "stack": stack_name,
+        "operation": operation,
+        "status": "succeeded",
+        "changes": {},
+        "log": log_path,
+        "error": None,
+    }
+    home = _worker_home(stack_name)
+    try:
+        with open(log_path, "w") as log:
+            def on_output(line):
+                log.write(f"{line}\n")
+                log.flush()
+
+            workspace = auto.LocalWorkspace(work_dir=WORK_DIR, pulumi_home=home)
+            stack = auto.Stack.select(stack_name, workspace)
+            if operation == "preview":
+                result["changes"] = stack.preview(on_output=on_output).change_summary
+            else:
+                summary = getattr(stack, operation)(on_output=on_output).summary
+                result["changes"] = summary.resource_changes or {}
+    except Exception as exn:  # pylint: disable=broad-except
+        result["status"] = "failed"
+        result["error"] = str(exn).strip().splitlines()[-1] if str(exn) else repr(exn)
+    finally:
+        shutil.rmtree(home, ignore_errors=True)
+    result["seconds"] = round(time.time() - started, 1)
+    return result
+
+
+def _format(result):
+    changes = ", ".join(
+        f"{op}={count}" for op, count in sorted(result["changes"].items())
+        if op != "same" and count) or "no changes"
+    line = (f"{result['stack']:24} {result['operation']:8} "
+            f"{result['status']:9} {result['seconds']:7}s  {changes}")
+    if result["error"]:
+        line += f"\n{'':24} {result['error']} (see {result['log']})"
+    return line
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run preview/up/destroy across many stacks in parallel")
+    parser.add_argument("operation", choices=OPERATIONS)
+    parser.add_argument("stacks", nargs="*", default=["dev-*"],
+                        help="stack names or glob patterns, default is dev-*")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="maximum number of stacks processed at once")
+    parser.add_argument("--log-dir", default="orchestrator-logs")
+    parser.add_argument("--report", help="save summary report to JSON file")
+    parser.add_argument("--yes", action="store_true",
+                        help="don't ask for confirmation of destroy")
+    options = parser.parse_args()
+
+    stacks = discover_stacks(options.stacks)
+    if not stacks:
+        sys.exit(f"No stacks match {' '.join(options.stacks)}")
+    if options.operation == "destroy" and not options.yes:
+        answer = input(f"Destroy {', '.join(stacks)}? [y/N] ")
+        if answer.lower() != "y":
+            sys.exit(1)
+
+    os.makedirs(options.log_dir, exist_ok=True)
+    log_dir = os.path.abspath(options.log_dir)
+    prepare()
+
+    started = time.time()
+    results = []
+    print(f"{options.operation} of {len(stacks)} stacks, {options.workers} workers")
+    with concurrent.futures.ProcessPoolExecutor(options.workers) as pool:
+        futures = [
+            pool.submit(run_stack, stack, options.operation, log_dir)
+            for stack in stacks
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            results.append(future.result())
+            print(_format(results[-1]), flush=True)
+
+    failed = [result for result in results if result["status"] == "failed"]
+    print(f"{len(results) - len(failed)} succeeded, {len(failed)} failed "
+          f"in {time.time() - started:.1f}s")
+    if options.report:
+        with open(options.report, "w") as f:
+            json.dump(sorted(results, key=lambda r: r["stack"]), f, indent=2)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
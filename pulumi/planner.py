@@ -0,0 +1,356 @@
+import argparse
+import ast
+import json
+import os
+import subprocess
+import yaml
+import depgraph
+
+PROGRAM = "layers.py"
+MAIN = "__main__.py"
+
+# Types of resources, which are created directly in the program,
+# all other nodes are ComponentResources of this project
+RESOURCE_TYPES = {
+    "RandomString": "random:index/randomString:RandomString",
+}
+
+# Calls of the program, which only validate config and create no
+# resources, keys read only in them don't affect any resource. Keys of
+# other bare calls (presets.create_repo_and_add_deploy_key creates
+# the GitHub repository and deploy key) need full update
+CHECK_CALLS = {"presets.checks"}
+
+# Control key of helpers, which take the whole config object: keys
+# they read are not known, so any change needs full update
+ALL_KEYS = "*"
+
+# Functions of layers.py, which create each layer of micro-stack layout
+LAYER_FUNCTIONS = {
+    "network": "network",
+    "data": "database",
+    "compute": "compute",
+    "storage": "storage",
+}
+
+
+def load_data(path=None, stack=None, ref=None):
+    """This function returns `project:data` config object either from
+       the stack file or from Pulumi.<stack>.yaml at git ref"""
+
+    if ref:
+        directory = os.path.relpath(
+            os.path.dirname(os.path.abspath(__file__)),
+            subprocess.run(["git", "rev-parse", "--show-toplevel"],
+                           capture_output=True, text=True,
+                           check=True).stdout.strip())
+        text = subprocess.run(
+            ["git", "show", f"{ref}:{directory}/Pulumi.{stack}.yaml"],
+            capture_output=True, text=True, check=True).stdout
+    else:
+        with open(path or f"Pulumi.{stack}.yaml") as f:
+            text = f.read()
+    return (yaml.safe_load(text).get("config") or {}).get("project:data") or {}
+
+
+def changed_keys(old, new):
+    """This function returns sorted keys, which are added, removed
+       or have different values in the new config object"""
+
+    return sorted(
+        key for key in set(old) | set(new) if old.get(key) != new.get(key))
+
+
+def _data_keys(node, aliases):
+    """This function returns keys of the config object read in the
+       AST node, directly (data["key"], data.get("key")) or through
+       local variables the values are taken from"""
+
+    keys = set()
+    for child in ast.walk(node):
+        if (isinstance(child, ast.Subscript)
+                and isinstance(child.value, ast.Name)
+                and child.value.id == "data"
+                and isinstance(child.slice, ast.Constant)):
+            keys.add(child.slice.value)
+        elif (isinstance(child, ast.Call)
+                and isinstance(child.func, ast.Attribute)
+                and isinstance(child.func.value, ast.Name)
+                and child.func.value.id == "data"
+                and child.func.attr == "get"
+                and child.args
+                and isinstance(child.args[0], ast.Constant)):
+            keys.add(child.args[0].value)
+        elif isinstance(child, ast.Name) and child.id in aliases:
+            keys |= aliases[child.id]
+    return keys
+
+
+def _call_name(node):
+    """This function returns dotted name of the called function,
+       e.g. presets.checks, or None if node is not such a call"""
+
+    if not isinstance(node, ast.Call):
+        return None
+    parts = []
+    func = node.func
+    while isinstance(func, ast.Attribute):
+        parts.insert(0, func.attr)
+        func = func.value
+    if not isinstance(func, ast.Name):
+        return None
+    return ".".join([func.id] + parts)
+
+
+def _passes_data(tree, functions):
+    """This function returns True, if the AST tree passes the whole
+       config object to a call of a function, which is not one of
+       the layer functions of the program. Calls by subscript
+       (builders[layer](data, ...)) dispatch to the layer functions"""
+
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Call):
+            continue
+        name = _call_name(node)
+        if name is None or name.split(".")[-1] in functions:
+            continue
+        values = list(node.args) + [keyword.value for keyword in node.keywords]
+        if any(isinstance(value, ast.Name) and value.id == "data"
+               for value in values):
+            return True
+    return False
+
+
+def config_readers(program_source, main_source=""):
+    """This function returns (readers, control, layers):
+       - readers - dict of config key to names of components,
+         whose Args are built from it
+       - control - config keys, which change the structure of the
+         program (used in conditions, to select layer stacks etc.),
+         changing them needs full update
+       - layers - dict of component name to the function of
+         layers.py it is created in
+       Keys read only in CHECK_CALLS (presets.checks()) are in neither,
+       such calls only validate config and create no resources. Keys
+       of other bare calls are control keys, as the calls create
+       resources which are not components. Control has ALL_KEYS, when
+       the whole config object is passed to a helper"""
+
+    readers = {}
+    control = set()
+    referenced = set()
+    calls = set()
+    layers = {}
+    layer_functions = {
+        node.name for node in ast.parse(program_source).body
+        if isinstance(node, ast.FunctionDef)}
+    for source in (program_source, main_source):
+        tree = ast.parse(source)
+        referenced |= _data_keys(tree, {})
+        if _passes_data(tree, layer_functions):
+            control.add(ALL_KEYS)
+        functions = [None] + [
+            node for node in tree.body if isinstance(node, ast.FunctionDef)]
+        for function in functions:
+            aliases = {}
+            body = function.body if function else [
+                node for node in tree.body
+                if not isinstance(node, ast.FunctionDef)]
+            statements = sorted(
+                (stmt for node in body for stmt in ast.walk(node)
+                 if isinstance(stmt, ast.stmt)),
+                key=lambda stmt: stmt.lineno)
+            for stmt in statements:
+                if isinstance(stmt, (ast.If, ast.While)):
+                    control |= _data_keys(stmt.test, aliases)
+                elif isinstance(stmt, ast.Expr):
+                    if _call_name(stmt.value) in CHECK_CALLS:
+                        calls |= _data_keys(stmt.value, aliases)
+                    else:
+                        control |= _data_keys(stmt.value, aliases)
+                elif isinstance(stmt, ast.Assign) \
+                        and isinstance(stmt.targets[0], ast.Name):
+                    name = stmt.targets[0].id
+                    keys = _data_keys(stmt.value, aliases)
+                    if depgraph._is_component_call(stmt.value):
+                        layers[name] = function.name if function else None
+                        for key in keys:
+                            readers.setdefault(key, set()).add(name)
+                    else:
+                        aliases.setdefault(name, set()).update(keys)
+    control |= referenced - set(readers) - calls
+    return readers, control, layers
+
+
+def dependents(graph, names):
+    """This function returns names of components, which take outputs
+       of any of the components, directly or through other components"""
+
+    def component(name):
+        return name.split(".")[0]
+
+    users = {}
+    for node in graph.values():
+        for dep in node.data | node.explicit:
+            users.setdefault(component(dep), set()).add(node.name)
+    seen = set()
+    stack = list(names)
+    while stack:
+        for user in users.get(stack.pop(), ()):
+            if user not in seen and user not in names:
+                seen.add(user)
+                stack.append(user)
+    return seen
+
+
+def urn(state, node):
+    """This function returns URN of the component in the exported
+       stack state, or None if the stack doesn't have it"""
+
+    type_ = RESOURCE_TYPES.get(node.kind, f"custom:resource:{node.kind}")
+    for resource in state.get("deployment", {}).get("resources") or []:
+        if (resource.get("type") == type_
+                and resource["urn"].endswith(f"::{node.resource_name}")):
+            return resource["urn"]
+    return None
+
+
+def descendants(state, urns):
+    """This function returns URNs of all resources of the exported
+       stack state, which are children of any of the URNs"""
+
+    children = {}
+    for resource in state.get("deployment", {}).get("resources") or []:
+        if resource.get("parent"):
+            children.setdefault(resource["parent"], []).append(resource["urn"])
+    found = []
+    stack = list(urns)
+    while stack:
+        for child in children.get(stack.pop(), ()):
+            found.append(child)
+            stack.append(child)
+    return found
+
+
+def plan(old, new, state):
+    """This function returns the plan of the update: changed keys,
+       components which read them, their dependents and --target list.
+       Targets are URNs of the components and all their child resources
+       in the exported state of the stack, components the stack doesn't
+       have are listed in `missing`. The plan has `full` set, when
+       targeted update can't be used"""
+
+    with open(PROGRAM) as f:
+        program_source = f.read()
+    main_source = ""
+    if os.path.exists(MAIN):
+        with open(MAIN) as f:
+            main_source = f.read()
+    graph = depgraph.build_graph(program_source)
+    readers, control, layers = config_readers(program_source, main_source)
+
+    keys = changed_keys(old, new)
+    if ALL_KEYS in control:
+        control = control | set(keys)
+    result = {
+        "changed": {key: sorted(readers.get(key, ())) for key in keys},
+        "full": sorted(set(keys) & control),
+        "unused": sorted(
+            key for key in keys if key not in readers and key not in control),
+        "components": [],
+        "dependents": [],
+        "missing": [],
+        "targets": [],
+    }
+    changed = {name for key in keys for name in readers.get(key, ())}
+    affected = dependents(graph, changed)
+    layer = new.get("layer")
+    if layer:
+        # Micro-stack layout: the stack has only components of the layer,
+        # other layers pick the change up with their own update
+        function = LAYER_FUNCTIONS.get(layer, layer)
+        changed = {name for name in changed if layers.get(name) == function}
+        affected = {name for name in affected if layers.get(name) == function}
+    result["components"] = sorted(changed)
+    result["dependents"] = sorted(affected)
+
+    targets = []
+    for name in sorted(changed | affected):
+        component_urn = urn(state, graph[name])
+        if component_urn:
+            targets.append(component_urn)
+        else:
+            result["missing"].append(name)
+    result["targets"] = targets + descendants(state, targets)
+    return result
+
+
+def command(result):
+    """This function returns `pulumi up` command for the plan"""
+
+    if result["full"]:
+        return "pulumi up"
+    if not result["targets"]:
+        return None
+    targets = " ".join(f"--target '{target}'" for target in result["targets"])
+    return f"pulumi up {targets} --target-dependents"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Plan targeted `pulumi up` from changes of project:data config")
+    parser.add_argument("--stack", default="dev")
+    parser.add_argument("--old", help="old stack file, default is "
+                        "Pulumi.<stack>.yaml at --old-ref")
+    parser.add_argument("--old-ref", default="HEAD",
+                        help="git ref with the old config, default is HEAD")
+    parser.add_argument("--new", help="new stack file, default is "
+                        "Pulumi.<stack>.yaml")
+    parser.add_argument("--state", help="output of `pulumi stack export`, "
+                        "it is exported from the stack if not set")
+    parser.add_argument("--json", action="store_true", help="print JSON plan")
+    options = parser.parse_args()
+
+    old = load_data(options.old, options.stack,
+                    None if options.old else options.old_ref)
+    new = load_data(options.new, options.stack)
+    # Targets are taken from the state, so that every child resource
+    # is targeted and components the stack doesn't have are not
+    if options.state:
+        with open(options.state) as f:
+            state = json.load(f)
+    else:
+        state = json.loads(subprocess.run(
+            ["pulumi", "stack", "export", "--stack", options.stack],
+            capture_output=True, text=True, check=True).stdout)
+
+    result = plan(old, new, state)
+    result["command"] = command(result)
+    if options.json:
+        print(json.dumps(result, indent=2))
+        return
+
+    if not result["changed"]:
+        print("No changes of project:data")
+        return
+    print("Changed keys:")
+    for key, names in result["changed"].items():
+        if key in result["full"]:
+            print(f"  {key} -> changes structure of the program")
+        else:
+            print(f"  {key} -> {', '.join(names) or 'not used by components'}")
+    if result["full"]:
+        print("Full update is required")
+    else:
+        print(f"Components: {', '.join(result['components']) or '-'}")
+        print(f"Dependents: {', '.join(result['dependents']) or '-'}")
+        if result["missing"]:
+            print(f"Not in the stack: {', '.join(result['missing'])}")
+    if result["command"]:
+        print(result["command"])
+    else:
+        print("No resources are affected")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,8 +5,28 @@ from pulumi_policy import (
     StackValidationArgs,
     StackValidationPolicy,
 )
+import json
+import os
 import re
 
+# Table of EC2 performance profiles, the program reads it from the pack
+EC2_PROFILES = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "ec2_profiles.json")
+
+
+def allowed_instance_types():
+    """
+    This function returns instance types allowed by any
+    EC2 performance profile of the program.
+    """
+    with open(EC2_PROFILES) as f:
+        profiles = json.load(f)
+    return sorted({
+        instance_type
+        for profile in profiles.values()
+        for instance_type in profile["instance_types"]
+    })
+
 
 def ec2_iam_profile_validator(
     args: ResourceValidationArgs, report_violation: ReportViolation
@@ -39,7 +59,7 @@ def ec2_instance_type_validator(
     instance type have expected value.
     """
     if args.resource_type == "aws:ec2/instance:Instance":
-        allowed_types = ["t2.small", "t2.medium", "t2.large"]
+        allowed_types = allowed_instance_types()
         if args.props["instanceType"] not in allowed_types:
             report_violation(
                 "You tried to set unexpected instance type: " +
@@ -0,0 +1,438 @@
+import argparse
+import importlib
+import json
+import math
+import os
+import resource
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+import zipfile
+
+WORK_DIR = os.path.dirname(os.path.abspath(__file__))
+CODE = os.path.join(WORK_DIR, "lambda_dummy.zip")
+LAYER = os.path.join(WORK_DIR, "lambda_layer", "python")
+
+# Handlers of lambda_functions.Lambda, lambda_functions is not imported
+# by the command, as it loads pulumi_aws
+HANDLERS = {
+    "get": "get_method.main_handler",
+    "post": "post_method.main_handler",
+}
+# Synthetic API Gateway proxy events, --event overrides them
+EVENTS = {
+    "get": {"httpMethod": "GET", "path": "/", "headers": {},
+            "queryStringParameters": None, "body": None},
+    "post": {"httpMethod": "POST", "path": "/", "headers": {},
+             "queryStringParameters": None, "body": "{}"},
+}
+
+# Lambda gives a function one full vCPU at 1769 MB, and a share of it
+# proportional to memory below that. Handlers are single-threaded,
+# so more memory doesn't make them faster
+FULL_VCPU_MEMORY = 1769
+MEMORY_SIZES = (128, 256, 512, 1024, 1769, 3008)
+# Price of GB-second of x86_64 in us-east-1. Functions run python3.7
+# runtime and are created with pulumi-aws 3.x, which support only x86_64
+PRICE = 0.0000166667
+# Memory left over peak RSS of the handler measured locally
+MEMORY_HEADROOM = 1.2
+# Period of CPU throttling of the handler process, seconds
+THROTTLE_PERIOD = 0.01
+
+# Without --live handlers call stubbed clients of Secrets Manager
+# (boto3), PostgreSQL (psycopg2) and Redis, which answer after
+# the latency in ms of the service seen from the VPC
+STUB_LATENCY = {"secretsmanager": 20, "postgres": 5, "redis": 1}
+# Environment of handlers with stubbed clients, secrets are fake
+STUB_SECRET_ARN = "arn:aws:secretsmanager:us-east-1:000000000000:secret:{}"
+STUB_ENVIRONMENT = {
+    "db_host": STUB_SECRET_ARN.format("db_host"),
+    "db_username": STUB_SECRET_ARN.format("db_username"),
+    "db_password": STUB_SECRET_ARN.format("db_password"),
+    "db_name": "production",
+    "db_port": "5432",
+    "cache_host": STUB_SECRET_ARN.format("cache_host"),
+    "cache_port": "6379",
+    "cache_ttl": "60",
+}
+
+
+def _extract(code, directory):
+    if os.path.isdir(code):
+        return code
+    with zipfile.ZipFile(code) as archive:
+        archive.extractall(directory)
+    return directory
+
+
+def _wait(latency):
+    time.sleep(latency / 1000)
+
+
+def _stub_modules(latency):
+    """This function returns stubbed boto3, psycopg2 and redis modules,
+       calls of their clients wait for `latency` of the service"""
+
+    class SecretsManager:
+        # python3.7 runtime has boto3 without BatchGetSecretValue,
+        # secrets_cache resolves secrets with concurrent calls
+        def get_secret_value(self, SecretId):
+            _wait(latency["secretsmanager"])
+            return {"ARN": SecretId, "Name": SecretId.rsplit(":", 1)[-1],
+                    "SecretString": f"stub-{SecretId.rsplit(':', 1)[-1]}"}
+
+    def client(service_name, **kwargs):
+        if service_name != "secretsmanager":
+            raise SystemExit(f"Error: {service_name} client is not stubbed, "
+                             f"run with --live")
+        return SecretsManager()
+
+    class Cursor:
+        rowcount = 0
+        description = None
+
+        def execute(self, query, params=None):
+            _wait(latency["postgres"])
+
+        def executemany(self, query, params_seq):
+            _wait(latency["postgres"])
+
+        def fetchone(self):
+            return None
+
+        def fetchall(self):
+            return []
+
+        def fetchmany(self, size=None):
+            return []
+
+        def close(self):
+            pass
+
+        def __iter__(self):
+            return iter([])
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+    class Connection(Cursor):
+        autocommit = False
+        closed = 0
+
+        def cursor(self, *args, **kwargs):
+            return Cursor()
+
+        def commit(self):
+            _wait(latency["postgres"])
+
+        def rollback(self):
+            pass
+
+    def connect(*args, **kwargs):
+        _wait(latency["postgres"])
+        return Connection()
+
+    class Redis:
+        def __init__(self, *args, **kwargs):
+            self._values = {}
+            self._lock = threading.Lock()
+
+        @classmethod
+        def from_url(cls, url, **kwargs):
+            return cls()
+
+        def get(self, key):
+            _wait(latency["redis"])
+            with self._lock:
+                return self._values.get(key)
+
+        def set(self, key, value, ex=None, **kwargs):
+            _wait(latency["redis"])
+            with self._lock:
+                self._values[key] = value if isinstance(value, bytes) \
+                    else str(value).encode()
+            return True
+
+        def setex(self, key, ttl, value):
+            return self.set(key, value, ex=ttl)
+
+        def delete(self, *keys):
+            _wait(latency["redis"])
+            with self._lock:
+                return sum(self._values.pop(key, None) is not None for key in keys)
+
+        def ping(self):
+            _wait(latency["redis"])
+            return True
+
+    errors = types.ModuleType("redis.exceptions")
+    errors.RedisError = type("RedisError", (Exception,), {})
+    errors.ConnectionError = type("ConnectionError", (errors.RedisError,), {})
+    errors.TimeoutError = type("TimeoutError", (errors.RedisError,), {})
+
+    modules = {
+        "boto3": types.ModuleType("boto3"),
+        "psycopg2": types.ModuleType("psycopg2"),
+        "redis": types.ModuleType("redis"),
+        "redis.exceptions": errors,
+    }
+    modules["boto3"].client = client
+    modules["psycopg2"].connect = connect
+    modules["psycopg2"].Error = type("Error", (Exception,), {})
+    modules["psycopg2"].OperationalError = type(
+        "OperationalError", (modules["psycopg2"].Error,), {})
+    modules["redis"].Redis = modules["redis"].StrictRedis = Redis
+    modules["redis"].from_url = Redis.from_url
+    modules["redis"].exceptions = errors
+    for name in ("RedisError", "ConnectionError", "TimeoutError"):
+        setattr(modules["redis"], name, getattr(errors, name))
+    return modules
+
+
+def _worker(code, handler, event, invocations, latency):
+    """Worker process: runs the handler with the event, like a warm
+       execution environment, and prints durations of invocations.
+       Clients are stubbed, unless latency is None (--live)"""
+
+    if latency is not None:
+        sys.modules.update(_stub_modules(latency))
+        os.environ.update(STUB_ENVIRONMENT)
+    sys.path[:0] = [code, LAYER]
+    module_name, function_name = handler.rsplit(".", 1)
+    function = getattr(importlib.import_module(module_name), function_name)
+    # The first invocation is not measured, it pays for imports
+    # and connections, as a cold start does
+    function(event, None)
+    durations = []
+    for _ in range(invocations):
+        started = time.perf_counter()
+        function(event, None)
+        durations.append((time.perf_counter() - started) * 1000)
+    print(json.dumps({
+        "durations": durations,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }))
+
+
+def run(code, handler, event, invocations, share, latency=None):
+    """This function runs the handler in a worker process, which gets
+       `share` of one CPU, and returns durations of its invocations
+       and peak memory. CPU is throttled by stopping the process
+       for the rest of every THROTTLE_PERIOD. Clients of the handler
+       are stubbed with latency of services, if it is set"""
+
+    process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--worker", code, handler,
+         json.dumps(event), str(invocations), json.dumps(latency)],
+        stdout=subprocess.PIPE, text=True)
+    if share < 1:
+        while process.poll() is None:
+            time.sleep(THROTTLE_PERIOD * share)
+            try:
+                process.send_signal(signal.SIGSTOP)
+                time.sleep(THROTTLE_PERIOD * (1 - share))
+                process.send_signal(signal.SIGCONT)
+            except ProcessLookupError:
+                break
+    stdout, _ = process.communicate()
+    if process.returncode:
+        raise SystemExit(f"Error: handler {handler} failed, "
+                         f"exit code {process.returncode}")
+    return json.loads(stdout.strip().splitlines()[-1])
+
+
+def fit(samples):
+    """This function fits duration = a + b * FULL_VCPU_MEMORY / memory
+       (memory is capped at FULL_VCPU_MEMORY) to [(memory, duration)]
+       with least squares: a is time spent waiting for I/O, b is time
+       of CPU work on one full vCPU. It returns a, b and R²"""
+
+    xs = [FULL_VCPU_MEMORY / min(memory, FULL_VCPU_MEMORY) for memory, _ in samples]
+    ys = [duration for _, duration in samples]
+    mean_x, mean_y = sum(xs) / len(xs), sum(ys) / len(ys)
+    variance = sum((x - mean_x) ** 2 for x in xs)
+    b = (sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / variance
+         if variance else 0.0)
+    a = mean_y - b * mean_x
+    total = sum((y - mean_y) ** 2 for y in ys)
+    residual = sum((y - a - b * x) ** 2 for x, y in zip(xs, ys))
+    return a, b, 1 - residual / total if total else 1.0
+
+
+def predict(model, memory):
+    a, b, _ = model
+    return max(a + b * FULL_VCPU_MEMORY / min(memory, FULL_VCPU_MEMORY), 0.0)
+
+
+def cost(memory, duration):
+    """This function returns cost of one invocation in USD,
+       duration is billed in 1 ms increments"""
+
+    return PRICE * memory / 1024 * math.ceil(duration) / 1000
+
+
+def tune(code, function, event, memory_sizes, invocations, latency=None):
+    """This function measures the handler of the function at every
+       memory size and returns rows with measured and fitted durations
+       and cost of invocation"""
+
+    handler = HANDLERS[function]
+    rows, samples, peaks = [], [], []
+    for memory in memory_sizes:
+        share = min(1.0, memory / FULL_VCPU_MEMORY)
+        result = run(code, handler, event, invocations, share, latency)
+        durations = sorted(result["durations"])
+        samples += [(memory, duration) for duration in durations]
+        peaks.append(result["max_rss_mb"])
+        rows.append({
+            "function": function,
+            "memory_size": memory,
+            "p50_ms": durations[len(durations) // 2],
+            "p90_ms": durations[int(len(durations) * 0.9)],
+        })
+    model = fit(samples)
+    min_memory = max(peaks) * MEMORY_HEADROOM
+    for row in rows:
+        row["fitted_ms"] = predict(model, row["memory_size"])
+        row["cost_usd"] = cost(row["memory_size"], row["fitted_ms"])
+        row["fits_memory"] = row["memory_size"] >= min_memory
+        row["r2"] = model[2]
+    return rows
+
+
+def recommend(rows, strategy, max_duration=None):
+    """This function returns the row of memory size with the lowest
+       cost (or duration for `speed` strategy), which has enough memory
+       and meets max_duration"""
+
+    candidates = [
+        row for row in rows
+        if row["fits_memory"]
+        and (max_duration is None or row["fitted_ms"] <= max_duration)
+    ]
+    if not candidates:
+        return None
+    if strategy == "speed":
+        return min(candidates, key=lambda row: (row["fitted_ms"], row["cost_usd"]))
+    return min(candidates, key=lambda row: (row["cost_usd"], row["fitted_ms"]))
+
+
+def _pulumi(*args):
+    return subprocess.run(
+        ["pulumi", *args], cwd=WORK_DIR, capture_output=True,
+        text=True, check=True).stdout.strip()
+
+
+def _pairs(values, option):
+    pairs = {}
+    for value in values or []:
+        function, _, path = value.partition("=")
+        if function not in HANDLERS or not path:
+            raise SystemExit(f"Error: {option} must be <get|post>=<path>")
+        pairs[function] = path
+    return pairs
+
+
+def _latency(values):
+    latency = {**STUB_LATENCY}
+    for value in values or []:
+        service, _, milliseconds = value.partition("=")
+        try:
+            latency[service] = float(milliseconds)
+        except ValueError:
+            service = None
+        if service not in STUB_LATENCY or latency[service] < 0:
+            raise SystemExit(f"Error: --latency must be "
+                             f"<{'|'.join(STUB_LATENCY)}>=<ms>")
+    return latency
+
+
+def main():
+    """Power tuning command. It runs handlers of lambda functions
+       locally at every memory size with stubbed clients (or real
+       ones with --live), fits their duration against memory and
+       recommends memory size of every function. With --stack
+       recommendations are written to `lambda_tuning` config,
+       which is passed to LambdaArgs"""
+
+    if len(sys.argv) > 1 and sys.argv[1] == "--worker":
+        code, handler, event, invocations, latency = sys.argv[2:]
+        _worker(code, handler, json.loads(event), int(invocations),
+                json.loads(latency))
+        return
+
+    parser = argparse.ArgumentParser(
+        description="Tune memory size of lambda functions")
+    parser.add_argument("functions", nargs="*",
+                        help="functions to tune (get, post), all by default")
+    parser.add_argument("--code", default=CODE,
+                        help="zip or folder with handlers, lambda_dummy.zip by default")
+    parser.add_argument("--event", action="append",
+                        help="<get|post>=<path to JSON event>")
+    parser.add_argument("--memory", type=int, nargs="+", default=MEMORY_SIZES)
+    parser.add_argument("--invocations", type=int, default=20)
+    parser.add_argument("--live", action="store_true",
+                        help="call real services with environment of handlers "
+                        "(db_host, db_username, ...), clients are stubbed by default")
+    parser.add_argument("--latency", action="append",
+                        help="<service>=<ms> latency of stubbed service, services: "
+                        + ", ".join(f"{service} ({ms} ms)"
+                                    for service, ms in STUB_LATENCY.items()))
+    parser.add_argument("--strategy", choices=["cost", "speed"], default="cost")
+    parser.add_argument("--max-duration", type=float,
+                        help="highest fitted duration in ms of recommendation")
+    parser.add_argument("--stack", help="write recommendations to the stack config")
+    options = parser.parse_args()
+
+    unknown = set(options.functions) - set(HANDLERS)
+    if unknown:
+        parser.error(f"unknown functions {', '.join(sorted(unknown))}, "
+                     f"choose from: {', '.join(HANDLERS)}")
+    if options.live and options.latency:
+        parser.error("--latency is set only for stubbed clients, not with --live")
+    latency = None if options.live else _latency(options.latency)
+    events = {**EVENTS}
+    for function, path in _pairs(options.event, "--event").items():
+        with open(path) as f:
+            events[function] = json.load(f)
+
+    with tempfile.TemporaryDirectory() as directory:
+        code = _extract(options.code, directory)
+        recommendations = {}
+        for function in options.functions or HANDLERS:
+            rows = tune(code, function, events[function], sorted(options.memory),
+                        options.invocations, latency)
+            best = recommend(rows, options.strategy, options.max_duration)
+            for row in rows:
+                print(f"{function:5} "
+                      f"{row['memory_size']:5} MB  p50 {row['p50_ms']:8.1f} ms  "
+                      f"p90 {row['p90_ms']:8.1f} ms  fitted {row['fitted_ms']:8.1f} ms  "
+                      f"${row['cost_usd'] * 1e6:8.3f}/1M"
+                      f"{'' if row['fits_memory'] else '  out of memory'}"
+                      f"{'  <-' if row is best else ''}")
+            print(f"{function:5} fit R² {rows[0]['r2']:.3f}")
+            if best is None:
+                raise SystemExit(f"Error: no memory size of {function} function "
+                                 f"meets the constraints")
+            recommendations[function] = {"memory_size": best["memory_size"]}
+
+    print(json.dumps(recommendations, indent=2, sort_keys=True))
+    if options.stack:
+        for function, settings in recommendations.items():
+            for key, value in settings.items():
+                _pulumi("config", "set", "--path",
+                        f"data.lambda_tuning.{function}.{key}", str(value),
+                        "--stack", options.stack)
+        print(f"{options.stack}: lambda_tuning is written")
+
+
+if __name__ == "__main__":
+    main()
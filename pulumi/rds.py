@@ -1,6 +1,209 @@
 from pulumi import ComponentResource, ResourceOptions, Output
+from pulumi.dynamic import ResourceProvider, Resource, CreateResult, DiffResult, UpdateResult
 import pulumi_aws as aws
 import pulumi_random as random
+import invokes
+import rds_parameters
+
+# Storage presets by instance class. gp3 has baseline of 3000 IOPS,
+# provisioned IOPS can be set for it from 400 GB of storage. Presets
+# have no throughput: pulumi-aws 3.x has no storage_throughput,
+# gp3 gets the baseline of RDS (125 MiB/s, 500 MiB/s from 400 GB)
+STORAGE_PRESETS = {
+    "db.t2.small": {"storage_type": "gp3", "allocated_storage": 20,
+                    "max_allocated_storage": 100},
+    "db.t3.small": {"storage_type": "gp3", "allocated_storage": 20,
+                    "max_allocated_storage": 100},
+    "db.t3.medium": {"storage_type": "gp3", "allocated_storage": 50,
+                     "max_allocated_storage": 200},
+    "db.t3.large": {"storage_type": "gp3", "allocated_storage": 100,
+                    "max_allocated_storage": 500},
+    "db.m5.large": {"storage_type": "gp3", "allocated_storage": 400,
+                    "iops": 12000, "max_allocated_storage": 1000},
+    "db.m6g.large": {"storage_type": "gp3", "allocated_storage": 400,
+                     "iops": 12000, "max_allocated_storage": 1000},
+    "db.r5.large": {"storage_type": "io1", "allocated_storage": 200,
+                    "iops": 10000, "max_allocated_storage": 1000},
+    "db.r6g.large": {"storage_type": "io1", "allocated_storage": 200,
+                     "iops": 10000, "max_allocated_storage": 1000},
+}
+DEFAULT_STORAGE = {"storage_type": "gp3", "allocated_storage": 20,
+                   "max_allocated_storage": 100}
+GP3_IOPS_MIN_STORAGE = 400
+ENGINE_VERSION = "12.5"
+PARAMETER_GROUP_FAMILY = "postgres12"
+
+# Performance Insights isn't supported by the smallest classes,
+# retention is free for 7 days, longer one is paid by month
+PERFORMANCE_INSIGHTS_UNSUPPORTED = ("db.t2.", "db.t3.micro", "db.t3.small")
+PERFORMANCE_INSIGHTS_RETENTION = (7, 731) + tuple(31 * n for n in range(1, 24))
+MONITORING_INTERVALS = (0, 1, 5, 10, 15, 30, 60)
+
+# Engine modes of Rds: RDS instance or Aurora PostgreSQL cluster
+# with Serverless v2 instances, which scale between min and max ACUs
+INSTANCE = "instance"
+AURORA_SERVERLESS_V2 = "aurora-serverless-v2"
+ENGINE_MODES = (INSTANCE, AURORA_SERVERLESS_V2)
+AURORA_ENGINE_VERSION = "14.6"
+SERVERLESS_MIN_CAPACITY = 0.5
+SERVERLESS_MAX_CAPACITY = 128
+DEFAULT_SERVERLESS_CAPACITY = {"min_capacity": 0.5, "max_capacity": 4}
+# Metadata database of Airflow, it is created with the database.
+# Databases restored from a snapshot already have it
+AIRFLOW_DB_NAME = "airflow"
+
+
+def storage_profile(db_instance_type, overrides=None):
+    """This function returns storage profile for the instance class:
+       storage_type, allocated_storage, iops and max_allocated_storage
+       (upper limit of storage autoscaling). Preset of the class is
+       used, its values can be overridden"""
+
+    profile = {
+        "iops": None,
+        **STORAGE_PRESETS.get(db_instance_type, DEFAULT_STORAGE),
+        **(overrides or {}),
+    }
+    if "storage_throughput" in profile:
+        raise SystemExit(
+            "Error: storage_throughput of RDS can't be set with pulumi-aws 3.x, "
+            "gp3 storage has baseline throughput")
+    if profile["storage_type"] == "io1" and not profile["iops"]:
+        raise SystemExit("Error: io1 storage of RDS needs iops")
+    if profile["storage_type"] == "gp3" and profile["iops"] \
+            and profile["allocated_storage"] < GP3_IOPS_MIN_STORAGE:
+        raise SystemExit(
+            f"Error: iops of gp3 storage of RDS can be set only from "
+            f"{GP3_IOPS_MIN_STORAGE} GB of allocated storage")
+    if profile["max_allocated_storage"] \
+            and profile["max_allocated_storage"] < profile["allocated_storage"]:
+        raise SystemExit(
+            "Error: max_allocated_storage of RDS is less than allocated_storage")
+    return profile
+
+
+def monitoring_settings(args):
+    """This function returns settings of Performance Insights and
+       Enhanced Monitoring of RDS instance from RdsArgs"""
+
+    settings = {}
+    if args.performance_insights:
+        if args.engine_mode == INSTANCE \
+                and args.db_instance_type.startswith(PERFORMANCE_INSIGHTS_UNSUPPORTED):
+            raise SystemExit(
+                f"Error: Performance Insights isn't supported by "
+                f"{args.db_instance_type}")
+        if args.performance_insights_retention \
+                not in PERFORMANCE_INSIGHTS_RETENTION:
+            raise SystemExit(
+                "Error: retention of Performance Insights must be 7, 731 "
+                "or multiple of 31 days")
+        settings.update(
+            performance_insights_enabled=True,
+            performance_insights_retention_period=args.performance_insights_retention,
+            performance_insights_kms_key_id=args.performance_insights_kms_key_id,
+        )
+    if args.monitoring_interval not in MONITORING_INTERVALS:
+        raise SystemExit(
+            f"Error: monitoring interval of RDS must be one of: "
+            f"{', '.join(map(str, MONITORING_INTERVALS))}")
+    if args.monitoring_interval:
+        if not args.monitoring_role_arn:
+            raise SystemExit("Error: Enhanced Monitoring of RDS needs IAM role")
+        settings.update(
+            monitoring_interval=args.monitoring_interval,
+            monitoring_role_arn=args.monitoring_role_arn,
+        )
+    return settings
+
+
+def serverless_capacity(min_capacity, max_capacity):
+    """This function checks min and max ACUs of Serverless v2
+       instances and returns them"""
+
+    for capacity in (min_capacity, max_capacity):
+        if not SERVERLESS_MIN_CAPACITY <= capacity <= SERVERLESS_MAX_CAPACITY \
+                or capacity * 2 != int(capacity * 2):
+            raise SystemExit(
+                f"Error: capacity of Aurora Serverless v2 must be from "
+                f"{SERVERLESS_MIN_CAPACITY} to {SERVERLESS_MAX_CAPACITY} "
+                f"ACUs in steps of 0.5, got {capacity}")
+    if min_capacity > max_capacity:
+        raise SystemExit(
+            "Error: min capacity of Aurora Serverless v2 is more than max capacity")
+    return {"min_capacity": min_capacity, "max_capacity": max_capacity}
+
+
+class _ServerlessV2ScalingProvider(ResourceProvider):
+    """Create class _ServerlessV2ScalingProvider, which sets scaling
+       configuration of Aurora Serverless v2 on the cluster with boto3,
+       as pulumi-aws 3.x has no serverlessv2_scaling_configuration"""
+
+    def _modify(self, props):
+        import boto3
+        boto3.client("rds", region_name=props["region"]).modify_db_cluster(
+            DBClusterIdentifier=props["cluster_identifier"],
+            ServerlessV2ScalingConfiguration={
+                "MinCapacity": props["min_capacity"],
+                "MaxCapacity": props["max_capacity"],
+            },
+            ApplyImmediately=True,
+        )
+
+    def create(self, props):
+        self._modify(props)
+        return CreateResult(id_=props["cluster_identifier"], outs=props)
+
+    def diff(self, id, olds, news):
+        keys = ("region", "cluster_identifier", "min_capacity", "max_capacity")
+        return DiffResult(
+            changes=any(olds.get(key) != news.get(key) for key in keys),
+            replaces=[
+                key for key in ("region", "cluster_identifier")
+                if olds.get(key) != news.get(key)
+            ],
+        )
+
+    def update(self, id, olds, news):
+        self._modify(news)
+        return UpdateResult(outs=news)
+
+    def delete(self, id, props):
+        """Scaling configuration is deleted together with the cluster"""
+
+
+class ServerlessV2Scaling(Resource):
+    """Create class ServerlessV2Scaling, which is min and max ACUs
+       of Aurora Serverless v2 instances of the cluster"""
+
+    def __init__(self, name, region, cluster_identifier,
+                 min_capacity, max_capacity, opts=None):
+        super().__init__(
+            _ServerlessV2ScalingProvider(),
+            name,
+            {
+                "region": region,
+                "cluster_identifier": cluster_identifier,
+                "min_capacity": min_capacity,
+                "max_capacity": max_capacity,
+            },
+            opts,
+        )
+
+
+class _AuroraEndpoint:
+    """Create class _AuroraEndpoint, which gives access to Aurora
+       cluster with the same attributes as RDS instance has, so that
+       DBSecretsManager, RdsProxy and lambda functions work with both"""
+
+    def __init__(self, cluster, writer):
+        self.address = cluster.endpoint
+        self.port = cluster.port
+        self.username = cluster.master_username
+        self.identifier = cluster.cluster_identifier
+        # Metrics are collected by instances, not by the cluster
+        self.arn = writer.arn
+        self.resource_id = writer.dbi_resource_id
 
 
 class RdsArgs:
@@ -19,7 +222,32 @@ class RdsArgs:
             you want to allocate RDS
         - db_security_group_id - id of database security group for RDS
         - name_suffix - random string that is added to all resources
-        in the stack to avoid name duplication"""
+        in the stack to avoid name duplication
+        - storage_profile - storage_type, allocated_storage, iops and
+        max_allocated_storage, preset of db_instance_type is used if not set
+        - read_replica_count - number of read replicas, they are spread
+        across availability zones of db_subnet_ids
+        - vpc_id - id of VPC, it is needed for read replicas
+        - db_subnet_ids - ids of subnets of db_subnet_group_name,
+        it is needed for read replicas
+        - parameters - parameters of Postgres parameter group, they are
+        tuned for db_instance_type if not set
+        - performance_insights - enable Performance Insights
+        - performance_insights_retention - days of Performance Insights
+        data retention: 7, 731 or multiple of 31
+        - performance_insights_kms_key_id - ARN of KMS key of Performance
+        Insights data, default RDS key is used if not set
+        - monitoring_interval - seconds between Enhanced Monitoring
+        metrics, 0 disables it
+        - monitoring_role_arn - ARN of IAM role of Enhanced Monitoring
+        - engine_mode - "instance" (RDS instance of db_instance_type)
+        or "aurora-serverless-v2" (Aurora PostgreSQL cluster with writer
+        and read_replica_count readers, which scale between min and max
+        ACUs), storage_profile and parameters are used only by instance
+        - serverless_capacity - min_capacity and max_capacity in ACUs
+        of Aurora Serverless v2 instances
+        - snapshot_identifier - snapshot (of instance or of Aurora cluster)
+        which the database is restored from, it is created empty if not set"""
 
     def __init__(
         self,
@@ -31,7 +259,20 @@ class RdsArgs:
         db_subnet_group_name,
         db_security_group_id,
         db_username,
-        name_suffix
+        name_suffix,
+        storage_profile=None,
+        read_replica_count=0,
+        vpc_id=None,
+        db_subnet_ids=None,
+        parameters=None,
+        performance_insights=False,
+        performance_insights_retention=7,
+        performance_insights_kms_key_id=None,
+        monitoring_interval=0,
+        monitoring_role_arn=None,
+        engine_mode=INSTANCE,
+        serverless_capacity=None,
+        snapshot_identifier=None,
     ):
 
         self.region = region
@@ -43,6 +284,19 @@ class RdsArgs:
         self.db_security_group_id = db_security_group_id
         self.db_username = db_username
         self.name_suffix = name_suffix
+        self.storage_profile = storage_profile
+        self.read_replica_count = read_replica_count
+        self.vpc_id = vpc_id
+        self.db_subnet_ids = db_subnet_ids
+        self.parameters = parameters
+        self.performance_insights = performance_insights
+        self.performance_insights_retention = performance_insights_retention
+        self.performance_insights_kms_key_id = performance_insights_kms_key_id
+        self.monitoring_interval = monitoring_interval
+        self.monitoring_role_arn = monitoring_role_arn
+        self.engine_mode = engine_mode
+        self.serverless_capacity = serverless_capacity
+        self.snapshot_identifier = snapshot_identifier
 
 
 class Rds(ComponentResource):
@@ -51,11 +305,18 @@ class Rds(ComponentResource):
 
     def __init__(self, name: str, args: RdsArgs, opts: ResourceOptions = None):
         """Create constructor of class Rds
-           This constructor creates RDS instance, and two RandomPassword:
-           one for database and second for airflow.."""
+           This constructor creates RDS instance with parameter group
+           tuned for its instance class (or Aurora Serverless v2 cluster),
+           and two RandomPassword: one for database and second for airflow.."""
         super().__init__("custom:resource:Rds", name, {}, opts)
         """Override ComponentResource class constructor"""
 
+        if args.engine_mode not in ENGINE_MODES:
+            raise SystemExit(f"Error: unknown engine mode of RDS '{args.engine_mode}', "
+                             f"expected one of: {', '.join(ENGINE_MODES)}")
+        storage = args.storage_profile or storage_profile(args.db_instance_type)
+        monitoring = monitoring_settings(args)
+
         self.db_password = random.RandomPassword(
             "dbPassword",
             length=12,
@@ -63,13 +324,71 @@ class Rds(ComponentResource):
             opts=ResourceOptions(parent=self),
         )
 
+        self.cluster = None
+        self.replicas = []
+        if args.engine_mode == AURORA_SERVERLESS_V2:
+            self._create_cluster(args, monitoring)
+        else:
+            self._create_instance(args, storage, monitoring)
+
+        # ARNs of metrics of the instance for dashboards,
+        # account id is taken from ARN of the instance
+        self.performance_insights_arn = None
+        if args.performance_insights:
+            self.performance_insights_arn = Output.all(
+                self.default.arn, self.default.resource_id).apply(
+                lambda arg: f"arn:aws:pi:{args.region}:{arg[0].split(':')[4]}"
+                f":metrics/rds/{arg[1]}")
+        self.enhanced_monitoring_arn = None
+        if args.monitoring_interval:
+            self.enhanced_monitoring_arn = Output.all(
+                self.default.arn, self.default.resource_id).apply(
+                lambda arg: f"arn:aws:logs:{args.region}:{arg[0].split(':')[4]}"
+                f":log-group:RDSOSMetrics:log-stream:{arg[1]}")
+
+        self.register_outputs({
+            "address": self.default.address,
+            "reader_address": self.reader_address,
+            "performance_insights_arn": self.performance_insights_arn,
+            "enhanced_monitoring_arn": self.enhanced_monitoring_arn,
+            "port": self.default.port,
+            "username": self.default.username,
+        })
+
+    def _create_instance(self, args, storage, monitoring):
+        """This method creates RDS instance with parameter group tuned
+           for its instance class, and its read replicas"""
+
+        # Parameters are tuned for the instance class, so they are
+        # changed together with db_instance_type
+        self.parameter_group = aws.rds.ParameterGroup(
+            "parameterGroup",
+            name=Output.all(args.project_name, args.name_suffix).apply(
+                lambda arg: f"{arg[0]}-{arg[1]}-{PARAMETER_GROUP_FAMILY}"),
+            family=PARAMETER_GROUP_FAMILY,
+            # Change of description replaces the group
+            description=f"Parameters of {args.project_name} database "
+            "tuned for its instance class",
+            parameters=args.parameters
+            or rds_parameters.compute(args.db_instance_type),
+            tags={
+                "BillingCode": args.billing_code,
+                "Project": args.project_name_underscores,
+            },
+            opts=ResourceOptions(parent=self),
+        )
+
         self.default = aws.rds.Instance(
             "default",
-            allocated_storage=10,  # must be 100
-            storage_type="gp2",
+            allocated_storage=storage["allocated_storage"],
+            storage_type=storage["storage_type"],
+            iops=storage["iops"],
+            max_allocated_storage=storage["max_allocated_storage"],
             engine="postgres",
-            engine_version="12.5",
+            engine_version=ENGINE_VERSION,
             instance_class=args.db_instance_type,
+            parameter_group_name=self.parameter_group.name,
+            **monitoring,
             db_subnet_group_name=args.db_subnet_group_name.apply(
                 lambda name: f"{name}"),
             backup_retention_period=7,
@@ -82,15 +401,179 @@ class Rds(ComponentResource):
                     lambda args: f"{args[0]}-final-snapshot-{args[1]}"),
             storage_encrypted=True,
             vpc_security_group_ids=[args.db_security_group_id],
-            username=args.db_username,
+            # Username is taken from the snapshot, password is
+            # changed after restore
+            snapshot_identifier=args.snapshot_identifier,
+            username=None if args.snapshot_identifier else args.db_username,
             password=self.db_password.result,
+            name=None if args.snapshot_identifier else AIRFLOW_DB_NAME,
             port=5432,
             tags={
                 "BillingCode": args.billing_code,
                 "Name": f"{args.project_name_underscores}_db_server",
                 "Project": args.project_name_underscores,
             },
+            opts=ResourceOptions(
+                parent=self,
+                # Snapshot and database name are used only when the
+                # database is created, changing them doesn't replace it
+                ignore_changes=["snapshot_identifier", "name"],
+            ),
+        )
+
+        self.reader_address = self.default.address
+        if args.read_replica_count:
+            self._create_replicas(args, storage)
+
+    def _create_cluster(self, args, monitoring):
+        """This method creates Aurora PostgreSQL cluster with Serverless v2
+           writer and readers. Cluster endpoint and reader endpoint are
+           used as addresses of the database"""
+
+        if monitoring.pop("performance_insights_retention_period", 7) != 7:
+            raise SystemExit(
+                "Error: retention of Performance Insights of Aurora instances "
+                "can't be set with pulumi-aws 3.x, it is 7 days")
+        capacity = args.serverless_capacity or DEFAULT_SERVERLESS_CAPACITY
+        tags = {
+            "BillingCode": args.billing_code,
+            "Project": args.project_name_underscores,
+        }
+
+        self.cluster = aws.rds.Cluster(
+            "cluster",
+            cluster_identifier=Output.all(args.project_name, args.name_suffix).apply(
+                lambda arg: f"{arg[0]}-{arg[1]}"),
+            engine="aurora-postgresql",
+            engine_mode="provisioned",
+            engine_version=AURORA_ENGINE_VERSION,
+            db_subnet_group_name=args.db_subnet_group_name,
+            vpc_security_group_ids=[args.db_security_group_id],
+            snapshot_identifier=args.snapshot_identifier,
+            master_username=None if args.snapshot_identifier
+            else args.db_username,
+            master_password=self.db_password.result,
+            database_name=None if args.snapshot_identifier else AIRFLOW_DB_NAME,
+            port=5432,
+            backup_retention_period=7,
+            final_snapshot_identifier=Output.all(
+                args.project_name,
+                args.name_suffix
+                ).apply(
+                    lambda arg: f"{arg[0]}-final-snapshot-{arg[1]}"),
+            storage_encrypted=True,
+            tags={
+                **tags,
+                "Name": f"{args.project_name_underscores}_db_cluster",
+            },
+            opts=ResourceOptions(
+                parent=self,
+                ignore_changes=["snapshot_identifier", "database_name"],
+            ),
+        )
+
+        # Instances of db.serverless class can be added only after
+        # scaling configuration is set on the cluster
+        scaling = ServerlessV2Scaling(
+            "serverlessScaling",
+            region=args.region,
+            cluster_identifier=self.cluster.cluster_identifier,
+            min_capacity=capacity["min_capacity"],
+            max_capacity=capacity["max_capacity"],
+            opts=ResourceOptions(parent=self),
+        )
+
+        instances = []
+        for i in range(1 + args.read_replica_count):
+            role = "writer" if i == 0 else f"reader{i - 1}"
+            instances.append(aws.rds.ClusterInstance(
+                role,
+                cluster_identifier=self.cluster.id,
+                identifier=self.cluster.cluster_identifier.apply(
+                    lambda cluster, role=role: f"{cluster}-{role}"),
+                instance_class="db.serverless",
+                engine="aurora-postgresql",
+                engine_version=self.cluster.engine_version,
+                db_subnet_group_name=args.db_subnet_group_name,
+                # Readers of tier 0 or 1 scale together with the writer,
+                # so they can take over its load on failover
+                promotion_tier=0 if i == 0 else 1,
+                **monitoring,
+                tags={
+                    **tags,
+                    "Name": f"{args.project_name_underscores}_db_{role}",
+                },
+                # The first instance of the cluster becomes the writer
+                opts=ResourceOptions(
+                    parent=self, depends_on=[scaling] + instances[:1]),
+            ))
+
+        self.default = _AuroraEndpoint(self.cluster, instances[0])
+        self.replicas = instances[1:]
+        self.reader_address = self.default.address
+        if self.replicas:
+            self.reader_address = self.cluster.reader_endpoint
+
+    def _create_replicas(self, args, storage):
+        """This method creates read replicas of the instance, one per
+           availability zone of DB subnets in turn, and reader endpoint:
+           weighted CNAME record in private hosted zone, which spreads
+           connections over replicas"""
+
+        zones = Output.from_input(args.db_subnet_ids).apply(
+            lambda subnet_ids: Output.all(*[
+                invokes.account_invoke(
+                    "aws:ec2/getSubnet:getSubnet",
+                    aws.ec2.get_subnet,
+                    {"id": subnet_id},
+                    ["availability_zone"],
+                ).apply(lambda subnet: subnet["availability_zone"])
+                for subnet_id in sorted(subnet_ids)
+            ]).apply(lambda zones: sorted(set(zones))))
+
+        for i in range(args.read_replica_count):
+            self.replicas.append(aws.rds.Instance(
+                f"replica{i}",
+                replicate_source_db=self.default.identifier,
+                instance_class=args.db_instance_type,
+                parameter_group_name=self.parameter_group.name,
+                **monitoring,
+                availability_zone=zones.apply(
+                    lambda zones, i=i: zones[i % len(zones)]),
+                storage_type=storage["storage_type"],
+                iops=storage["iops"],
+                max_allocated_storage=storage["max_allocated_storage"],
+                identifier=Output.all(args.project_name, args.name_suffix).apply(
+                    lambda arg, i=i: f"{arg[0]}-{arg[1]}-replica-{i}"),
+                vpc_security_group_ids=[args.db_security_group_id],
+                storage_encrypted=True,
+                skip_final_snapshot=True,
+                tags={
+                    "BillingCode": args.billing_code,
+                    "Name": f"{args.project_name_underscores}_db_replica_{i}",
+                    "Project": args.project_name_underscores,
+                },
+                opts=ResourceOptions(parent=self),
+            ))
+
+        zone = aws.route53.Zone(
+            "dbZone",
+            name=f"{args.project_name}.db.internal",
+            vpcs=[{"vpc_id": args.vpc_id}],
+            comment="Reader endpoint of RDS read replicas",
             opts=ResourceOptions(parent=self),
         )
 
-        self.register_outputs({})
+        for i, replica in enumerate(self.replicas):
+            record = aws.route53.Record(
+                f"reader{i}",
+                zone_id=zone.zone_id,
+                name=f"reader.{args.project_name}.db.internal",
+                type="CNAME",
+                ttl=5,
+                records=[replica.address],
+                set_identifier=f"replica-{i}",
+                weighted_routing_policies=[{"weight": 1}],
+                opts=ResourceOptions(parent=self),
+            )
+        self.reader_address = record.fqdn
@@ -0,0 +1,84 @@
+import json
+import os
+
+# Table of memory and vCPUs of RDS instance classes
+INSTANCE_CLASSES = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "rds_instance_classes.json")
+
+# Same limit of connections as default parameter group of RDS,
+# LEAST({DBInstanceClassMemory/9531392}, 5000)
+BYTES_PER_CONNECTION = 9531392
+MAX_CONNECTIONS = 5000
+# Connections beyond a hundred per vCPU only wait for CPU,
+# RDS Proxy queues the rest of clients
+CONNECTIONS_PER_VCPU = 100
+MIN_WORK_MEM_KB = 4096
+MAX_MAINTENANCE_WORK_MEM_KB = 2 * 1024 * 1024
+
+# Parameters which are applied only after reboot of the instance,
+# RDS reboots it anyway when instance class is changed
+STATIC_PARAMETERS = ("shared_buffers", "max_connections", "autovacuum_max_workers")
+
+
+def load():
+    with open(INSTANCE_CLASSES) as f:
+        return json.load(f)
+
+
+def instance_class(db_instance_type):
+    """This function returns memory_gib and vcpus of the instance class"""
+
+    classes = load()
+    if db_instance_type not in classes:
+        raise SystemExit(
+            f"Error: instance class {db_instance_type} is not in "
+            f"{os.path.basename(INSTANCE_CLASSES)}, add its memory and vCPUs")
+    return classes[db_instance_type]
+
+
+def compute(db_instance_type, overrides=None):
+    """This function returns parameters of Postgres parameter group
+       tuned for memory and vCPUs of the instance class. Values of
+       the parameters can be overridden, other parameters can be added
+       with overrides: {"name": value}. shared_buffers and
+       effective_cache_size are in 8 kB pages, *_mem are in kB"""
+
+    spec = instance_class(db_instance_type)
+    memory_kb = spec["memory_gib"] * 1024 * 1024
+    max_connections = min(
+        spec["memory_gib"] * 1024 ** 3 // BYTES_PER_CONNECTION,
+        CONNECTIONS_PER_VCPU * (spec["vcpus"] + 1),
+        MAX_CONNECTIONS)
+    shared_buffers_kb = memory_kb // 4
+    parallel_workers = max(1, spec["vcpus"] // 2)
+    autovacuum_workers = max(3, spec["vcpus"] // 2)
+
+    tuned = {
+        "max_connections": max_connections,
+        "shared_buffers": shared_buffers_kb // 8,
+        "effective_cache_size": memory_kb * 3 // 4 // 8,
+        # Each connection can run a few sorts or hashes at once
+        "work_mem": max(
+            MIN_WORK_MEM_KB,
+            (memory_kb - shared_buffers_kb)
+            // (max_connections * 3) // parallel_workers),
+        "maintenance_work_mem": min(memory_kb // 16, MAX_MAINTENANCE_WORK_MEM_KB),
+        "max_parallel_workers_per_gather": parallel_workers,
+        "autovacuum_max_workers": autovacuum_workers,
+        # Cost limit is shared by all workers, so every worker
+        # keeps the default budget of 200
+        "autovacuum_vacuum_cost_limit": 200 * autovacuum_workers,
+        "autovacuum_vacuum_scale_factor": 0.05,
+        "autovacuum_analyze_scale_factor": 0.02,
+    }
+    values = {**tuned, **(overrides or {})}
+    return [
+        {
+            "name": name,
+            "value": str(value),
+            "apply_method": "pending-reboot"
+            if name in STATIC_PARAMETERS or name not in tuned
+            else "immediate",
+        }
+        for name, value in sorted(values.items())
+    ]
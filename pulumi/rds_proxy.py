@@ -0,0 +1,186 @@
+from pulumi import ComponentResource, ResourceOptions, Output
+import pulumi_aws as aws
+import json
+
+POSTGRES_PORT = 5432
+
+# Settings of the connection pool, max_connections_percent is a share
+# of max_connections of the instance, the rest is left for Airflow
+DEFAULT_POOL = {
+    "max_connections_percent": 75,
+    "max_idle_connections_percent": 25,
+    "connection_borrow_timeout": 120,
+}
+IDLE_CLIENT_TIMEOUT = 900
+
+
+class RdsProxyArgs:
+    """Create class RdsProxyArgs for conveniently passing arguments to the class RdsProxy
+       These arguments are used to create RDS Proxy in front of
+       the RDS instance:
+       - billing_code - billing code
+       - project_name - project name
+       - project_name_underscores - modified project name
+       - name_suffix - random suffix that is added to all unique resources
+       - db_instance_identifier - identifier of RDS instance
+       - db_cluster_identifier - identifier of Aurora cluster, it is
+         the target of the proxy instead of the instance, when it is set
+       - db_subnet_ids - ids of subnets of database subnet group
+       - db_security_group_id - id of database security group, proxy
+         is placed in it
+       - db_credentials_secret_arn - ARN of secret with username and
+         password of database, proxy authenticates with it
+       - pool - overrides of DEFAULT_POOL settings"""
+
+    def __init__(
+        self,
+        billing_code,
+        project_name,
+        project_name_underscores,
+        name_suffix,
+        db_instance_identifier,
+        db_subnet_ids,
+        db_security_group_id,
+        db_credentials_secret_arn,
+        pool=None,
+        db_cluster_identifier=None,
+    ):
+
+        self.billing_code = billing_code
+        self.project_name = project_name
+        self.project_name_underscores = project_name_underscores
+        self.name_suffix = name_suffix
+        self.db_instance_identifier = db_instance_identifier
+        self.db_subnet_ids = db_subnet_ids
+        self.db_security_group_id = db_security_group_id
+        self.db_credentials_secret_arn = db_credentials_secret_arn
+        self.pool = pool
+        self.db_cluster_identifier = db_cluster_identifier
+
+
+class RdsProxy(ComponentResource):
+    """Create class RdsProxy which extends class ComponentResource"""
+
+    def __init__(self, name: str, args: RdsProxyArgs, opts: ResourceOptions = None):
+        """Create constructor of class RdsProxy
+           This constructor creates RDS Proxy, which pools connections
+           of lambda functions to RDS instance, and secret with its
+           endpoint. Proxy is placed in subnets and security group
+           of the database"""
+        super().__init__("custom:resource:RdsProxy", name, {}, opts)
+        """Override ComponentResource class constructor"""
+
+        tags = {
+            "BillingCode": args.billing_code,
+            "Project": args.project_name_underscores,
+        }
+
+        unknown = set(args.pool or {}) - set(DEFAULT_POOL)
+        if unknown:
+            raise SystemExit(f"Error: unknown settings of RDS Proxy pool: "
+                             f"{', '.join(sorted(unknown))}")
+        pool = {**DEFAULT_POOL, **(args.pool or {})}
+
+        self.role = aws.iam.Role(
+            "proxyRole",
+            assume_role_policy=json.dumps({
+                "Version": "2012-10-17",
+                "Statement": [{
+                    "Action": "sts:AssumeRole",
+                    "Principal": {"Service": "rds.amazonaws.com"},
+                    "Effect": "Allow",
+                }],
+            }),
+            tags=tags,
+            opts=ResourceOptions(parent=self),
+        )
+
+        aws.iam.RolePolicy(
+            "proxyRolePolicy",
+            role=self.role.id,
+            policy=Output.from_input(args.db_credentials_secret_arn).apply(
+                lambda arn: json.dumps({
+                    "Version": "2012-10-17",
+                    "Statement": [{
+                        "Effect": "Allow",
+                        "Action": ["secretsmanager:GetSecretValue"],
+                        "Resource": [arn],
+                    }],
+                })),
+            opts=ResourceOptions(parent=self),
+        )
+
+        # Proxy is in the database security group, it is allowed
+        # to connect to the instance from the same group
+        aws.ec2.SecurityGroupRule(
+            "proxyIngressRule",
+            type="ingress",
+            description="Access to RDS instance from RDS Proxy",
+            security_group_id=args.db_security_group_id,
+            protocol="tcp",
+            from_port=POSTGRES_PORT,
+            to_port=POSTGRES_PORT,
+            self=True,
+            opts=ResourceOptions(parent=self),
+        )
+
+        self.proxy = aws.rds.Proxy(
+            "proxy",
+            name=Output.all(args.project_name, args.name_suffix).apply(
+                lambda arg: f"{arg[0]}-{arg[1]}-proxy"),
+            engine_family="POSTGRESQL",
+            auths=[{
+                "auth_scheme": "SECRETS",
+                "iam_auth": "DISABLED",
+                "secret_arn": args.db_credentials_secret_arn,
+            }],
+            role_arn=self.role.arn,
+            vpc_subnet_ids=args.db_subnet_ids,
+            vpc_security_group_ids=[args.db_security_group_id],
+            idle_client_timeout=IDLE_CLIENT_TIMEOUT,
+            require_tls=False,
+            tags={
+                **tags,
+                "Name": f"{args.project_name_underscores}_db_proxy",
+            },
+            opts=ResourceOptions(parent=self),
+        )
+
+        target_group = aws.rds.ProxyDefaultTargetGroup(
+            "proxyTargetGroup",
+            db_proxy_name=self.proxy.name,
+            connection_pool_config=pool,
+            opts=ResourceOptions(parent=self),
+        )
+
+        aws.rds.ProxyTarget(
+            "proxyTarget",
+            db_proxy_name=self.proxy.name,
+            target_group_name=target_group.name,
+            db_instance_identifier=None if args.db_cluster_identifier
+            else args.db_instance_identifier,
+            db_cluster_identifier=args.db_cluster_identifier,
+            opts=ResourceOptions(parent=self),
+        )
+
+        self.db_proxy_address_secret = aws.secretsmanager.Secret(
+            f"{args.project_name}_dbSecret_proxy_address",
+            tags={
+                "BillingCode": args.billing_code,
+                "Name": f"{args.project_name}_dbSecret_proxy_address",
+                "Project": args.project_name,
+            },
+            opts=ResourceOptions(parent=self),
+        )
+
+        db_proxy_address_secret = aws.secretsmanager.SecretVersion(
+            f"{args.project_name}_dbSecret_proxy_address",
+            secret_id=self.db_proxy_address_secret.id,
+            secret_string=self.proxy.endpoint,
+            opts=ResourceOptions(parent=self.db_proxy_address_secret),
+        )
+
+        self.register_outputs({
+            "endpoint": self.proxy.endpoint,
+            "db_proxy_address_secret_arn": self.db_proxy_address_secret.arn,
+        })
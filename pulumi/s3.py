@@ -1,7 +1,6 @@
 import pulumi_aws as aws
 from pulumi import ComponentResource, ResourceOptions, Output
-
-current_id = aws.get_caller_identity().account_id
+import invokes
 
 
 class S3Args:
@@ -113,11 +112,17 @@ class S3(ComponentResource):
             )
         )
 
-        admin_principals = []
-        for admin in args.admin_list:
-            admin_principals.append(f"arn:aws:iam::{current_id}:user/{admin}")
+        admin_principals = invokes.get_account_id().apply(
+            lambda account_id: [
+                f"arn:aws:iam::{account_id}:user/{admin}"
+                for admin in args.admin_list
+            ]
+        )
 
-        self.admin_access_policy = Output.all(self.bucket.arn).apply(
+        self.admin_access_policy = Output.all(
+            self.bucket.arn,
+            admin_principals
+            ).apply(
             lambda args:
             aws.iam.get_policy_document(
                 version="2012-10-17",
@@ -126,7 +131,7 @@ class S3(ComponentResource):
                         sid="admin-access",
                         principals=[
                             aws.iam.GetPolicyDocumentStatementPrincipalArgs(
-                                identifiers=admin_principals,
+                                identifiers=args[1],
                                 type="AWS",
                             )
                         ],
@@ -152,4 +157,7 @@ class S3(ComponentResource):
             opts=ResourceOptions(parent=self.bucket)
         )
 
-        self.register_outputs({})
+        self.register_outputs({
+            "bucket_id": self.bucket.id,
+            "bucket_arn": self.bucket.arn,
+        })
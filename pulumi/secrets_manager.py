@@ -1,4 +1,4 @@
-from pulumi import ComponentResource, ResourceOptions
+from pulumi import ComponentResource, ResourceOptions, Output
 import pulumi_aws as aws
 import json
 
@@ -47,7 +47,7 @@ class SecretsManager(ComponentResource):
         # TO DO: class must be a constructor for secret and secret version,
         # and their values must be passed as arguments
 
-        airflow_logs_bucket_secret = aws.secretsmanager.Secret(
+        self.airflow_logs_bucket_secret = aws.secretsmanager.Secret(
             f"{args.project_name}_airflowLogsBucketSecret",
             # name=f"{args.project_name_underscores}_airflow_logs_bucket",
             tags={
@@ -58,7 +58,7 @@ class SecretsManager(ComponentResource):
             opts=ResourceOptions(parent=self),
         )
 
-        data_lake_bucket_secret = aws.secretsmanager.Secret(
+        self.data_lake_bucket_secret = aws.secretsmanager.Secret(
             f"{args.project_name}_dataLakeBucketSecret",
             # name=f"{args.project_name_underscores}_data_lake_bucket",
             tags={
@@ -69,7 +69,7 @@ class SecretsManager(ComponentResource):
             opts=ResourceOptions(parent=self),
         )
 
-        airflow_user_secret = aws.secretsmanager.Secret(
+        self.airflow_user_secret = aws.secretsmanager.Secret(
             f"{args.project_name}_airflowUserSecret",
             # name=f"{args.project_name_underscores}_airflow_user",
             tags={
@@ -82,25 +82,25 @@ class SecretsManager(ComponentResource):
 
         airflow_logs_bucket_secret = aws.secretsmanager.SecretVersion(
             f"{args.project_name}_airflowLogsBucketSecret",
-            secret_id=airflow_logs_bucket_secret.id,
+            secret_id=self.airflow_logs_bucket_secret.id,
             secret_string=args.airflow_bucket_name.apply(
                 lambda arg: arg
             ),
-            opts=ResourceOptions(parent=airflow_logs_bucket_secret),
+            opts=ResourceOptions(parent=self.airflow_logs_bucket_secret),
         )
 
         data_lake_bucket_secret = aws.secretsmanager.SecretVersion(
             f"{args.project_name}_dataLakeBucketSecret",
-            secret_id=data_lake_bucket_secret.id,
+            secret_id=self.data_lake_bucket_secret.id,
             secret_string=args.datalake_bucket_name.apply(
                 lambda arg: arg
             ),
-            opts=ResourceOptions(parent=data_lake_bucket_secret),
+            opts=ResourceOptions(parent=self.data_lake_bucket_secret),
         )
 
         airflow_user_secret = aws.secretsmanager.SecretVersion(
             f"{args.project_name}_airflowUserSecret",
-            secret_id=airflow_user_secret.id,
+            secret_id=self.airflow_user_secret.id,
             secret_string=args.airflow_pass_result.apply(
                 lambda result: json.dumps(
                     {
@@ -109,10 +109,14 @@ class SecretsManager(ComponentResource):
                     }
                 )
             ),
-            opts=ResourceOptions(parent=airflow_user_secret),
+            opts=ResourceOptions(parent=self.airflow_user_secret),
         )
 
-        self.register_outputs({})
+        self.register_outputs({
+            "airflow_logs_bucket_secret_arn": self.airflow_logs_bucket_secret.arn,
+            "data_lake_bucket_secret_arn": self.data_lake_bucket_secret.arn,
+            "airflow_user_secret_arn": self.airflow_user_secret.arn,
+        })
 
 
 class DBSecretsManagerArgs:
@@ -123,7 +127,13 @@ class DBSecretsManagerArgs:
        - project_name_underscores - modified project name
        - db_username - username for database
        - db_password_result - password for database
-       - address - database endpoint URL address"""
+       - address - database endpoint URL address
+       - reader_address - address of database endpoint for reads,
+         it is the same as address, when there are no read replicas
+       - cache_address - address of ElastiCache Redis cache of API
+         GET requests, its secret is created only when it is set
+       - credentials - create JSON secret with username and password,
+         RDS Proxy authenticates with it"""
 
     def __init__(
         self,
@@ -131,7 +141,10 @@ class DBSecretsManagerArgs:
         project_name,
         db_username,
         db_password_result,
-        address
+        address,
+        reader_address=None,
+        cache_address=None,
+        credentials=False,
     ):
 
         self.billing_code = billing_code
@@ -139,6 +152,9 @@ class DBSecretsManagerArgs:
         self.db_username = db_username
         self.db_password_result = db_password_result
         self.address = address
+        self.reader_address = reader_address or address
+        self.cache_address = cache_address
+        self.credentials = credentials
 
 
 class DBSecretsManager(ComponentResource):
@@ -202,4 +218,80 @@ class DBSecretsManager(ComponentResource):
             opts=ResourceOptions(parent=self.db_address_secret),
         )
 
-        self.register_outputs({})
+        self.db_reader_address_secret = aws.secretsmanager.Secret(
+            f"{args.project_name}_dbSecret_reader_address",
+            tags={
+                "BillingCode": args.billing_code,
+                "Name": f"{args.project_name}_dbSecret_reader_address",
+                "Project": args.project_name,
+            },
+            opts=ResourceOptions(parent=self),
+        )
+
+        db_reader_address_secret = aws.secretsmanager.SecretVersion(
+            f"{args.project_name}_dbSecret_reader_address",
+            secret_id=self.db_reader_address_secret.id,
+            secret_string=args.reader_address,
+            opts=ResourceOptions(parent=self.db_reader_address_secret),
+        )
+
+        # RDS Proxy reads username and password from one JSON secret,
+        # it is created only for the proxy
+        self.db_credentials_secret = None
+        if args.credentials:
+            self.db_credentials_secret = aws.secretsmanager.Secret(
+                f"{args.project_name}_dbSecret_credentials",
+                tags={
+                    "BillingCode": args.billing_code,
+                    "Name": f"{args.project_name}_dbSecret_credentials",
+                    "Project": args.project_name,
+                },
+                opts=ResourceOptions(parent=self),
+            )
+
+            db_credentials_secret = aws.secretsmanager.SecretVersion(
+                f"{args.project_name}_dbSecret_credentials",
+                secret_id=self.db_credentials_secret.id,
+                secret_string=Output.all(
+                    args.db_username,
+                    args.db_password_result,
+                    ).apply(
+                    lambda arg: json.dumps(
+                        {
+                            "username": arg[0],
+                            "password": arg[1]
+                        }
+                    )
+                ),
+                opts=ResourceOptions(parent=self.db_credentials_secret),
+            )
+
+        self.db_cache_address_secret = None
+        if args.cache_address:
+            self.db_cache_address_secret = aws.secretsmanager.Secret(
+                f"{args.project_name}_dbSecret_cache_address",
+                tags={
+                    "BillingCode": args.billing_code,
+                    "Name": f"{args.project_name}_dbSecret_cache_address",
+                    "Project": args.project_name,
+                },
+                opts=ResourceOptions(parent=self),
+            )
+
+            db_cache_address_secret = aws.secretsmanager.SecretVersion(
+                f"{args.project_name}_dbSecret_cache_address",
+                secret_id=self.db_cache_address_secret.id,
+                secret_string=args.cache_address,
+                opts=ResourceOptions(parent=self.db_cache_address_secret),
+            )
+
+        outputs = {}
+        if self.db_credentials_secret:
+            outputs["db_credentials_secret_arn"] = self.db_credentials_secret.arn
+        self.register_outputs({
+            **outputs,
+            "db_username_secret_arn": self.db_username_secret.arn,
+            "db_password_secret_arn": self.db_password_secret.arn,
+            "db_address_secret_arn": self.db_address_secret.arn,
+            "db_reader_address_secret_arn": self.db_reader_address_secret.arn,
+        })
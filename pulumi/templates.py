@@ -0,0 +1,94 @@
+from email.charset import Charset
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+import pulumi
+import base64
+import gzip
+import hashlib
+import os
+
+CACHE_DIR = ".template_cache"
+
+# EC2 limit of user data size, it is checked before base64 encoding
+USER_DATA_LIMIT = 16 * 1024
+# Size of user data, which is reported as warning
+USER_DATA_WARNING = int(USER_DATA_LIMIT * 0.8)
+
+_environment = None
+
+
+def environment():
+    """This function returns jinja2 Environment shared by all renders
+       of the program. Templates are loaded from the working directory
+       once, and their compiled bytecode is cached in CACHE_DIR, so
+       next runs of the program don't parse templates again"""
+
+    global _environment
+    if _environment is None:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        _environment = Environment(
+            loader=FileSystemLoader("."),
+            bytecode_cache=FileSystemBytecodeCache(CACHE_DIR),
+        )
+    return _environment
+
+
+def render(name, **variables):
+    """This function renders the template file with variables"""
+
+    return environment().get_template(name).render(**variables)
+
+
+def _multipart(script):
+    """This function wraps the script in cloud-init multipart message.
+       Boundary is taken from the script, so the same script always
+       gives the same user data and doesn't replace the instance"""
+
+    boundary = hashlib.sha256(script.encode()).hexdigest()[:32]
+    message = MIMEMultipart(boundary=f"=={boundary}==")
+    # Script is not base64-encoded in the message, it compresses better
+    charset = Charset("utf-8")
+    charset.body_encoding = None
+    part = MIMEText(script, "x-shellscript", charset)
+    part.add_header("Content-Disposition", "attachment", filename="bootstrap.sh")
+    message.attach(part)
+    return message.as_bytes()
+
+
+def user_data(script, compress=False, resource_name="user_data"):
+    """This function returns (user_data, user_data_base64) arguments of
+       EC2 instance for the rendered script, only one of them is set.
+       With compress the script is sent as gzip-compressed cloud-init
+       multipart message. Size of the user data is logged and it is
+       checked against the EC2 limit, ValueError is raised over it"""
+
+    if compress:
+        data = gzip.compress(_multipart(script), mtime=0)
+        result = (None, base64.b64encode(data).decode())
+    else:
+        data = script.encode()
+        result = (script, None)
+
+    size = len(data)
+    report = (f"{resource_name}: {size / 1024:.1f} KB of "
+              f"{USER_DATA_LIMIT // 1024} KB limit")
+    if compress:
+        report += f", {len(script.encode()) / 1024:.1f} KB uncompressed"
+    if size > USER_DATA_LIMIT:
+        # Script is rendered inside Output.apply, SystemExit there aborts
+        # the engine, an exception is reported as error of the resource
+        raise ValueError(f"{report}, compress it or make it smaller")
+    if size > USER_DATA_WARNING:
+        pulumi.log.warn(report)
+    else:
+        pulumi.log.info(report)
+    return result
+
+
+def user_data_base64(script, compress=False, resource_name="user_data"):
+    """This function returns base64-encoded user data for the rendered
+       script, as launch templates expect it"""
+
+    data, data_base64 = user_data(script, compress, resource_name)
+    return data_base64 or base64.b64encode(data.encode()).decode()
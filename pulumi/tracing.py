@@ -0,0 +1,167 @@
+from pulumi import ComponentResource, Output
+import pulumi
+import pulumi.resource
+import asyncio
+import atexit
+import contextlib
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+
+TRACE_ENV = "PROGRAM_TRACE"
+
+_events = []
+_lock = threading.Lock()
+_ids = itertools.count(1)
+_start = time.perf_counter()
+_enabled = False
+
+
+def _now():
+    """This function returns time since program start in microseconds,
+       as Chrome trace-event format expects"""
+
+    return (time.perf_counter() - _start) * 1e6
+
+
+def _emit(**event):
+    event.setdefault("pid", os.getpid())
+    event.setdefault("tid", threading.get_ident())
+    with _lock:
+        _events.append(event)
+
+
+@contextlib.contextmanager
+def span(name, category="program", **args):
+    """This context manager records a complete event of the block,
+       it does nothing when tracing is not enabled"""
+
+    if not _enabled:
+        yield
+        return
+    started = _now()
+    try:
+        yield
+    finally:
+        _emit(name=name, cat=category, ph="X", ts=started,
+              dur=_now() - started, args=args)
+
+
+def _trace_component(cls):
+    """This function wraps __init__ of a ComponentResource subclass
+       of this project, so construction of every component is a span"""
+
+    init = cls.__dict__.get("__init__")
+    if init is None or cls.__module__.startswith("pulumi") \
+            or getattr(init, "traced", False):
+        return
+
+    @functools.wraps(init)
+    def __init__(self, name, *args, **kwargs):
+        with span(f"{cls.__name__}({name})", "component", module=cls.__module__):
+            init(self, name, *args, **kwargs)
+
+    __init__.traced = True
+    cls.__init__ = __init__
+
+
+def _subclasses(cls):
+    for subclass in cls.__subclasses__():
+        yield subclass
+        yield from _subclasses(subclass)
+
+
+def _trace_register_resource():
+    register_resource = pulumi.resource.register_resource
+
+    def traced(res, ty, name, custom, *args, **kwargs):
+        event_id = next(_ids)
+        _emit(name=f"{ty}::{name}", cat="rpc", ph="b", id=event_id, ts=_now())
+        with span(f"register {ty}::{name}", "register_resource"):
+            register_resource(res, ty, name, custom, *args, **kwargs)
+
+        def registered(task):
+            if not task.cancelled():
+                # Retrieve the exception, the program reports it anyway
+                task.exception()
+            _emit(name=f"{ty}::{name}", cat="rpc", ph="e", id=event_id, ts=_now())
+
+        asyncio.ensure_future(res.urn.future()).add_done_callback(registered)
+
+    pulumi.resource.register_resource = traced
+
+
+def _trace_invoke():
+    invoke = pulumi.runtime.invoke
+
+    def traced(tok, *args, **kwargs):
+        with span(f"invoke {tok}", "invoke"):
+            return invoke(tok, *args, **kwargs)
+
+    pulumi.runtime.invoke = traced
+
+
+def _trace_apply():
+    apply = Output.apply
+
+    def traced(output, func, run_with_unknowns=False):
+        module = getattr(func, "__module__", None) or "pulumi"
+        if not module.startswith("pulumi"):
+            code = getattr(func, "__code__", None)
+            where = f"{module}:{code.co_firstlineno}" if code else module
+            wrapped = func
+
+            def func(value):
+                with span(f"apply {where}", "apply"):
+                    return wrapped(value)
+        return apply(output, func, run_with_unknowns)
+
+    Output.apply = traced
+
+
+def write(path):
+    """This function writes collected events to the file
+       in Chrome trace-event JSON format"""
+
+    with _lock:
+        events = list(_events)
+    names = {
+        thread.ident: thread.name for thread in threading.enumerate()}
+    for tid in {event["tid"] for event in events}:
+        events.append({
+            "name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid,
+            "args": {"name": names.get(tid, f"thread-{tid}")},
+        })
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+def enable(path):
+    """This function enables tracing of the program: construction of
+       every ComponentResource of this project, resource registrations,
+       invokes and apply callbacks. The trace is written to the path
+       when the program exits"""
+
+    global _enabled
+    if _enabled:
+        return
+    _enabled = True
+
+    for cls in _subclasses(ComponentResource):
+        _trace_component(cls)
+    ComponentResource.__init_subclass__ = classmethod(_trace_component)
+    _trace_register_resource()
+    _trace_invoke()
+    _trace_apply()
+    atexit.register(write, path)
+
+
+def enable_from_env():
+    """This function enables tracing if PROGRAM_TRACE environment
+       variable is set to path of the trace file"""
+
+    if os.environ.get(TRACE_ENV):
+        enable(os.environ[TRACE_ENV])
@@ -12,7 +12,9 @@ class VpcEndpointsArgs:
        - vpc_id - id of VPC in which you want to allocate EC2
        - ec2_security_group_id - id of EC2 security group for EC2
        - ec2_instance_subnet_id - id of subnet in which you allocated EC2
-       - aws_public_route_table_id - id of public route table"""
+       - aws_public_route_table_id - id of public route table
+       - logs_endpoint - create endpoint of CloudWatch Logs, Fargate
+         tasks send logs through it"""
 
     def __init__(
         self,
@@ -22,6 +24,7 @@ class VpcEndpointsArgs:
         ec2_security_group_id,
         ec2_instance_subnet_id,
         aws_public_route_table_id,
+        logs_endpoint=False,
     ):
 
         self.region = region
@@ -30,6 +33,7 @@ class VpcEndpointsArgs:
         self.ec2_security_group_id = ec2_security_group_id
         self.ec2_instance_subnet_id = ec2_instance_subnet_id
         self.aws_public_route_table_id = aws_public_route_table_id
+        self.logs_endpoint = logs_endpoint
 
 
 class VpcEndpoints(ComponentResource):
@@ -90,6 +94,19 @@ class VpcEndpoints(ComponentResource):
             opts=ResourceOptions(parent=self),
         )
 
+        # Fargate tasks without public IP send awslogs through it
+        if args.logs_endpoint:
+            aws.ec2.VpcEndpoint(
+                "logsEndpoint",
+                vpc_id=args.vpc_id,
+                service_name=f"com.amazonaws.{args.region}.logs",
+                vpc_endpoint_type="Interface",
+                security_group_ids=[args.ec2_security_group_id],
+                subnet_ids=[args.ec2_instance_subnet_id],
+                private_dns_enabled=True,
+                opts=ResourceOptions(parent=self),
+            )
+
         self.s3_endpoint = aws.ec2.VpcEndpoint(
             "s3Endpoint",
             vpc_id=args.vpc_id,
@@ -116,9 +133,10 @@ class VpcEndpoints(ComponentResource):
                             "Principal": "*",
                             "Action": ["s3:GetObject", "s3:PutObject"],
                             "Effect": "Allow",
+                            # Bucket of ECR image layers of the region
                             "Resource": [
                                 "arn:aws:s3:::prod-"
-                                + args.project_name
+                                + args.region
                                 + "-starport-layer-bucket/*"
                             ],
                         },
@@ -154,4 +172,6 @@ class VpcEndpoints(ComponentResource):
             opts=ResourceOptions(parent=self),
         )
 
-        self.register_outputs({})
+        self.register_outputs({
+            "s3_endpoint_id": self.s3_endpoint.id,
+        })
@@ -0,0 +1,314 @@
+from pulumi import ComponentResource, ResourceOptions, Output
+import pulumi_aws as aws
+import json
+import cache
+import templates
+
+REDIS_PORT = 6379
+# Celery queue of Airflow tasks, workers are scaled on its length
+CELERY_QUEUE = "default"
+
+
+class WorkersArgs:
+    """Create class WorkersArgs for conveniently passing arguments to the class Workers
+       These arguments are used to create broker and Auto Scaling group
+       of Airflow Celery workers:
+       - region - specify region in which you want create
+       - billing_code - billing code
+       - project_name_underscores - modified project name
+       - name_suffix - random suffix that is added to all unique resources
+       - vpc_id - id of VPC in which you want to allocate workers
+       - ec2_subnet_id - id of subnet in which you want to allocate workers
+       - broker_subnet_ids - ids of subnets for ElastiCache broker
+       - ec2_security_group_id - id of EC2 security group, it is reused
+         by workers
+       - db_address - address of RDS database, the metadata backend
+       - db_username - username for database
+       - db_password_secret_arn - ARN of secret with database password
+       - worker_count - number of workers when the queue is empty
+       - worker_max_count - maximum number of workers
+       - worker_instance_type - type of worker EC2 instances
+       - repo_deploy_key - private SSH key of the DAGs repository
+       - golden_ami - entry of golden AMI catalog, workers are created
+         only from golden AMI, as the stock Airflow server doesn't
+         switch to CeleryExecutor
+       - worker_concurrency - number of tasks one worker runs at once
+       - broker_node_type - node type of ElastiCache Redis broker
+       - queue_metric_namespace - CloudWatch namespace of queue depth metric
+       - queue_metric_name - CloudWatch name of queue depth metric, workers
+         publish length of the broker queue to it every minute
+       - db_name - name of Airflow metadata database"""
+
+    def __init__(
+        self,
+        region,
+        billing_code,
+        project_name_underscores,
+        name_suffix,
+        vpc_id,
+        ec2_subnet_id,
+        broker_subnet_ids,
+        ec2_security_group_id,
+        db_address,
+        db_username,
+        db_password_secret_arn,
+        worker_count,
+        worker_max_count,
+        worker_instance_type,
+        repo_deploy_key,
+        golden_ami,
+        worker_concurrency=16,
+        broker_node_type="cache.t3.micro",
+        queue_metric_namespace="Airflow",
+        queue_metric_name="celery.queued_tasks",
+        db_name="airflow",
+    ):
+
+        self.region = region
+        self.billing_code = billing_code
+        self.project_name_underscores = project_name_underscores
+        self.name_suffix = name_suffix
+        self.vpc_id = vpc_id
+        self.ec2_subnet_id = ec2_subnet_id
+        self.broker_subnet_ids = broker_subnet_ids
+        self.ec2_security_group_id = ec2_security_group_id
+        self.db_address = db_address
+        self.db_username = db_username
+        self.db_password_secret_arn = db_password_secret_arn
+        self.worker_count = worker_count
+        self.worker_max_count = worker_max_count
+        self.worker_instance_type = worker_instance_type
+        self.repo_deploy_key = repo_deploy_key
+        self.worker_concurrency = worker_concurrency
+        self.broker_node_type = broker_node_type
+        self.golden_ami = golden_ami
+        self.queue_metric_namespace = queue_metric_namespace
+        self.queue_metric_name = queue_metric_name
+        self.db_name = db_name
+
+
+class Workers(ComponentResource):
+    """Create class Workers which extends class ComponentResource"""
+
+    def __init__(self, name: str, args: WorkersArgs, opts: ResourceOptions = None):
+        """Create constructor of class Workers
+           This constructor creates ElastiCache Redis broker, launch
+           template and Auto Scaling group of Airflow Celery workers,
+           which scales out when tasks are waiting in the queue
+           and scales in when the queue is empty"""
+        super().__init__("custom:resource:Workers", name, {}, opts)
+        """Override ComponentResource class constructor"""
+
+        if not args.golden_ami:
+            raise SystemExit("Error: Airflow workers need golden_ami, Airflow "
+                             "server of stock AMI doesn't run CeleryExecutor")
+
+        tags = {
+            "BillingCode": args.billing_code,
+            "Project": args.project_name_underscores,
+        }
+        broker_name = Output.all(
+            args.project_name_underscores,
+            args.name_suffix
+            ).apply(
+            lambda arg: cache.resource_name(arg[0], arg[1], "broker"))
+
+        broker_security_group = aws.ec2.SecurityGroup(
+            "brokerSecurityGroup",
+            description="Access to Celery broker from Airflow instances",
+            vpc_id=args.vpc_id,
+            ingress=[{
+                "protocol": "tcp",
+                "from_port": REDIS_PORT,
+                "to_port": REDIS_PORT,
+                "security_groups": [args.ec2_security_group_id],
+            }],
+            tags={
+                **tags,
+                "Name": f"{args.project_name_underscores}_broker",
+            },
+            opts=ResourceOptions(parent=self),
+        )
+
+        broker_subnet_group = aws.elasticache.SubnetGroup(
+            "brokerSubnetGroup",
+            name=broker_name,
+            subnet_ids=args.broker_subnet_ids,
+            opts=ResourceOptions(parent=self),
+        )
+
+        self.broker = aws.elasticache.Cluster(
+            "broker",
+            cluster_id=broker_name,
+            engine="redis",
+            engine_version="6.x",
+            parameter_group_name="default.redis6.x",
+            node_type=args.broker_node_type,
+            num_cache_nodes=1,
+            port=REDIS_PORT,
+            subnet_group_name=broker_subnet_group.name,
+            security_group_ids=[broker_security_group.id],
+            tags={
+                **tags,
+                "Name": f"{args.project_name_underscores}_broker",
+            },
+            opts=ResourceOptions(parent=self),
+        )
+        self.broker_url = self.broker.cache_nodes.apply(
+            lambda nodes: f"redis://{nodes[0]['address']}:{REDIS_PORT}/0")
+
+        # Workers have their own role, they read only database password
+        # and publish length of the queue
+        self.role = aws.iam.Role(
+            "workerRole",
+            assume_role_policy=json.dumps({
+                "Version": "2012-10-17",
+                "Statement": [{
+                    "Action": "sts:AssumeRole",
+                    "Principal": {"Service": "ec2.amazonaws.com"},
+                    "Effect": "Allow",
+                }],
+            }),
+            tags=tags,
+            opts=ResourceOptions(parent=self),
+        )
+        aws.iam.RolePolicy(
+            "workerRolePolicy",
+            role=self.role.id,
+            policy=Output.from_input(args.db_password_secret_arn).apply(
+                lambda arn: json.dumps({
+                    "Version": "2012-10-17",
+                    "Statement": [
+                        {
+                            "Effect": "Allow",
+                            "Action": ["secretsmanager:GetSecretValue"],
+                            "Resource": [arn],
+                        },
+                        {
+                            "Effect": "Allow",
+                            "Action": ["cloudwatch:PutMetricData"],
+                            "Resource": "*",
+                            "Condition": {"StringEquals": {
+                                "cloudwatch:namespace": args.queue_metric_namespace,
+                            }},
+                        },
+                    ],
+                })),
+            opts=ResourceOptions(parent=self),
+        )
+        self.instance_profile = aws.iam.InstanceProfile(
+            "workerInstanceProfile",
+            role=self.role.name,
+            opts=ResourceOptions(parent=self),
+        )
+
+        manifest = args.golden_ami["manifest"]
+        user_data = Output.all(
+            self.broker_url,
+            args.db_address,
+            args.db_username,
+            args.db_password_secret_arn,
+            args.db_name,
+            ).apply(
+            lambda arg: templates.user_data_base64(
+                templates.render(
+                    "bootstrap_worker.tpl",
+                    manifest=manifest,
+                    region=args.region,
+                    project_name_underscores=args.project_name_underscores,
+                    repo_name=f"{args.project_name_underscores}_airflow_pipeline",
+                    deploy_key=args.repo_deploy_key,
+                    broker_url=arg[0],
+                    db_address=arg[1],
+                    db_username=arg[2],
+                    db_password_secret_arn=arg[3],
+                    db_name=arg[4],
+                    worker_concurrency=args.worker_concurrency,
+                    queue_metric_namespace=args.queue_metric_namespace,
+                    queue_metric_name=args.queue_metric_name,
+                    celery_queue=CELERY_QUEUE,
+                ),
+                resource_name=f"{name} user data",
+            )
+        )
+
+        self.launch_template = aws.ec2.LaunchTemplate(
+            "workerLaunchTemplate",
+            name_prefix=f"{args.project_name_underscores}_airflow_worker_",
+            image_id=args.golden_ami["id"],
+            instance_type=args.worker_instance_type,
+            iam_instance_profile={"name": self.instance_profile.name},
+            network_interfaces=[{
+                "associate_public_ip_address": "true",
+                "security_groups": [args.ec2_security_group_id],
+            }],
+            user_data=user_data,
+            tag_specifications=[{
+                "resource_type": "instance",
+                "tags": {
+                    **tags,
+                    "Name": f"{args.project_name_underscores}_airflow_worker",
+                },
+            }],
+            opts=ResourceOptions(parent=self),
+        )
+
+        self.group = aws.autoscaling.Group(
+            "workerGroup",
+            min_size=args.worker_count,
+            max_size=args.worker_max_count,
+            desired_capacity=args.worker_count,
+            vpc_zone_identifiers=[args.ec2_subnet_id],
+            launch_template={
+                "id": self.launch_template.id,
+                "version": self.launch_template.latest_version.apply(str),
+            },
+            # Running tasks are retried by Airflow, so workers are
+            # replaced at once when launch template changes
+            instance_refresh={"strategy": "Rolling"},
+            tags=[
+                {"key": key, "value": value, "propagate_at_launch": True}
+                for key, value in tags.items()
+            ],
+            opts=ResourceOptions(
+                parent=self,
+                # Scaling policies change desired capacity
+                ignore_changes=["desired_capacity"],
+            ),
+        )
+
+        queue_alarms = {
+            # (adjustment, comparison, threshold, evaluation periods)
+            "scaleOut": (1, "GreaterThanThreshold", args.worker_concurrency, 2),
+            "scaleIn": (-1, "LessThanOrEqualToThreshold", 0, 15),
+        }
+        for alarm_name, (adjustment, comparison, threshold, periods) in \
+                queue_alarms.items():
+            policy = aws.autoscaling.Policy(
+                f"{alarm_name}Policy",
+                autoscaling_group_name=self.group.name,
+                adjustment_type="ChangeInCapacity",
+                scaling_adjustment=adjustment,
+                cooldown=300,
+                opts=ResourceOptions(parent=self),
+            )
+            aws.cloudwatch.MetricAlarm(
+                f"{alarm_name}Alarm",
+                namespace=args.queue_metric_namespace,
+                metric_name=args.queue_metric_name,
+                statistic="Average",
+                period=60,
+                evaluation_periods=periods,
+                comparison_operator=comparison,
+                threshold=threshold,
+                dimensions={"Project": args.project_name_underscores},
+                treat_missing_data="notBreaching",
+                alarm_actions=[policy.arn],
+                opts=ResourceOptions(parent=self),
+            )
+
+        self.register_outputs({
+            "broker_url": self.broker_url,
+            "worker_group_name": self.group.name,
+            "worker_role_arn": self.role.arn,
+        })